@@ -0,0 +1,472 @@
+"""
+Entrée ASGI asyncio, alternative à wsgi.py
+
+Les appels Zammad (httpx) et SMTP (aiosmtplib) sont asynchrones ; seul le rendu
+ReportLab est déporté dans un pool de threads (ou de process, voir
+PDF_RENDER_PROCESSES). Exemple avec uvicorn :
+    uvicorn --workers 2 --host 0.0.0.0 --port 8080 asgi:application
+"""
+
+import asyncio
+import base64
+import binascii
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from auth import AUTH_REJECTIONS, auth_limiter, check_auth, verify_signature
+from services import metrics, startup
+from services.async_email import AsyncEmailService
+from services.async_zammad import AsyncZammadService
+from services.batch import BatchStore, parse_batch_request, start_batch
+from services.coalesce import coalescer_metrics
+from services.email import EmailService, ticket_link
+from services.outbound import (
+    OutboundScheduler,
+    create_outbound_scheduler,
+    render_dead_letters,
+)
+from services.pdf_cache import create_pdf_cache
+from services.webhook import generation_requested, may_request_generation
+from services.zammad import ZammadService
+
+
+class _BodyTooLarge(Exception):
+    """Corps de requête plus grand que WEBHOOK_MAX_BYTES"""
+
+
+async def _read_body(scope, receive) -> bytes:
+    """Lit le corps de la requête, au plus WEBHOOK_MAX_BYTES"""
+    limit = Config.WEBHOOK_MAX_BYTES
+    if limit > 0:
+        length = _header(scope, b"content-length")
+        if length and length.isdigit() and int(length) > limit:
+            raise _BodyTooLarge()
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if limit > 0 and size > limit:
+            raise _BodyTooLarge()
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _send_json(send, status: int, data: dict, headers: list | None = None):
+    body = json.dumps(data).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                *(headers or []),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+def _basic_auth(scope) -> tuple[str, str] | None:
+    value = _header(scope, b"authorization")
+    if value is None:
+        return None
+    scheme, _, encoded = value.partition(" ")
+    if scheme.lower() != "basic":
+        return None
+    try:
+        decoded = base64.b64decode(encoded).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    username, _, password = decoded.partition(":")
+    return username, password
+
+
+def _header(scope, header: bytes) -> str | None:
+    for name, value in scope["headers"]:
+        if name == header:
+            return value.decode("latin-1")
+    return None
+
+
+def _client(scope) -> str | None:
+    """
+    Adresse du client ; derrière TRUSTED_PROXY_COUNT proxies, lue dans
+    X-Forwarded-For comme le fait ProxyFix pour l'application Flask
+    """
+    client = scope["client"][0] if scope.get("client") else None
+    if Config.TRUSTED_PROXY_COUNT > 0:
+        forwarded = [
+            value.strip()
+            for value in (_header(scope, b"x-forwarded-for") or "").split(",")
+            if value.strip()
+        ]
+        if len(forwarded) >= Config.TRUSTED_PROXY_COUNT:
+            client = forwarded[-Config.TRUSTED_PROXY_COUNT]
+    return client
+
+
+async def _authorize(scope, send) -> bool:
+    """Même contrôle que @requires_auth ; envoie la réponse 429 ou 401 si refusé"""
+    credentials = _basic_auth(scope)
+    if not credentials or not check_auth(*credentials):
+        client = _client(scope)
+        retry_after = auth_limiter.retry_after(client)
+        if retry_after:
+            AUTH_REJECTIONS.inc(reason="rate_limited")
+            await _send_json(
+                send,
+                429,
+                {"error": "Trop d'échecs d'authentification, réessayez plus tard"},
+                [(b"retry-after", str(retry_after).encode())],
+            )
+            return False
+        auth_limiter.record(client)
+        AUTH_REJECTIONS.inc(reason="credentials")
+        await _send_json(send, 401, {"error": "Authentication required"})
+        return False
+    return True
+
+
+class WebhookApplication:
+    """Application ASGI exposant POST /webhook"""
+
+    def __init__(self):
+        self.zammad_service: AsyncZammadService | None = None
+        self.email_service: AsyncEmailService | None = None
+        self.pdf_cache = create_pdf_cache()
+        self.executor = ThreadPoolExecutor(
+            max_workers=Config.JOB_WORKERS, thread_name_prefix="render"
+        )
+        # Tickets en attente ou en cours de traitement (regroupement des rafales)
+        self._tickets: dict[int, dict] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.stats = {"received": 0, "coalesced": 0, "dispatched": 0}
+        metrics.register_collector(
+            lambda: coalescer_metrics(self.stats, len(self._tickets))
+        )
+        # Les lots tournent dans des threads avec les clients synchrones
+        self.batch_store = BatchStore(Config.BATCH_DIR)
+        self.batch_zammad: ZammadService | None = None
+        self.batch_email: EmailService | None = None
+        # Ordonnanceur des écritures Zammad (les appels asyncio y passent aussi)
+        self.outbound: OutboundScheduler | None = None
+
+    def _ensure_started(self):
+        if self.zammad_service is None:
+            self.zammad_service = AsyncZammadService()
+            self.email_service = AsyncEmailService()
+            self.batch_zammad = ZammadService()
+            self.outbound = create_outbound_scheduler(self.batch_zammad)
+
+    async def _shutdown(self):
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=30)
+        if self.zammad_service is not None:
+            await self.zammad_service.aclose()
+            await self.email_service.aclose()
+        self.executor.shutdown(wait=False)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    try:
+                        Config.validate()
+                    except ValueError as e:
+                        await send(
+                            {
+                                "type": "lifespan.startup.failed",
+                                "message": f"Erreur de configuration: {e}",
+                            }
+                        )
+                        return
+                    self._ensure_started()
+                    warm_up_seconds = None
+                    if Config.STARTUP_WARMUP:
+                        # uvicorn n'accepte les connexions qu'après cette étape
+                        warm_up_seconds = await asyncio.to_thread(startup.warm_up)
+                    startup.report("worker", warm_up_seconds)
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await self._shutdown()
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+
+        if scope["type"] != "http":
+            return
+
+        self._ensure_started()
+        if scope["path"] == "/webhook" and scope["method"] == "POST":
+            await self.webhook(scope, receive, send)
+        elif scope["path"] == "/batch" and scope["method"] == "POST":
+            await self.batch(scope, receive, send)
+        elif scope["path"].startswith("/batch/") and scope["method"] == "GET":
+            await self.batch_status(scope, send)
+        elif scope["path"] == "/metrics" and scope["method"] == "GET":
+            await self.metrics(scope, send)
+        else:
+            await _send_json(send, 404, {"error": "Not found"})
+
+    async def batch(self, scope, receive, send):
+        """Lance la régénération des PDFs d'un lot de tickets"""
+        if not await _authorize(scope, send):
+            return
+
+        try:
+            data = json.loads(await _read_body(scope, receive) or b"null")
+        except _BodyTooLarge:
+            await _send_json(send, 413, {"error": "Requête trop volumineuse"})
+            return
+        except ValueError:
+            data = None
+        success, arguments = parse_batch_request(data)
+        if not success:
+            await _send_json(send, 400, arguments)
+            return
+
+        if self.batch_email is None:
+            self.batch_email = EmailService()
+        batch_run = start_batch(
+            self.batch_zammad,
+            self.batch_store,
+            pdf_cache=self.pdf_cache,
+            email_service=self.batch_email,
+            outbound=self.outbound,
+            **arguments,
+        )
+        await _send_json(
+            send, 202, {"id": batch_run.id, "status_url": f"/batch/{batch_run.id}"}
+        )
+
+    async def batch_status(self, scope, send):
+        """Avancement et résultats par ticket d'un lot"""
+        if not await _authorize(scope, send):
+            return
+
+        summary = self.batch_store.load(scope["path"].removeprefix("/batch/"))
+        if summary is None:
+            await _send_json(send, 404, {"error": "Lot inconnu"})
+            return
+        await _send_json(send, 200, summary)
+
+    async def metrics(self, scope, send):
+        """Métriques Prometheus agrégées de tous les workers"""
+        if not await _authorize(scope, send):
+            return
+
+        body = await asyncio.to_thread(
+            lambda: metrics.render() + render_dead_letters(self.outbound.dead_letters)
+        )
+        body = body.encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/plain; version=0.0.4"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    async def _ignored(self, send):
+        """Réponse à un webhook sans génération de PDF demandée (aucune tâche créée)"""
+        metrics.WEBHOOKS.inc(result="filtered")
+        await _send_json(
+            send, 200, {"status": "ignored", "message": "Génération PDF non demandée"}
+        )
+
+    async def webhook(self, scope, receive, send):
+        """Endpoint webhook pour traiter les données Zammad et générer un PDF"""
+        if not await _authorize(scope, send):
+            return
+
+        try:
+            body = await _read_body(scope, receive)
+        except _BodyTooLarge:
+            metrics.WEBHOOKS.inc(result="too_large")
+            await _send_json(send, 413, {"error": "Requête trop volumineuse"})
+            return
+        if not verify_signature(body, _header(scope, b"x-hub-signature")):
+            auth_limiter.record(_client(scope))
+            AUTH_REJECTIONS.inc(reason="signature")
+            await _send_json(send, 401, {"error": "Signature invalide"})
+            return
+
+        # Les mises à jour sans génération demandée sont écartées avant le parsing
+        if not may_request_generation(body):
+            await self._ignored(send)
+            return
+
+        try:
+            data = json.loads(body or b"null")
+        except ValueError:
+            data = None
+        if not data or not isinstance(data, dict):
+            metrics.WEBHOOKS.inc(result="invalid")
+            await _send_json(send, 400, {"error": "No JSON received"})
+            return
+
+        ticket = data.get("ticket", {})
+        ticket_id = ticket.get("id")
+        if not ticket_id:
+            metrics.WEBHOOKS.inc(result="invalid")
+            await _send_json(send, 400, {"error": "ticket_id manquant"})
+            return
+
+        if not generation_requested(ticket.get("pdf_generation")):
+            await self._ignored(send)
+            return
+
+        self.stats["received"] += 1
+        entry = self._tickets.get(ticket_id)
+        if entry is not None:
+            entry["payload"] = ticket
+            if entry["running"]:
+                entry["rerun"] = True
+            self.stats["coalesced"] += 1
+            metrics.WEBHOOKS.inc(result="coalesced")
+            await _send_json(
+                send,
+                202,
+                {
+                    "status": "coalesced",
+                    "message": "Traitement déjà prévu pour ce ticket",
+                },
+            )
+            return
+
+        if Config.JOB_QUEUE_SIZE > 0 and len(self._tickets) >= Config.JOB_QUEUE_SIZE:
+            metrics.WEBHOOKS.inc(result="queue_full")
+            await _send_json(
+                send,
+                503,
+                {"error": "File de traitement pleine, réessayez plus tard"},
+                [(b"retry-after", b"30")],
+            )
+            return
+
+        metrics.WEBHOOKS.inc(result="accepted")
+        self._tickets[ticket_id] = {"payload": ticket, "running": False, "rerun": False}
+        task = asyncio.create_task(self._run(ticket_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        await _send_json(
+            send,
+            202,
+            {"status": "accepted", "message": "Traitement démarré en arrière-plan"},
+        )
+
+    async def _run(self, ticket_id: int):
+        entry = self._tickets[ticket_id]
+        try:
+            while True:
+                await asyncio.sleep(Config.WEBHOOK_DEBOUNCE_SECONDS)
+                entry["running"] = True
+                self.stats["dispatched"] += 1
+                await self.background_job(entry["payload"])
+                if not entry["rerun"]:
+                    return
+                entry["running"] = False
+                entry["rerun"] = False
+        finally:
+            del self._tickets[ticket_id]
+
+    async def background_job(self, ticket: dict):
+        """Génère le PDF d'un ticket, l'envoie dans Zammad et par email si demandé"""
+        ticket_id = ticket.get("id")
+        ticket_number = ticket.get("number", "N/A")
+        pdf_generation_value = ticket.get("pdf_generation")
+        if not generation_requested(pdf_generation_value):
+            metrics.JOBS.inc(result="skipped")
+            return
+
+        # Import différé : ReportLab est déjà chargé par le préchauffage, sinon
+        # au premier job
+        from services.pdf import PDFGenerator  # pylint: disable=import-outside-toplevel
+
+        stage = "set_generation_false"
+        metrics.JOBS_IN_FLIGHT.inc()
+        pdf_generator = PDFGenerator(self.pdf_cache)
+        try:
+            with metrics.STAGE_SECONDS.time(stage=stage):
+                await self.outbound.run_async(
+                    OutboundScheduler.flag_write(ticket_id),
+                    lambda: self.zammad_service.set_ticket_generation_false(ticket_id),
+                )
+
+            stage = "fetch_articles"
+            article_ids, skipped = PDFGenerator.select_article_ids(
+                ticket.get("article_ids", [])
+            )
+            with metrics.STAGE_SECONDS.time(stage=stage):
+                articles = await self.zammad_service.get_ticket_articles(
+                    ticket_id, article_ids
+                )
+
+            # Les étapes images et render sont mesurées par PDFGenerator ; les
+            # images sont téléchargées par le client synchrone, dans le thread
+            stage = "pdf"
+            await asyncio.get_running_loop().run_in_executor(
+                self.executor,
+                pdf_generator.generate_from_articles,
+                ticket,
+                PDFGenerator.plain_articles(articles),
+                skipped,
+                self.batch_zammad,
+            )
+
+            # PDF disponible dans Zammad : l'email peut n'en donner que le lien
+            in_zammad = pdf_generator.unchanged
+            if pdf_generator.unchanged:
+                print(
+                    f"[background] PDF inchangé pour ticket {ticket_number}, envoi ignoré"
+                )
+            else:
+                stage = "upload"
+                with metrics.STAGE_SECONDS.time(stage=stage):
+                    success_z, response_z = await self.outbound.run_async(
+                        OutboundScheduler.upload_write(ticket_number, ticket_id),
+                        lambda: self.zammad_service.send_ticket_pdf(
+                            ticket_number, ticket_id, pdf_generator.pdf_file
+                        ),
+                        pdf_generator.pdf_file,
+                    )
+                in_zammad = success_z
+                if not success_z:
+                    metrics.JOB_FAILURES.inc(stage=stage)
+                    print(
+                        f"[background] Erreur Zammad pour ticket {ticket_number}: {response_z}"
+                    )
+                elif self.pdf_cache:
+                    self.pdf_cache.remember(ticket_id, pdf_generator.fingerprint)
+
+            if pdf_generation_value == "email":
+                stage = "email"
+                with metrics.STAGE_SECONDS.time(stage=stage):
+                    await self.email_service.send_email_with_pdf(
+                        pdf_generator.pdf_file,
+                        filename=f"ticket_{ticket_number}.pdf",
+                        link=ticket_link(ticket_id) if in_zammad else None,
+                    )
+
+            metrics.JOBS.inc(result="done")
+
+        except Exception as e:
+            metrics.JOB_FAILURES.inc(stage=stage)
+            metrics.JOBS.inc(result="failed")
+            print(f"[background] Erreur traitement ticket {ticket_number}: {e}")
+        finally:
+            metrics.JOBS_IN_FLIGHT.dec()
+            pdf_generator.close()
+
+
+application = WebhookApplication()
@@ -1,11 +1,144 @@
+import hashlib
+import hmac
+import threading
+import time
+from functools import lru_cache, wraps
+
 from flask import request, jsonify
-from functools import wraps
 from config import Config
+from services import metrics
+
+AUTH_REJECTIONS = metrics.counter(
+    "zammad_workflows_auth_rejections_total",
+    "Requêtes refusées par l'authentification par motif",
+)
+
+_HASH_PREFIX = "sha256:"
+
+
+def _password_digest(password: str) -> bytes:
+    """Empreinte SHA-256 d'un mot de passe, ou empreinte déjà calculée `sha256:<hex>`"""
+    if password.startswith(_HASH_PREFIX):
+        return bytes.fromhex(password.removeprefix(_HASH_PREFIX))
+    return hashlib.sha256(password.encode("utf-8")).digest()
+
+
+@lru_cache(maxsize=1)
+def _credentials(
+    username: str, password: str, extra: str
+) -> tuple[tuple[bytes, bytes], ...]:
+    """
+    Identifiants acceptés : (utilisateur, empreinte du mot de passe)
+
+    Calculé une fois par valeur de configuration. `extra` (WEBHOOK_CREDENTIALS)
+    contient des paires `utilisateur:mot_de_passe` séparées par des virgules,
+    une par instance Zammad.
+    """
+    pairs = [(username, password)] if username and password else []
+    for entry in extra.split(","):
+        user, _, secret = entry.strip().partition(":")
+        if user and secret:
+            pairs.append((user, secret))
+    return tuple(
+        (user.encode("utf-8"), _password_digest(secret)) for user, secret in pairs
+    )
 
 
 def check_auth(username, password):
-    """Vérifie les identifiants d'authentification"""
-    return username == Config.WEBHOOK_USERNAME and password == Config.WEBHOOK_PASSWORD
+    """Vérifie les identifiants d'authentification (en temps constant)"""
+    supplied_user = (username or "").encode("utf-8")
+    supplied_digest = hashlib.sha256((password or "").encode("utf-8")).digest()
+    valid = False
+    # Toutes les paires sont comparées pour ne pas révéler laquelle correspond
+    for user, digest in _credentials(
+        Config.WEBHOOK_USERNAME, Config.WEBHOOK_PASSWORD, Config.WEBHOOK_CREDENTIALS
+    ):
+        user_ok = hmac.compare_digest(user, supplied_user)
+        password_ok = hmac.compare_digest(digest, supplied_digest)
+        valid |= user_ok & password_ok
+    return valid
+
+
+@lru_cache(maxsize=1)
+def _signature_secrets(secrets: str) -> tuple[bytes, ...]:
+    return tuple(
+        secret.strip().encode("utf-8")
+        for secret in secrets.split(",")
+        if secret.strip()
+    )
+
+
+def verify_signature(body: bytes, header: str | None) -> bool:
+    """
+    Vérifie l'en-tête `X-Hub-Signature` (HMAC du corps) envoyé par Zammad
+
+    Sans WEBHOOK_SIGNATURE_SECRETS, la vérification est désactivée. L'en-tête
+    a la forme `sha1=<hex>` (format de Zammad) ou `sha256=<hex>`.
+    """
+    secrets = _signature_secrets(Config.WEBHOOK_SIGNATURE_SECRETS)
+    if not secrets:
+        return True
+    algorithm, _, signature = (header or "").partition("=")
+    if algorithm not in ("sha1", "sha256") or not signature:
+        return False
+    # Comparaison en octets : compare_digest refuse les str non ASCII
+    supplied = signature.strip().lower().encode("utf-8")
+    valid = False
+    for secret in secrets:
+        expected = hmac.new(secret, body, algorithm).hexdigest().encode("ascii")
+        valid |= hmac.compare_digest(expected, supplied)
+    return valid
+
+
+class FailureLimiter:
+    """
+    Limite les échecs d'authentification par adresse IP
+
+    Après `limit` échecs dans une fenêtre de `window` secondes, les échecs
+    suivants de l'adresse reçoivent 429 jusqu'à la fin de la fenêtre. Les
+    identifiants sont toujours vérifiés d'abord : une requête authentifiée
+    n'est jamais limitée, même si elle partage l'adresse d'un client fautif
+    (reverse proxy sans TRUSTED_PROXY_COUNT).
+    """
+
+    def __init__(self, limit: int, window: float, max_clients: int = 10000):
+        self.limit = limit
+        self.window = window
+        self.max_clients = max_clients
+        # Adresse -> (début de la fenêtre, nombre d'échecs)
+        self._failures: dict[str, tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def retry_after(self, client: str | None) -> int:
+        """Secondes avant la fin du blocage, 0 si le client n'est pas bloqué"""
+        if self.limit <= 0:
+            return 0
+        with self._lock:
+            started, count = self._failures.get(client, (0.0, 0))
+        remaining = started + self.window - time.monotonic()
+        if count < self.limit or remaining <= 0:
+            return 0
+        return max(1, int(remaining + 0.5))
+
+    def record(self, client: str | None):
+        """Enregistre un échec pour ce client"""
+        if self.limit <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            started, count = self._failures.get(client, (now, 0))
+            if now - started > self.window:
+                started, count = now, 0
+            self._failures[client] = (started, count + 1)
+            if len(self._failures) > self.max_clients:
+                self._failures = {
+                    key: value
+                    for key, value in self._failures.items()
+                    if now - value[0] <= self.window
+                }
+
+
+auth_limiter = FailureLimiter(Config.AUTH_FAILURE_LIMIT, Config.AUTH_FAILURE_WINDOW)
 
 
 def authenticate():
@@ -13,6 +146,15 @@ def authenticate():
     return jsonify({"error": "Authentication required"}), 401
 
 
+def too_many_failures(retry_after: int):
+    """Renvoie une réponse 429 après trop d'échecs d'authentification"""
+    return (
+        jsonify({"error": "Trop d'échecs d'authentification, réessayez plus tard"}),
+        429,
+        {"Retry-After": str(retry_after)},
+    )
+
+
 def requires_auth(f):
     """Décorateur pour vérifier l'authentification HTTP Basic"""
 
@@ -20,7 +162,30 @@ def requires_auth(f):
     def decorated(*args, **kwargs):
         auth = request.authorization
         if not auth or not check_auth(auth.username, auth.password):
+            retry_after = auth_limiter.retry_after(request.remote_addr)
+            if retry_after:
+                AUTH_REJECTIONS.inc(reason="rate_limited")
+                return too_many_failures(retry_after)
+            auth_limiter.record(request.remote_addr)
+            AUTH_REJECTIONS.inc(reason="credentials")
             return authenticate()
         return f(*args, **kwargs)
 
     return decorated
+
+
+def requires_signature(f):
+    """Décorateur vérifiant la signature X-Hub-Signature du corps (après @requires_auth)"""
+
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        # get_data() garde le corps en cache pour get_json()
+        if not verify_signature(
+            request.get_data(), request.headers.get("X-Hub-Signature")
+        ):
+            auth_limiter.record(request.remote_addr)
+            AUTH_REJECTIONS.inc(reason="signature")
+            return jsonify({"error": "Signature invalide"}), 401
+        return f(*args, **kwargs)
+
+    return decorated
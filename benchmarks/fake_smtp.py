@@ -0,0 +1,121 @@
+"""
+Serveur SMTP minimal en clair pour les tests locaux et les benchmarks
+
+Accepte toute authentification (AUTH PLAIN/LOGIN) et garde les messages reçus
+en mémoire. Usage autonome :
+    python -m benchmarks.fake_smtp --port 2525
+"""
+
+import argparse
+import socketserver
+import threading
+import time
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self, address=("127.0.0.1", 0), latency: float = 0.0, keep_messages=True
+    ):
+        super().__init__(address, _SMTPHandler)
+        self.latency = latency
+        self.keep_messages = keep_messages
+        self.lock = threading.Lock()
+        self.messages: list[bytes] = []
+        self.stats = {"connections": 0, "logins": 0, "messages": 0, "bytes": 0}
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def record(self, name: str, value: int = 1):
+        with self.lock:
+            self.stats[name] += value
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    server: FakeSMTPServer
+
+    def _reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.server.record("connections")
+        self._reply("220 fake-smtp ESMTP")
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            command = raw.decode(errors="replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if self.server.latency:
+                time.sleep(self.server.latency)
+
+            if verb == "EHLO":
+                self._reply("250-fake-smtp")
+                self._reply("250-AUTH PLAIN LOGIN")
+                self._reply("250 8BITMIME")
+            elif verb == "HELO":
+                self._reply("250 fake-smtp")
+            elif verb == "AUTH":
+                if command.upper().startswith("AUTH LOGIN"):
+                    for _ in range(2 - len(command.split()[2:])):
+                        self._reply("334 VXNlcm5hbWU6")
+                        self.rfile.readline()
+                self.server.record("logins")
+                self._reply("235 2.7.0 Authentication successful")
+            elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                self._read_data()
+                self._reply("250 OK queued")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+    def _read_data(self):
+        lines = []
+        size = 0
+        while True:
+            line = self.rfile.readline()
+            if not line or line == b".\r\n":
+                break
+            if line.startswith(b".."):
+                line = line[1:]
+            size += len(line)
+            if self.server.keep_messages:
+                lines.append(line)
+        with self.server.lock:
+            if self.server.keep_messages:
+                self.server.messages.append(b"".join(lines))
+            self.server.stats["messages"] += 1
+            self.server.stats["bytes"] += size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeSMTPServer((args.host, args.port), latency=args.latency)
+    print(f"Serveur SMTP de test sur {args.host}:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Faux serveur d'API Zammad pour les tests locaux et les benchmarks
+
+Les tickets et leurs articles sont générés à la demande (voir synthetic.py).
+La latence, le nombre d'articles et d'images jointes par ticket, le taux
+d'erreurs 503 et la disponibilité de l'endpoint groupé sont configurables.
+Usage autonome :
+    python -m benchmarks.fake_zammad --port 3000 --latency 0.05 --messages 30
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.synthetic import make_articles, make_image, make_ticket
+
+# Les IDs d'articles encodent le ticket : ticket_id * ARTICLE_ID_FACTOR + rang
+ARTICLE_ID_FACTOR = 100000
+
+_ARTICLE = re.compile(r"^/api/v1/ticket_articles/(\d+)$")
+_ARTICLES_BY_TICKET = re.compile(r"^/api/v1/ticket_articles/by_ticket/(\d+)$")
+_ATTACHMENT = re.compile(r"^/api/v1/ticket_attachment/\d+/\d+/(\d+)$")
+_TICKET = re.compile(r"^/api/v1/tickets/(\d+)$")
+_TICKET_SEARCH = re.compile(r"^/api/v1/tickets/search\b")
+_USER = re.compile(r"^/api/v1/users/(\d+)$")
+
+
+class FakeZammadServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 0),
+        latency: float = 0.0,
+        messages: int = 10,
+        error_rate: float = 0.0,
+        bulk_endpoint: bool = True,
+        seed: int = 0,
+        images: int = 0,
+    ):
+        super().__init__(address, _ZammadHandler)
+        self.latency = latency
+        self.messages = messages
+        self.error_rate = error_rate
+        self.bulk_endpoint = bulk_endpoint
+        self.images = images
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.uploads: dict[int, list[dict]] = {}
+        self.upload_times: dict[int, float] = {}
+        self.uploaded = threading.Condition(self.lock)
+        self.stats: dict[str, int] = {}
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    @property
+    def api_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/api/v1"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def articles(self, ticket_id: int) -> list[dict]:
+        return make_articles(
+            ticket_id,
+            self.messages,
+            first_id=ticket_id * ARTICLE_ID_FACTOR,
+            images=self.images,
+        )
+
+    def ticket(self, ticket_id: int) -> dict:
+        """Ticket tel qu'envoyé par le webhook Zammad"""
+        return make_ticket(ticket_id, self.articles(ticket_id))
+
+    def record(self, name: str):
+        with self.lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def wait_for_uploads(self, ticket_ids, timeout: float) -> dict[int, float]:
+        """Attend les uploads des tickets donnés ; renvoie leurs horodatages"""
+        deadline = time.monotonic() + timeout
+        wanted = set(ticket_ids)
+        with self.uploaded:
+            while not wanted.issubset(self.upload_times):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.uploaded.wait(remaining)
+            return {
+                ticket_id: self.upload_times[ticket_id]
+                for ticket_id in wanted
+                if ticket_id in self.upload_times
+            }
+
+
+class _ZammadHandler(BaseHTTPRequestHandler):
+    server: FakeZammadServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def _send(self, status: int, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", "0")))
+
+    def _simulate(self, name: str) -> bool:
+        """Applique latence et erreurs ; renvoie False si une erreur a été envoyée"""
+        self.server.record(name)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        with self.server.lock:
+            failed = self.server.random.random() < self.server.error_rate
+        if failed:
+            self.server.record(f"{name}_errors")
+            self._send(503, {"error": "Service Unavailable"})
+        return not failed
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        path = self.path.split("?", 1)[0]
+        if match := _ARTICLES_BY_TICKET.match(path):
+            if not self.server.bulk_endpoint:
+                self._send(404, {"error": "Not Found"})
+            elif self._simulate("get_ticket_articles"):
+                self._send(200, self.server.articles(int(match.group(1))))
+        elif match := _ARTICLE.match(path):
+            if self._simulate("get_article"):
+                article_id = int(match.group(1))
+                ticket_id, index = divmod(article_id, ARTICLE_ID_FACTOR)
+                articles = self.server.articles(ticket_id)
+                if index < len(articles):
+                    self._send(200, articles[index])
+                else:
+                    self._send(404, {"error": "Not Found"})
+        elif match := _ATTACHMENT.match(path):
+            if self._simulate("get_attachment"):
+                content_type, data = make_image(int(match.group(1)))
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+        elif _TICKET_SEARCH.match(path):
+            if self._simulate("search_tickets"):
+                tickets = [self.server.ticket(ticket_id) for ticket_id in range(1, 11)]
+                self._send(200, tickets)
+        elif match := _TICKET.match(path):
+            if self._simulate("get_ticket"):
+                self._send(200, self.server.ticket(int(match.group(1))))
+        elif match := _USER.match(path):
+            if self._simulate("get_user"):
+                user_id = int(match.group(1))
+                self._send(
+                    200,
+                    {"id": user_id, "firstname": f"Prénom{user_id}", "lastname": "Nom"},
+                )
+        else:
+            self._send(404, {"error": "Not Found"})
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        self._read_body()
+        if match := _TICKET.match(self.path):
+            if self._simulate("update_ticket"):
+                self._send(200, {"id": int(match.group(1)), "pdf_generation": "false"})
+        else:
+            self._send(404, {"error": "Not Found"})
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        body = self._read_body()
+        if self.path != "/api/v1/ticket_articles":
+            self._send(404, {"error": "Not Found"})
+            return
+        if not self._simulate("create_article"):
+            return
+        payload = json.loads(body)
+        ticket_id = int(payload["ticket_id"])
+        with self.server.uploaded:
+            self.server.uploads.setdefault(ticket_id, []).append(
+                {"size": len(body), "filename": payload["attachments"][0]["filename"]}
+            )
+            self.server.upload_times.setdefault(ticket_id, time.perf_counter())
+            self.server.uploaded.notify_all()
+        self._send(201, {"id": ticket_id * ARTICLE_ID_FACTOR + 99999})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--messages", type=int, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--no-bulk", action="store_true")
+    parser.add_argument("--images", type=int, default=0, help="images par ticket")
+    args = parser.parse_args()
+
+    server = FakeZammadServer(
+        (args.host, args.port),
+        latency=args.latency,
+        messages=args.messages,
+        error_rate=args.error_rate,
+        bulk_endpoint=not args.no_bulk,
+        images=args.images,
+    )
+    print(f"API Zammad de test sur {server.api_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
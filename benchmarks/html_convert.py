@@ -0,0 +1,128 @@
+"""
+Benchmark de la conversion HTML -> paragraphes ReportLab
+
+Corps d'emails réalistes (Outlook/Gmail : divs imbriqués, styles, tableaux,
+image en ligne, longue signature, fil de réponses cité) comparés à
+l'ancienne méthode (remplacement de <br> puis un seul Paragraph).
+
+Usage :
+    python -m benchmarks.html_convert --repeat 20
+"""
+
+import argparse
+import base64
+import random
+import statistics
+import time
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import Paragraph
+
+from benchmarks.synthetic import make_body
+from services.html import article_paragraphs, html_to_paragraphs, paragraph_cache
+
+STYLE = getSampleStyleSheet()["BodyText"]
+WIDTH, HEIGHT = A4
+
+
+def _outlook_body(rng: random.Random, replies: int, table_rows: int) -> str:
+    """Email Outlook : styles en ligne, tableau, image, signature et réponses"""
+    image = base64.b64encode(rng.randbytes(30_000)).decode()
+    rows = "".join(
+        f'<tr><td style="border:1px solid #ccc;padding:2px"><span>Poste {index}</span></td>'
+        f'<td style="border:1px solid #ccc"><p class="MsoNormal">{index * 15} €</p></td></tr>'
+        for index in range(table_rows)
+    )
+    quoted = make_body(rng, 3)
+    for index in range(replies):
+        quoted = (
+            f'<div id="divRplyFwdMsg" dir="ltr"><b>De :</b> membre{index}@example.com'
+            f"<br><b>Envoyé :</b> lundi</div><div>{make_body(rng, 2)}"
+            f'<blockquote style="margin:0 0 0 .8ex;border-left:1px #ccc solid">'
+            f"{quoted}</blockquote></div>"
+        )
+    signature = "".join(
+        f'<p class="MsoNormal"><span style="font-size:9pt;color:#1F497D">'
+        f"Ligne de signature {index} – Bureau des élèves</span></p>"
+        for index in range(40)
+    )
+    return (
+        '<html><head><style>p.MsoNormal{margin:0}</style></head><body lang="FR">'
+        + "".join(
+            f'<div class="WordSection1"><p class="MsoNormal"><span style="font-family:Calibri">'
+            f"{make_body(rng, 2)}</span></p></div>"
+            for _ in range(3)
+        )
+        + f'<table class="MsoTableGrid">{rows}</table>'
+        + f'<p><img src="data:image/png;base64,{image}" alt="plan"></p>'
+        + f'<span class="js-signatureMarker"></span><div>{signature}</div>'
+        + quoted
+        + "</body></html>"
+    )
+
+
+def _legacy(body: str) -> int:
+    """Ancienne méthode : un Paragraph sur le HTML à peine retouché"""
+    paragraph = Paragraph(body.replace("<br>", "<br></br>"), STYLE)
+    paragraph.wrap(WIDTH - 144, HEIGHT)
+    return 1
+
+
+def _wrap_all(paragraphs: list[str]) -> int:
+    for markup in paragraphs:
+        Paragraph(markup, STYLE).wrap(WIDTH - 144, HEIGHT)
+    return len(paragraphs)
+
+
+def _measure(function, repeat: int) -> tuple[float, str]:
+    timings = []
+    outcome = ""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            outcome = f"{function()} paragraphe(s)"
+        except Exception as e:  # pylint: disable=broad-except
+            outcome = f"échec ({type(e).__name__})"
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), outcome
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    bodies = {
+        "zammad simple": make_body(rng, 4),
+        "outlook 5 réponses": _outlook_body(rng, replies=5, table_rows=20),
+        "outlook 30 réponses": _outlook_body(rng, replies=30, table_rows=200),
+    }
+    for label, body in bodies.items():
+        article = {"id": label, "updated_at": None, "body": body}
+        print(f"{label} ({len(body) / 1024:.0f} Ko)")
+
+        legacy, legacy_outcome = _measure(lambda body=body: _legacy(body), args.repeat)
+        print(f"  ancienne méthode   {legacy * 1000:9.2f} ms   {legacy_outcome}")
+
+        conversion, _ = _measure(
+            lambda body=body: len(html_to_paragraphs(body)), args.repeat
+        )
+        print(f"  conversion seule   {conversion * 1000:9.2f} ms")
+
+        cold, outcome = _measure(
+            lambda body=body: _wrap_all(html_to_paragraphs(body)), args.repeat
+        )
+        print(f"  conversion + wrap  {cold * 1000:9.2f} ms   {outcome}")
+
+        article_paragraphs(article)
+        warm, outcome = _measure(
+            lambda article=article: _wrap_all(article_paragraphs(article)), args.repeat
+        )
+        print(f"  en cache + wrap    {warm * 1000:9.2f} ms   {outcome}")
+    print(f"Cache : {paragraph_cache.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Temps de rendu et taille des PDFs d'un ticket illustré
+
+Un faux Zammad sert un ticket dont les articles ont des images jointes
+(photos JPEG 4000x3000 et captures d'écran PNG, voir synthetic.make_image).
+Trois rendus sont comparés :
+  - originales : images téléchargées et insérées telles quelles ;
+  - réduites : pipeline de services.images, cache vide ;
+  - cache : même rendu, images réduites lues depuis le cache disque.
+
+Usage :
+    python -m benchmarks.images --images 12 --messages 10
+    python -m benchmarks.images --dpi 100 --quality 70
+"""
+
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from PIL import Image
+
+from benchmarks.fake_zammad import FakeZammadServer
+from config import Config
+from services import images
+from services.pdf import PDFGenerator
+from services.zammad import ZammadService
+
+
+def _original_images(articles: list[dict], zammad: ZammadService):
+    """Référence : images originales, affichées à la même taille dans le PDF"""
+    for article in articles:
+        resolved = []
+        for image in article["images"]:
+            _, data = zammad.get_attachment(
+                image["ticket_id"], image["article_id"], image["id"]
+            )
+            with Image.open(io.BytesIO(data)) as source:
+                width, height = source.size
+            scale = min(1, images.MAX_WIDTH_PT / width, images.MAX_HEIGHT_PT / height)
+            resolved.append(
+                {"data": data, "width": width * scale, "height": height * scale}
+            )
+        article["images"] = resolved
+
+
+def _render(label: str, ticket: dict, zammad: ZammadService, original: bool = False):
+    articles = zammad.get_ticket_articles(ticket["id"], ticket["article_ids"])
+    start = time.perf_counter()
+    pdf_generator = PDFGenerator()
+    if original:
+        articles = list(PDFGenerator.plain_articles(articles))
+        _original_images(articles, zammad)
+        pdf_generator.generate_from_articles(ticket, articles)
+    else:
+        pdf_generator.generate_from_articles(
+            ticket, PDFGenerator.plain_articles(articles), 0, zammad
+        )
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:<11} {elapsed:6.2f} s   PDF {pdf_generator.pdf_size / 2**20:7.2f} Mo"
+    )
+    pdf_generator.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=12, help="images par ticket")
+    parser.add_argument("--messages", type=int, default=10, help="articles par ticket")
+    parser.add_argument("--dpi", type=int, default=Config.PDF_IMAGE_DPI)
+    parser.add_argument("--quality", type=int, default=Config.PDF_IMAGE_QUALITY)
+    parser.add_argument("--workers", type=int, default=Config.PDF_IMAGE_WORKERS)
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix="bench-images-")
+    Config.PDF_IMAGE_CACHE_DIR = cache_dir
+    Config.PDF_IMAGE_DPI = args.dpi
+    Config.PDF_IMAGE_QUALITY = args.quality
+    Config.PDF_IMAGE_WORKERS = args.workers
+    Config.PDF_IMAGE_MAX_COUNT = Config.PDF_IMAGE_MAX_BYTES = 0
+
+    server = FakeZammadServer(messages=args.messages, images=args.images).start()
+    Config.ZAMMAD_API_URL = server.api_url
+    zammad = ZammadService()
+    ticket = server.ticket(1)
+    print(
+        f"{args.images} images, {args.messages} messages, "
+        f"{args.dpi} dpi, qualité {args.quality}, {args.workers} threads"
+    )
+    try:
+        # Images générées une fois avant les mesures (lru_cache du faux Zammad)
+        _render("préparation", ticket, zammad)
+        for name in os.listdir(cache_dir):
+            os.unlink(os.path.join(cache_dir, name))
+        _render("originales", ticket, zammad, original=True)
+        _render("réduites", ticket, zammad)
+        _render("cache", ticket, zammad)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Test de charge de bout en bout du webhook, hors ligne
+
+Lance un faux Zammad et un faux SMTP dans ce process, démarre le service
+(gunicorn + wsgi.py ou uvicorn + asgi.py) dans un sous-process, envoie des
+webhooks à débit fixe et mesure, pour chaque ticket, le délai entre l'envoi du
+webhook et la réception du PDF par le faux Zammad.
+
+Usage :
+    python -m benchmarks.loadtest --rate 5 --duration 30 --messages 30
+    python -m benchmarks.loadtest --server asgi --latency 0.2 --rate 20
+"""
+
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.fake_smtp import FakeSMTPServer
+from benchmarks.fake_zammad import FakeZammadServer
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(values: list[float], percent: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def _process_tree(root_pid: int) -> list[int]:
+    """PIDs du process et de ses descendants (lecture de /proc, Linux)"""
+    children: dict[int, list[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", encoding="utf-8") as stat_file:
+                ppid = int(stat_file.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    pids, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+
+def _peak_rss(pids: list[int]) -> dict[int, int]:
+    """Pic de mémoire résidente (VmHWM) de chaque process, en octets"""
+    peaks = {}
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status", encoding="utf-8") as status_file:
+                for line in status_file:
+                    if line.startswith("VmHWM:"):
+                        peaks[pid] = int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return peaks
+
+
+def _start_service(args, env: dict) -> subprocess.Popen:
+    port = int(env["BENCH_PORT"])
+    if args.server == "asgi":
+        command = [sys.executable, "-m", "uvicorn", "--port", str(port)]
+        command += ["--workers", str(args.workers), "--log-level", "warning"]
+        command += ["asgi:application"]
+    else:
+        command = [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}"]
+        command += ["--workers", str(args.workers), "wsgi:application"]
+    process = subprocess.Popen(  # pylint: disable=consider-using-with
+        command, cwd=_ROOT, env=env, start_new_session=True
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Le service s'est arrêté au démarrage")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Le service n'a pas démarré en 30 s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--server", choices=["wsgi", "asgi"], default="wsgi")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--rate", type=float, default=5, help="webhooks par seconde")
+    parser.add_argument("--duration", type=float, default=20, help="secondes")
+    parser.add_argument("--messages", type=int, default=10, help="articles par ticket")
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="latence Zammad (s)"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--no-bulk", action="store_true")
+    parser.add_argument(
+        "--email", type=float, default=0.0, help="part des tickets envoyés par email"
+    )
+    parser.add_argument(
+        "--drain", type=float, default=60, help="attente max des derniers PDFs (s)"
+    )
+    parser.add_argument(
+        "--outbound-rate",
+        type=float,
+        default=0,
+        help="OUTBOUND_RATE du service (défaut 0 : le service est mesuré sans limite)",
+    )
+    args = parser.parse_args()
+
+    zammad = FakeZammadServer(
+        latency=args.latency,
+        messages=args.messages,
+        error_rate=args.error_rate,
+        bulk_endpoint=not args.no_bulk,
+    ).start()
+    smtp = FakeSMTPServer(keep_messages=False).start()
+
+    port = _free_port()
+    env = dict(
+        os.environ,
+        BENCH_PORT=str(port),
+        ZAMMAD_API_URL=zammad.api_url,
+        ZAMMAD_API_TOKEN="bench",
+        WEBHOOK_USERNAME="bench",
+        WEBHOOK_PASSWORD="bench",
+        MAIL_FROM="bench@example.com",
+        SMTP_HOST="127.0.0.1",
+        SMTP_PORT=str(smtp.port),
+        SMTP_PLAINTEXT="true",
+        SMTP_USERNAME="bench",
+        SMTP_PASSWORD="bench",
+        SMTP_RECIPIENTS="bench@example.com",
+        WEBHOOK_DEBOUNCE_SECONDS="0",
+        OUTBOUND_RATE=str(args.outbound_rate),
+    )
+    service = _start_service(args, env)
+
+    url = f"http://127.0.0.1:{port}/webhook"
+    local = threading.local()
+    sent: dict[int, float] = {}
+    statuses: dict[int, int] = {}
+    lock = threading.Lock()
+
+    def post(ticket_id: int, email: bool):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        ticket = zammad.ticket(ticket_id)
+        ticket["pdf_generation"] = "email" if email else "true"
+        start = time.perf_counter()
+        try:
+            status = session.post(
+                url, json={"ticket": ticket}, auth=("bench", "bench"), timeout=30
+            ).status_code
+        except requests.RequestException:
+            status = 0
+        with lock:
+            if status == 202:
+                sent[ticket_id] = start
+            statuses[status] = statuses.get(status, 0) + 1
+
+    total = int(args.rate * args.duration)
+    print(
+        f"{args.server} x{args.workers} : {total} webhooks à {args.rate}/s, "
+        f"{args.messages} messages, latence Zammad {args.latency * 1000:.0f} ms, "
+        f"écritures Zammad limitées à {args.outbound_rate or '∞'}/s"
+    )
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=64) as executor:
+            for index in range(total):
+                delay = started + index / args.rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(post, index + 1, index < total * args.email)
+
+        done = zammad.wait_for_uploads(list(sent), timeout=args.drain)
+        finished = time.perf_counter()
+        peaks = _peak_rss(_process_tree(service.pid))
+    finally:
+        os.killpg(service.pid, signal.SIGTERM)
+        service.wait(timeout=30)
+
+    latencies = [done[ticket_id] - sent[ticket_id] for ticket_id in done]
+    elapsed = (max(done.values()) if done else finished) - started
+    print(f"Réponses webhook : {dict(sorted(statuses.items()))}")
+    print(f"PDFs reçus       : {len(done)}/{total}")
+    print(f"Débit            : {len(done) / elapsed:.2f} tickets/s")
+    print(
+        "Latence job      : "
+        f"p50 {_percentile(latencies, 50) * 1000:.0f} ms, "
+        f"p95 {_percentile(latencies, 95) * 1000:.0f} ms, "
+        f"p99 {_percentile(latencies, 99) * 1000:.0f} ms"
+    )
+    print(
+        "Pic mémoire      : "
+        + ", ".join(f"pid {pid} {peak / 2**20:.0f} Mo" for pid, peak in peaks.items())
+    )
+    print(f"Appels Zammad    : {dict(sorted(zammad.stats.items()))}")
+    print(f"SMTP             : {smtp.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Temps et pic mémoire du rendu d'un ticket de plusieurs milliers de messages
+
+Chaque configuration (sans limite, PDF_MAX_PAGES, PDF_MAX_MESSAGES,
+PDF_LAST_MESSAGES) est rendue dans un process neuf pour mesurer son pic RSS.
+
+Usage :
+    python -m benchmarks.long_ticket --messages 5000
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time
+
+from benchmarks.synthetic import make_articles, make_ticket, plain_articles
+from config import Config
+from services.pdf import PDFGenerator
+
+SCENARIOS = {
+    "sans limite": {"PDF_MAX_MESSAGES": 0, "PDF_MAX_PAGES": 0},
+    "300 pages": {"PDF_MAX_MESSAGES": 0, "PDF_MAX_PAGES": 300},
+    "1000 messages": {"PDF_MAX_MESSAGES": 1000, "PDF_MAX_PAGES": 0},
+    "50 derniers": {"PDF_LAST_MESSAGES": 50, "PDF_MAX_PAGES": 0},
+}
+
+
+def _render(messages: int, settings: dict, results):
+    for name, value in settings.items():
+        setattr(Config, name, value)
+    articles = make_articles(1, messages)
+    ticket = make_ticket(1, articles)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    pdf_generator = PDFGenerator()
+    pdf_generator.generate_from_articles(ticket, iter(plain_articles(articles)))
+    elapsed = time.perf_counter() - start
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((elapsed, (peak - baseline) / 1024, pdf_generator.pdf_size / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=5000)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    for label, settings in SCENARIOS.items():
+        results = context.Queue()
+        process = context.Process(
+            target=_render, args=(args.messages, settings, results)
+        )
+        process.start()
+        elapsed, rss, size = results.get()
+        process.join()
+        print(f"{label:<14} {elapsed:7.2f} s   +{rss:7.1f} Mo RSS   PDF {size:8.0f} Ko")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Compare la mémoire utilisée par job entre l'ancien chemin (copies complètes du
+PDF en bytes, base64, JSON et MIME) et le chemin en flux
+
+Chaque mode est exécuté dans un process neuf ; on mesure le pic d'allocations
+Python (tracemalloc) et la hausse du RSS maximal pendant l'upload + l'email.
+
+Usage :
+    python -m benchmarks.memory --size-mb 8
+"""
+
+import argparse
+import base64
+import json
+import multiprocessing
+import os
+import resource
+import threading
+import tracemalloc
+from email import encoders  # pylint: disable=import-self
+from email.mime.base import MIMEBase  # pylint: disable=import-error,no-name-in-module
+from email.mime.multipart import (  # pylint: disable=import-error,no-name-in-module
+    MIMEMultipart,
+)
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _SinkHandler(BaseHTTPRequestHandler):
+    """Lit et jette le corps des requêtes, comme un Zammad très rapide"""
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        remaining = int(self.headers.get("Content-Length", "0"))
+        while remaining:
+            remaining -= len(self.rfile.read(min(remaining, 65536)))
+        body = b'{"id": 1}'
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _start_servers():
+    from benchmarks.fake_smtp import (
+        FakeSMTPServer,
+    )  # pylint: disable=import-outside-toplevel
+
+    http_server = ThreadingHTTPServer(("127.0.0.1", 0), _SinkHandler)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    smtp_server = FakeSMTPServer(keep_messages=False).start()
+    os.environ.update(
+        {
+            "ZAMMAD_API_URL": f"http://127.0.0.1:{http_server.server_port}",
+            "SMTP_HOST": "127.0.0.1",
+            "SMTP_PORT": str(smtp_server.port),
+            "SMTP_PLAINTEXT": "true",
+            "SMTP_USERNAME": "bench",
+            "SMTP_PASSWORD": "bench",
+            "SMTP_RECIPIENTS": "bench@example.com",
+        }
+    )
+
+
+def _legacy_job(zammad, email_service, pdf_file):
+    """Reproduit l'ancien chemin : chaque étape matérialise une copie complète"""
+    pdf_bytes = pdf_file.read()
+    pdf_base64 = base64.b64encode(pdf_bytes).decode("utf-8")
+    zammad.send_ticket_pdf("1", 1, pdf_base64)
+
+    message = MIMEMultipart()
+    message["From"] = email_service.username
+    message["To"] = ", ".join(email_service.recipients)
+    part = MIMEBase("application", "pdf")
+    part.set_payload(pdf_bytes)
+    encoders.encode_base64(part)
+    part.add_header("Content-Disposition", "attachment; filename=ticket.pdf")
+    message.attach(part)
+    with email_service.pool.connection() as server:
+        server.sendmail(
+            email_service.username, email_service.recipients, message.as_string()
+        )
+    json.dumps({"size": len(pdf_base64)})
+
+
+def _streaming_job(zammad, email_service, pdf_file):
+    zammad.send_ticket_pdf("1", 1, pdf_file)
+    email_service.send_email_with_pdf(pdf_file, filename="ticket.pdf")
+
+
+def _measure(mode: str, size_mb: int, results):
+    _start_servers()
+    # pylint: disable=import-outside-toplevel
+    from services.email import EmailService
+    from services.streams import spooled_file
+    from services.zammad import ZammadService
+
+    zammad = ZammadService()
+    email_service = EmailService()
+    pdf_file = spooled_file()
+    for _ in range(size_mb):
+        pdf_file.write(os.urandom(1024 * 1024))
+    pdf_file.seek(0)
+
+    job = _legacy_job if mode == "legacy" else _streaming_job
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    job(zammad, email_service, pdf_file)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results[mode] = (peak, (rss_after - rss_before) * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=int, default=8)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Manager().dict()
+    for mode in ("legacy", "streaming"):
+        process = context.Process(target=_measure, args=(mode, args.size_mb, results))
+        process.start()
+        process.join()
+
+    print(f"PDF de {args.size_mb} Mo (données incompressibles)")
+    for mode, (peak, rss) in results.items():
+        print(
+            f"{mode:<10} pic Python {peak / 2**20:8.1f} Mo"
+            f"   hausse RSS {rss / 2**20:8.1f} Mo"
+        )
+
+
+if __name__ == "__main__":
+    main()
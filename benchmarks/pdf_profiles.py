@@ -0,0 +1,123 @@
+"""
+Taille et latence des PDFs selon le profil de sortie (PDF_PROFILE)
+
+Pour chaque ticket type (court, long, illustré) et chaque profil, le script
+mesure le temps de génération (images déjà en cache), la taille du PDF,
+celle du corps JSON envoyé à Zammad (base64) et le temps de cet envoi vers
+un faux Zammad local, puis la taille de l'email (PDF joint ou lien seul).
+
+Usage :
+    python -m benchmarks.pdf_profiles --repeat 5
+    python -m benchmarks.pdf_profiles --profiles standard compact --images 12
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+
+from benchmarks.fake_zammad import FakeZammadServer
+from config import Config
+from services.email import ticket_link, write_pdf_message
+from services.pdf import PDFGenerator
+from services.pdf_profiles import PROFILES
+from services.streams import base64_length, file_size
+from services.zammad import ZammadService
+
+
+def _tickets(args) -> dict[str, FakeZammadServer]:
+    """Ticket type -> faux Zammad qui le sert (ticket 1)"""
+    return {
+        "court": FakeZammadServer(messages=10),
+        "long": FakeZammadServer(messages=args.messages),
+        "illustré": FakeZammadServer(messages=10, images=args.images),
+    }
+
+
+def _measure(server: FakeZammadServer, repeat: int) -> tuple[float, float, int, int]:
+    Config.ZAMMAD_API_URL = server.api_url
+    zammad = ZammadService()
+    ticket = server.ticket(1)
+    articles = zammad.get_ticket_articles(1, ticket["article_ids"])
+    render_times, upload_times = [], []
+    for _ in range(repeat):
+        pdf_generator = PDFGenerator()
+        start = time.perf_counter()
+        pdf_generator.generate_from_articles(
+            ticket, PDFGenerator.plain_articles(articles), 0, zammad
+        )
+        render_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        success, response = zammad.send_ticket_pdf(
+            ticket["number"], ticket["id"], pdf_generator.pdf_file
+        )
+        upload_times.append(time.perf_counter() - start)
+        if not success:
+            raise RuntimeError(response)
+
+        pdf_size = pdf_generator.pdf_size
+        message = write_pdf_message(
+            "bench@example.com", ["bench@example.com"], pdf_generator.pdf_file, "t.pdf"
+        )
+        email_size = file_size(message)
+        message.close()
+        pdf_generator.close()
+    return (
+        statistics.median(render_times),
+        statistics.median(upload_times),
+        pdf_size,
+        email_size,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--profiles", nargs="+", choices=list(PROFILES), default=list(PROFILES)
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--messages", type=int, default=200, help="ticket long")
+    parser.add_argument("--images", type=int, default=6, help="ticket illustré")
+    args = parser.parse_args()
+
+    Config.PDF_IMAGE_CACHE_DIR = tempfile.mkdtemp(prefix="bench-profiles-")
+    Config.PDF_IMAGE_MAX_COUNT = Config.PDF_IMAGE_MAX_BYTES = 0
+    servers = _tickets(args)
+    for server in servers.values():
+        server.start()
+
+    print(
+        f"{'ticket':<9} {'profil':<9} {'rendu':>8} {'upload':>8} "
+        f"{'PDF':>9} {'JSON':>9} {'email':>9}"
+    )
+    for label, server in servers.items():
+        for profile in args.profiles:
+            Config.PDF_PROFILE = profile
+            # Premier rendu hors mesure : images téléchargées et mises en cache
+            _measure(server, 1)
+            render, upload, pdf_size, email_size = _measure(server, args.repeat)
+            print(
+                f"{label:<9} {profile:<9} {render * 1000:6.0f} ms {upload * 1000:5.0f} ms "
+                f"{pdf_size / 1024:6.0f} Ko {base64_length(pdf_size) / 1024:6.0f} Ko "
+                f"{email_size / 1024:6.0f} Ko"
+            )
+
+    if Config.EMAIL_ATTACHMENT_MAX_BYTES > 0:
+        link_message = write_pdf_message(
+            "bench@example.com",
+            ["bench@example.com"],
+            b"\0" * (Config.EMAIL_ATTACHMENT_MAX_BYTES + 1),
+            "t.pdf",
+            link=ticket_link(1),
+        )
+        print(
+            f"email avec lien seul (PDF > {Config.EMAIL_ATTACHMENT_MAX_BYTES} octets) : "
+            f"{file_size(link_message) / 1024:.1f} Ko"
+        )
+    for server in servers.values():
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
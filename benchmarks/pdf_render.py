@@ -0,0 +1,45 @@
+"""
+Micro-benchmark de PDFGenerator (construction + rendu, sans réseau)
+
+Usage :
+    python -m benchmarks.pdf_render --repeat 10
+"""
+
+import argparse
+import io
+import statistics
+import time
+
+from benchmarks.synthetic import make_articles, make_ticket, plain_articles
+from services.pdf import PDFGenerator
+
+SIZES = {"petit": 3, "moyen": 30, "grand": 200}
+
+
+def _render_once(ticket: dict, articles: list[dict]) -> float:
+    start = time.perf_counter()
+    output = io.BytesIO()
+    PDFGenerator().render(ticket, articles, output)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    for label, messages in SIZES.items():
+        articles = make_articles(1, messages)
+        ticket = make_ticket(1, articles)
+        data = plain_articles(articles)
+        _render_once(ticket, data)
+        timings = [_render_once(ticket, data) for _ in range(args.repeat)]
+        print(
+            f"{label:<6} {messages:>4} messages"
+            f"   médiane {statistics.median(timings) * 1000:8.1f} ms"
+            f"   min {min(timings) * 1000:8.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Mesure le débit de rendu PDF en thread vs dans un pool de process
+
+Usage :
+    python -m benchmarks.render_pool --tickets 32 --messages 60
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from benchmarks.synthetic import make_articles, make_ticket, plain_articles
+from services.pdf import render_ticket_pdf
+
+
+def _run(executor, jobs) -> float:
+    start = time.perf_counter()
+    futures = [executor.submit(render_ticket_pdf, *job) for job in jobs]
+    for future in futures:
+        future.result()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tickets", type=int, default=32)
+    parser.add_argument("--messages", type=int, default=60)
+    parser.add_argument("--max-processes", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    jobs = []
+    for ticket_id in range(1, args.tickets + 1):
+        articles = make_articles(ticket_id, args.messages)
+        jobs.append((make_ticket(ticket_id, articles), plain_articles(articles)))
+
+    with ThreadPoolExecutor(max_workers=args.max_processes) as executor:
+        elapsed = _run(executor, jobs)
+    print(
+        f"threads x{args.max_processes:<3} {elapsed:7.2f}s "
+        f"{args.tickets / elapsed:7.2f} tickets/s"
+    )
+
+    context = multiprocessing.get_context("forkserver")
+    processes = 1
+    while processes <= args.max_processes:
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+            # Préchauffe les process (import de ReportLab) hors mesure
+            list(pool.map(abs, range(processes)))
+            elapsed = _run(pool, jobs)
+        print(
+            f"process x{processes:<3} {elapsed:7.2f}s "
+            f"{args.tickets / elapsed:7.2f} tickets/s"
+        )
+        processes *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Mesure le démarrage du service selon le mode de chargement (Linux)
+
+Pour chaque mode, le service est lancé dans un sous-process avec un faux
+Zammad ; le script mesure le délai jusqu'à ce que tous les workers soient
+prêts (lignes `[startup]`), la mémoire de chaque process (RSS, PSS et pages
+privées) puis le délai du premier PDF envoyé après un webhook.
+
+Usage :
+    python -m benchmarks.startup --workers 4
+    python -m benchmarks.startup --modes preload lazy --render-processes 2
+"""
+
+import argparse
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+from benchmarks.fake_zammad import FakeZammadServer
+from benchmarks.loadtest import _ROOT, _free_port, _process_tree
+
+# Mode -> (serveur, variables d'environnement)
+MODES = {
+    # gunicorn --preload, préchauffage dans le master (défaut)
+    "preload": ("wsgi", {"GUNICORN_PRELOAD": "true", "STARTUP_WARMUP": "true"}),
+    # application chargée et préchauffée dans chaque worker
+    "no-preload": ("wsgi", {"GUNICORN_PRELOAD": "false", "STARTUP_WARMUP": "true"}),
+    # ni preload ni préchauffage : ReportLab chargé au premier job
+    "lazy": ("wsgi", {"GUNICORN_PRELOAD": "false", "STARTUP_WARMUP": "false"}),
+    "asgi": ("asgi", {"STARTUP_WARMUP": "true"}),
+}
+
+
+def _memory(pid: int) -> dict[str, int] | None:
+    """RSS, PSS et pages privées d'un process, en octets"""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", encoding="utf-8") as smaps:
+            for line in smaps:
+                name, _, value = line.partition(":")
+                if name in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                    values[name] = int(value.split()[0]) * 1024
+    except OSError:
+        return None
+    return {
+        "rss": values.get("Rss", 0),
+        "pss": values.get("Pss", 0),
+        "private": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0),
+    }
+
+
+def _read_lines(stream, lines: queue.Queue):
+    for line in stream:
+        lines.put(line.rstrip())
+
+
+def _run(mode: str, args, zammad: FakeZammadServer, ticket_id: int):
+    server, overrides = MODES[mode]
+    port = _free_port()
+    env = dict(
+        os.environ,
+        PYTHONUNBUFFERED="1",
+        ZAMMAD_API_URL=zammad.api_url,
+        ZAMMAD_API_TOKEN="bench",
+        WEBHOOK_USERNAME="bench",
+        WEBHOOK_PASSWORD="bench",
+        MAIL_FROM="bench@example.com",
+        SMTP_HOST="127.0.0.1",
+        SMTP_PORT="25",
+        SMTP_USERNAME="bench",
+        SMTP_PASSWORD="bench",
+        SMTP_RECIPIENTS="bench@example.com",
+        WEBHOOK_DEBOUNCE_SECONDS="0",
+        METRICS_DIR="",
+        PDF_RENDER_PROCESSES=str(args.render_processes),
+        **overrides,
+    )
+    if server == "asgi":
+        command = [sys.executable, "-m", "uvicorn", "--port", str(port)]
+        command += ["--workers", str(args.workers), "asgi:application"]
+    else:
+        command = [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}"]
+        command += ["--workers", str(args.workers), "wsgi:application"]
+
+    started = time.perf_counter()
+    process = subprocess.Popen(  # pylint: disable=consider-using-with
+        command,
+        cwd=_ROOT,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        start_new_session=True,
+    )
+    lines: queue.Queue = queue.Queue()
+    threading.Thread(
+        target=_read_lines, args=(process.stdout, lines), daemon=True
+    ).start()
+    try:
+        ready = 0
+        while ready < args.workers:
+            try:
+                line = lines.get(timeout=60)
+            except queue.Empty as e:
+                raise RuntimeError(f"{mode} : workers non prêts en 60 s") from e
+            if line.startswith("[startup] worker"):
+                ready += 1
+        ready_seconds = time.perf_counter() - started
+        # Laisse les workers au repos avant de lire leur mémoire
+        time.sleep(0.5)
+        memory = {
+            pid: usage
+            for pid in _process_tree(process.pid)
+            if (usage := _memory(pid)) is not None
+        }
+
+        ticket = zammad.ticket(ticket_id)
+        ticket["pdf_generation"] = "true"
+        sent = time.perf_counter()
+        requests.post(
+            f"http://127.0.0.1:{port}/webhook",
+            json={"ticket": ticket},
+            auth=("bench", "bench"),
+            timeout=30,
+        ).raise_for_status()
+        uploads = zammad.wait_for_uploads([ticket_id], timeout=60)
+        first_pdf = uploads[ticket_id] - sent if uploads else float("nan")
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+
+    total = {
+        name: sum(usage[name] for usage in memory.values())
+        for name in ("rss", "pss", "private")
+    }
+    print(
+        f"{mode:<11} prêt en {ready_seconds:5.2f} s, premier PDF {first_pdf:5.2f} s, "
+        f"{len(memory)} process : RSS {total['rss'] / 2**20:6.1f} Mo, "
+        f"PSS {total['pss'] / 2**20:6.1f} Mo, privé {total['private'] / 2**20:6.1f} Mo"
+    )
+    if args.verbose:
+        for pid, usage in memory.items():
+            print(
+                f"    pid {pid:<7} RSS {usage['rss'] / 2**20:6.1f} Mo, "
+                f"PSS {usage['pss'] / 2**20:6.1f} Mo, "
+                f"privé {usage['private'] / 2**20:6.1f} Mo"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--messages", type=int, default=10, help="articles par ticket")
+    parser.add_argument(
+        "--render-processes", type=int, default=0, help="PDF_RENDER_PROCESSES"
+    )
+    parser.add_argument("--verbose", action="store_true", help="détail par process")
+    args = parser.parse_args()
+
+    zammad = FakeZammadServer(latency=0, messages=args.messages).start()
+    print(f"{args.workers} workers, PDF_RENDER_PROCESSES={args.render_processes}")
+    for ticket_id, mode in enumerate(args.modes, start=1):
+        _run(mode, args, zammad, ticket_id)
+
+
+if __name__ == "__main__":
+    main()
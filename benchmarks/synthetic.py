@@ -0,0 +1,147 @@
+"""Génération de tickets et d'articles Zammad synthétiques pour les benchmarks"""
+
+import io
+import random
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from PIL import Image, ImageDraw
+
+_WORDS = (
+    "soirée association salle matériel sécurité budget réservation boissons "
+    "participants horaires campus inscription bénévoles buffet musique"
+).split()
+
+
+def make_body(rng: random.Random, paragraphs: int = 3) -> str:
+    """Construit un corps d'article HTML proche de ceux produits par Zammad"""
+    parts = []
+    for _ in range(paragraphs):
+        sentence = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(20, 60)))
+        parts.append(f"<div>{sentence.capitalize()}.<br></div>")
+    return "".join(parts)
+
+
+@lru_cache(maxsize=64)
+def make_image(attachment_id: int) -> tuple[str, bytes]:
+    """
+    Image jointe synthétique : photo JPEG 4000x3000 (ID pair) ou capture
+    d'écran PNG 1920x1080 (ID impair), toujours identique pour un même ID
+
+    Returns:
+        tuple: (type MIME, contenu)
+    """
+    rng = random.Random(attachment_id)
+    output = io.BytesIO()
+    if attachment_id % 2 == 0:
+        image = Image.linear_gradient("L").resize((4000, 3000)).convert("RGB")
+        draw = ImageDraw.Draw(image)
+        for _ in range(40):
+            x, y = rng.randrange(4000), rng.randrange(3000)
+            color = tuple(rng.randrange(256) for _ in range(3))
+            draw.ellipse(
+                (x, y, x + rng.randint(100, 900), y + rng.randint(100, 900)), color
+            )
+        # Grain de capteur : une photo se compresse mal
+        noise = Image.effect_noise((4000, 3000), 24).convert("RGB")
+        Image.blend(image, noise, 0.15).save(output, "JPEG", quality=92)
+        return "image/jpeg", output.getvalue()
+
+    image = Image.new("RGB", (1920, 1080), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, 1920, 60), (40, 60, 90))
+    for row in range(24):
+        y = 100 + row * 40
+        width = rng.randint(300, 1700)
+        draw.rectangle((80, y, 80 + width, y + 18), (200, 200, 200))
+    image.save(output, "PNG")
+    return "image/png", output.getvalue()
+
+
+def make_attachments(article_id: int, count: int) -> list[dict]:
+    """Métadonnées des images jointes à un article, au format de l'API Zammad"""
+    attachments = []
+    for index in range(count):
+        attachment_id = article_id * 10 + index
+        content_type, data = make_image(attachment_id)
+        extension = content_type.split("/")[1]
+        attachments.append(
+            {
+                "id": attachment_id,
+                "filename": f"image{attachment_id}.{extension}",
+                "size": str(len(data)),
+                "preferences": {"Content-Type": content_type},
+            }
+        )
+    return attachments
+
+
+def make_articles(
+    ticket_id: int,
+    count: int,
+    seed: int | None = None,
+    first_id: int = 1,
+    images: int = 0,
+) -> list[dict]:
+    """
+    Génère `count` articles ; le premier est la description du ticket
+
+    `images` images sont jointes au ticket, une par article en partant de la
+    description (voir make_image).
+    """
+    rng = random.Random(ticket_id if seed is None else seed)
+    start = datetime(2025, 9, 1, 8, 0, 0)
+    articles = []
+    for index in range(count):
+        created_at = start + timedelta(minutes=17 * index)
+        articles.append(
+            {
+                "id": first_id + index,
+                "ticket_id": ticket_id,
+                "type_id": 10,
+                "from": f"membre{rng.randint(1, 40)}@example.com",
+                "created_at": created_at.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                "updated_at": created_at.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                "body": make_body(rng, rng.randint(1, 4)),
+                "attachments": make_attachments(
+                    first_id + index, images // count + (index < images % count)
+                ),
+            }
+        )
+    return articles
+
+
+def make_ticket(ticket_id: int, articles: list[dict]) -> dict:
+    """Génère un ticket BDE au format du payload webhook Zammad"""
+    return {
+        "id": ticket_id,
+        "number": str(30000 + ticket_id),
+        "title": f"Soirée de rentrée #{ticket_id}",
+        "pdf_generation": "true",
+        "owner": {"firstname": "Jean", "lastname": "Dupont"},
+        "created_by": {"firstname": "Camille", "lastname": "Martin"},
+        "created_at": "2025-09-01T08:00:00.000Z",
+        "bde_log_clubasso_name": "Club Musique",
+        "date_begin": "2025-10-10T18:00:00.000Z",
+        "date_end": "2025-10-11T02:00:00.000Z",
+        "bde_clubasso_participants_nb": 150,
+        "bde_clubasso_externals": False,
+        "places": "Foyer",
+        "bde_clubasso_food": True,
+        "bde_clubasso_orgas": "Camille Martin, Alex Durand",
+        "bde_com_hebdo": False,
+        "article_ids": [article["id"] for article in articles],
+    }
+
+
+def plain_articles(articles: list[dict]) -> list[dict]:
+    """Réduit les articles aux champs utilisés par le rendu PDF"""
+    return [
+        {
+            "created_at": article["created_at"],
+            "body": article["body"],
+            "from": article["from"],
+            "type_id": article["type_id"],
+        }
+        for article in articles
+    ]
@@ -1,4 +1,5 @@
 import os
+import re
 from dotenv import load_dotenv
 
 # Charger les variables d'environnement
@@ -11,15 +12,130 @@ class Config:
     # Configuration Zammad
     ZAMMAD_API_URL = os.getenv("ZAMMAD_API_URL", "")
     ZAMMAD_API_TOKEN = os.getenv("ZAMMAD_API_TOKEN", "")
+    # Adresse de l'interface web pour les liens des emails (vide = déduite de l'API)
+    ZAMMAD_WEB_URL = os.getenv("ZAMMAD_WEB_URL", "")
+    ZAMMAD_FETCH_CONCURRENCY = int(os.getenv("ZAMMAD_FETCH_CONCURRENCY", "8"))
+    ZAMMAD_POOL_CONNECTIONS = int(os.getenv("ZAMMAD_POOL_CONNECTIONS", "2"))
+    ZAMMAD_POOL_SIZE = int(os.getenv("ZAMMAD_POOL_SIZE", "10"))
+    ZAMMAD_RETRIES = int(os.getenv("ZAMMAD_RETRIES", "3"))
+    ZAMMAD_RETRY_BACKOFF = float(os.getenv("ZAMMAD_RETRY_BACKOFF", "0.5"))
+
+    # Cache des articles Zammad ("memory", "sqlite", "redis" ou "none")
+    ARTICLE_CACHE_BACKEND = os.getenv("ARTICLE_CACHE_BACKEND", "memory")
+    ARTICLE_CACHE_TTL = float(os.getenv("ARTICLE_CACHE_TTL", "86400"))
+    ARTICLE_CACHE_MAX_ENTRIES = int(os.getenv("ARTICLE_CACHE_MAX_ENTRIES", "5000"))
+    ARTICLE_CACHE_MAX_BYTES = int(os.getenv("ARTICLE_CACHE_MAX_BYTES", "52428800"))
+    ARTICLE_CACHE_PATH = os.getenv(
+        "ARTICLE_CACHE_PATH", "/tmp/zammad-workflows-articles.sqlite3"
+    )
+    ARTICLE_CACHE_REDIS_URL = os.getenv(
+        "ARTICLE_CACHE_REDIS_URL", "redis://localhost:6379/0"
+    )
 
     # Configuration authentification webhook
     WEBHOOK_USERNAME = os.getenv("WEBHOOK_USERNAME", "")
     WEBHOOK_PASSWORD = os.getenv("WEBHOOK_PASSWORD", "")
+    # Identifiants supplémentaires "utilisateur:mot_de_passe,..." (un par instance).
+    # Un mot de passe peut être donné sous forme "sha256:<empreinte hex>"
+    # (64 caractères, vérifiés par validate()).
+    WEBHOOK_CREDENTIALS = os.getenv("WEBHOOK_CREDENTIALS", "")
+    # Secrets HMAC du header X-Hub-Signature, séparés par des virgules (vide = désactivé)
+    WEBHOOK_SIGNATURE_SECRETS = os.getenv("WEBHOOK_SIGNATURE_SECRETS", "")
+    # Échecs d'authentification tolérés par IP et par fenêtre (0 = sans limite)
+    AUTH_FAILURE_LIMIT = int(os.getenv("AUTH_FAILURE_LIMIT", "20"))
+    AUTH_FAILURE_WINDOW = float(os.getenv("AUTH_FAILURE_WINDOW", "60"))
+    # Reverse proxies de confiance devant le service : l'adresse du client est
+    # lue dans X-Forwarded-For (0 = adresse de la connexion)
+    TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT", "0"))
+    # Taille maximale du corps d'une requête (au-delà : 413)
+    WEBHOOK_MAX_BYTES = int(os.getenv("WEBHOOK_MAX_BYTES", "1048576"))
+
+    # Écritures vers Zammad : débit par instance (requêtes/s, 0 = sans limite),
+    # réessais et conservation des écritures en échec (vide = désactivée)
+    OUTBOUND_RATE = float(os.getenv("OUTBOUND_RATE", "5"))
+    OUTBOUND_BURST = int(os.getenv("OUTBOUND_BURST", "10"))
+    # Base SQLite du seau partagé par les workers (vide = un seau par worker)
+    OUTBOUND_RATE_DB = os.getenv(
+        "OUTBOUND_RATE_DB", "/tmp/zammad-workflows-outbound-rate.sqlite3"
+    )
+    OUTBOUND_WORKERS = int(os.getenv("OUTBOUND_WORKERS", "4"))
+    OUTBOUND_MAX_ATTEMPTS = int(os.getenv("OUTBOUND_MAX_ATTEMPTS", "5"))
+    OUTBOUND_RETRY_DELAY = float(os.getenv("OUTBOUND_RETRY_DELAY", "2"))
+    OUTBOUND_DEAD_LETTER_DB = os.getenv(
+        "OUTBOUND_DEAD_LETTER_DB", "/tmp/zammad-workflows-outbound.sqlite3"
+    )
 
     # Configuration Flask
     DEBUG = os.getenv("FLASK_DEBUG", "False").lower() == "true"
     PORT = int(os.getenv("FLASK_PORT", "5000"))
 
+    # Configuration de la file de jobs
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+    JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+    JOB_QUEUE_DB = os.getenv("JOB_QUEUE_DB", "")
+    WEBHOOK_DEBOUNCE_SECONDS = float(os.getenv("WEBHOOK_DEBOUNCE_SECONDS", "1"))
+
+    # Démarrage : rendu d'un PDF factice avant d'accepter du trafic, et
+    # chargement de l'application dans le master gunicorn (gunicorn.conf.py)
+    STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "True").lower() == "true"
+    GUNICORN_PRELOAD = os.getenv("GUNICORN_PRELOAD", "True").lower() == "true"
+
+    # Rendu PDF dans un pool de process ("0" = dans le thread, "auto" = nb de coeurs)
+    PDF_RENDER_PROCESSES = os.getenv("PDF_RENDER_PROCESSES", "0")
+
+    # Taille au-delà de laquelle un PDF en cours de traitement passe sur disque
+    PDF_SPOOL_MAX_BYTES = int(os.getenv("PDF_SPOOL_MAX_BYTES", "1048576"))
+
+    # Répertoire des templates PDF (*.json), lus une fois au démarrage
+    PDF_TEMPLATES_DIR = os.getenv("PDF_TEMPLATES_DIR") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "templates"
+    )
+
+    # Limites des tickets très longs (0 = sans limite). PDF_LAST_MESSAGES > 0
+    # ne garde que la description et les N derniers messages.
+    PDF_MAX_MESSAGES = int(os.getenv("PDF_MAX_MESSAGES", "1000"))
+    PDF_LAST_MESSAGES = int(os.getenv("PDF_LAST_MESSAGES", "0"))
+    PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "300"))
+
+    # Profil de sortie des PDFs ("standard" ou "compact", voir services/pdf_profiles.py)
+    PDF_PROFILE = os.getenv("PDF_PROFILE", "standard")
+
+    # Images jointes aux articles : réduites à PDF_IMAGE_DPI, bornées par PDF
+    # (0 = sans limite) et mises en cache sur disque (vide = pas de cache)
+    PDF_IMAGES = os.getenv("PDF_IMAGES", "True").lower() == "true"
+    PDF_IMAGE_DPI = int(os.getenv("PDF_IMAGE_DPI", "150"))
+    PDF_IMAGE_QUALITY = int(os.getenv("PDF_IMAGE_QUALITY", "80"))
+    PDF_IMAGE_MAX_COUNT = int(os.getenv("PDF_IMAGE_MAX_COUNT", "50"))
+    PDF_IMAGE_MAX_BYTES = int(os.getenv("PDF_IMAGE_MAX_BYTES", "8388608"))
+    PDF_IMAGE_MAX_SOURCE_BYTES = int(
+        os.getenv("PDF_IMAGE_MAX_SOURCE_BYTES", "20971520")
+    )
+    PDF_IMAGE_WORKERS = int(os.getenv("PDF_IMAGE_WORKERS", "4"))
+    PDF_IMAGE_CACHE_DIR = os.getenv(
+        "PDF_IMAGE_CACHE_DIR", "/tmp/zammad-workflows-images"
+    )
+    PDF_IMAGE_CACHE_MAX_BYTES = int(os.getenv("PDF_IMAGE_CACHE_MAX_BYTES", "268435456"))
+
+    # Conversion du HTML des articles (bornes par article, cache par ID)
+    HTML_MAX_PARAGRAPHS = int(os.getenv("HTML_MAX_PARAGRAPHS", "200"))
+    HTML_MAX_PARAGRAPH_CHARS = int(os.getenv("HTML_MAX_PARAGRAPH_CHARS", "4000"))
+    HTML_MAX_CHARS = int(os.getenv("HTML_MAX_CHARS", "50000"))
+    HTML_CACHE_MAX_ENTRIES = int(os.getenv("HTML_CACHE_MAX_ENTRIES", "5000"))
+
+    # Cache disque des PDFs générés (vide = désactivé)
+    PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", "")
+    PDF_CACHE_MAX_FILES = int(os.getenv("PDF_CACHE_MAX_FILES", "200"))
+
+    # Régénération des PDFs par lots
+    BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+    BATCH_UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", "2"))
+    BATCH_MAX_TICKETS = int(os.getenv("BATCH_MAX_TICKETS", "1000"))
+    BATCH_DIR = os.getenv("BATCH_DIR", "/tmp/zammad-workflows-batches")
+
+    # Métriques Prometheus partagées entre les workers (vide = par process)
+    METRICS_DIR = os.getenv("METRICS_DIR", "/tmp/zammad-workflows-metrics")
+    METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "2"))
+
     # Configuration Mails (correction et paramètres SMTP)
     MAIL_FROM = os.getenv("MAIL_FROM", "")
     SMTP_HOST = os.getenv("SMTP_HOST", "")
@@ -28,6 +144,16 @@ class Config:
     SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
     SMTP_RECIPIENTS = os.getenv("SMTP_RECIPIENTS", "").split(",")
     SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "True").lower() == "true"
+    # Connexion sans chiffrement, réservée aux serveurs SMTP de test locaux
+    SMTP_PLAINTEXT = os.getenv("SMTP_PLAINTEXT", "False").lower() == "true"
+    SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+    SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", "60"))
+    SMTP_BATCH_SIZE = int(os.getenv("SMTP_BATCH_SIZE", "10"))
+    # Au-delà de cette taille, l'email donne le lien du ticket au lieu du PDF
+    # joint (0 = toujours joindre le PDF)
+    EMAIL_ATTACHMENT_MAX_BYTES = int(
+        os.getenv("EMAIL_ATTACHMENT_MAX_BYTES", "10485760")
+    )
 
     @classmethod
     def validate(cls):
@@ -35,8 +161,6 @@ class Config:
         required_vars = [
             ("ZAMMAD_API_URL", cls.ZAMMAD_API_URL),
             ("ZAMMAD_API_TOKEN", cls.ZAMMAD_API_TOKEN),
-            ("WEBHOOK_USERNAME", cls.WEBHOOK_USERNAME),
-            ("WEBHOOK_PASSWORD", cls.WEBHOOK_PASSWORD),
             ("MAIL_FROM", cls.MAIL_FROM),
             ("SMTP_HOST", cls.SMTP_HOST),
             ("SMTP_PORT", cls.SMTP_PORT),
@@ -44,6 +168,11 @@ class Config:
             ("SMTP_PASSWORD", cls.SMTP_PASSWORD),
             ("SMTP_RECIPIENTS", cls.SMTP_RECIPIENTS),
         ]
+        if not cls.WEBHOOK_CREDENTIALS:
+            required_vars += [
+                ("WEBHOOK_USERNAME", cls.WEBHOOK_USERNAME),
+                ("WEBHOOK_PASSWORD", cls.WEBHOOK_PASSWORD),
+            ]
 
         missing_vars = []
         for var_name, var_value in required_vars:
@@ -55,4 +184,22 @@ class Config:
                 f"Variables d'environnement manquantes: {', '.join(missing_vars)}"
             )
 
+        # Un mot de passe commençant par "sha256:" est toujours lu comme une
+        # empreinte : une valeur mal formée est refusée dès le démarrage
+        secrets = [("WEBHOOK_PASSWORD", cls.WEBHOOK_PASSWORD)]
+        for entry in cls.WEBHOOK_CREDENTIALS.split(","):
+            user, _, secret = entry.strip().partition(":")
+            secrets.append((f"WEBHOOK_CREDENTIALS ({user})", secret))
+        invalid_digests = [
+            name
+            for name, secret in secrets
+            if secret.startswith("sha256:")
+            and not re.fullmatch(r"[0-9a-fA-F]{64}", secret.removeprefix("sha256:"))
+        ]
+        if invalid_digests:
+            raise ValueError(
+                "Empreinte sha256 invalide (64 caractères hexadécimaux attendus): "
+                f"{', '.join(invalid_digests)}"
+            )
+
         return True
@@ -0,0 +1,45 @@
+"""
+Configuration gunicorn, lue automatiquement depuis le répertoire courant
+
+Par défaut, l'application est chargée une seule fois dans le master
+(GUNICORN_PRELOAD) puis préchauffée par le rendu d'un PDF factice
+(STARTUP_WARMUP) : les workers forkés partagent modules, polices, styles et
+templates par copie à l'écriture et démarrent sans réimporter ReportLab.
+Chaque process affiche son temps de démarrage et sa mémoire (`[startup]`).
+"""
+
+import gc
+import sys
+
+from config import Config
+from services import startup
+
+preload_app = Config.GUNICORN_PRELOAD
+
+
+def when_ready(server):
+    """Master : application chargée (--preload), avant le premier fork"""
+    warm_up_seconds = None
+    if server.cfg.preload_app:
+        if Config.STARTUP_WARMUP:
+            # Le pool de rendu n'est démarré que dans les workers : ses process
+            # et ses pipes ne doivent pas être hérités
+            warm_up_seconds = startup.warm_up(pool=False)
+        # Les objets du master sont exclus du ramasse-miettes : leur parcours
+        # dans les workers copierait les pages partagées
+        gc.freeze()
+    startup.report("master", warm_up_seconds)
+
+
+def post_worker_init(worker):
+    """Worker : application chargée, avant d'accepter des connexions"""
+    warm_up_seconds = None
+    if Config.STARTUP_WARMUP:
+        # Avec --preload, le rendu en process a déjà eu lieu dans le master
+        warm_up_seconds = startup.warm_up(in_process=not worker.cfg.preload_app)
+    # Application Flask (server.py) : les jobs persistés (JOB_QUEUE_DB) d'un
+    # worker arrêté sont rejoués dès maintenant, sans attendre un webhook
+    server_module = sys.modules.get("server")
+    if server_module is not None:
+        server_module.job_queue.start()
+    startup.report("worker", warm_up_seconds)
@@ -1,75 +1,229 @@
-import threading
-from flask import Flask, request, jsonify
+import time
+
+from flask import Flask, Response, request, jsonify
+from werkzeug.middleware.proxy_fix import ProxyFix
 from config import Config
-from auth import requires_auth
-from services.pdf import PDFGenerator
+from auth import requires_auth, requires_signature
+from services import metrics
 from services.zammad import ZammadService
-from services.email import EmailService
-
-
-try:
-    Config.validate()
-except ValueError as e:
-    print(f"Erreur de configuration: {e}")
-    exit(1)
+from services.email import EmailService, ticket_link
+from services.batch import BatchStore, parse_batch_request, start_batch
+from services.coalesce import TicketCoalescer, coalescer_metrics
+from services.jobs import JobQueue, JobQueueFull
+from services.outbound import create_outbound_scheduler, render_dead_letters
+from services.pdf_cache import create_pdf_cache
+from services.webhook import generation_requested, may_request_generation
 
 app = Flask(__name__)
+app.config["MAX_CONTENT_LENGTH"] = Config.WEBHOOK_MAX_BYTES or None
+if Config.TRUSTED_PROXY_COUNT > 0:
+    # request.remote_addr devient l'adresse du client (limite des échecs d'auth)
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=Config.TRUSTED_PROXY_COUNT)
 
 zammad_service = ZammadService()
 email_service = EmailService()
+pdf_cache = create_pdf_cache()
+# Écritures vers Zammad : débit limité, réessais et conservation des échecs
+outbound = create_outbound_scheduler(zammad_service)
+batch_store = BatchStore(Config.BATCH_DIR)
+
+
+def background_job(job: dict):
+    """Génère le PDF d'un ticket, l'envoie dans Zammad et par email si demandé"""
+    # Import différé : ReportLab n'est chargé qu'au premier job (ou au
+    # préchauffage, voir services/startup.py)
+    from services.pdf import PDFGenerator  # pylint: disable=import-outside-toplevel
+
+    ticket = job["ticket"]
+    ticket_id = ticket.get("id")
+    ticket_number = ticket.get("number", "N/A")
+    pdf_generation_value = ticket.get("pdf_generation")
+
+    if not generation_requested(pdf_generation_value):
+        metrics.JOBS.inc(result="skipped")
+        return
+
+    stage = "set_generation_false"
+    pdf_generator = PDFGenerator(pdf_cache)
+    metrics.JOBS_IN_FLIGHT.inc()
+    try:
+        with metrics.STAGE_SECONDS.time(stage=stage):
+            outbound.set_ticket_generation_false(ticket_id)
+
+        # Les étapes fetch_articles et render sont mesurées par PDFGenerator
+        stage = "pdf"
+        pdf_generator.generate_ticket_pdf(ticket, zammad_service)
+
+        # PDF disponible dans Zammad : l'email peut n'en donner que le lien
+        in_zammad = pdf_generator.unchanged
+        if pdf_generator.unchanged:
+            print(
+                f"[background] PDF inchangé pour ticket {ticket_number}, envoi ignoré"
+            )
+        else:
+            stage = "upload"
+            with metrics.STAGE_SECONDS.time(stage=stage):
+                success_z, response_z = outbound.send_ticket_pdf(
+                    ticket_number, ticket_id, pdf_generator.pdf_file
+                )
+            in_zammad = success_z
+            if not success_z:
+                metrics.JOB_FAILURES.inc(stage=stage)
+                print(
+                    f"[background] Erreur Zammad pour ticket {ticket_number}: {response_z}"
+                )
+            elif pdf_cache:
+                pdf_cache.remember(ticket_id, pdf_generator.fingerprint)
+
+        if pdf_generation_value == "email":
+            # Seule l'écriture du message est mesurée ici, l'envoi est différé
+            stage = "email_queue"
+            with metrics.STAGE_SECONDS.time(stage=stage):
+                email_service.queue_email_with_pdf(
+                    pdf_generator.pdf_file,
+                    filename=f"ticket_{ticket_number}.pdf",
+                    link=ticket_link(ticket_id) if in_zammad else None,
+                )
+
+        metrics.JOBS.inc(result="done")
+
+    except Exception as e:
+        metrics.JOB_FAILURES.inc(stage=stage)
+        metrics.JOBS.inc(result="failed")
+        print(f"[background] Erreur traitement ticket {ticket_number}: {e}")
+    finally:
+        metrics.JOBS_IN_FLIGHT.dec()
+        pdf_generator.close()
+
+
+def coalesced_job(job: dict):
+    """Exécute le job avec le dernier payload reçu pour ce ticket"""
+    if "queued_at" in job:
+        metrics.JOB_QUEUE_WAIT.observe(max(0.0, time.time() - job["queued_at"]))
+    ticket_id = job["ticket"].get("id")
+    job = coalescer.begin(ticket_id, job)
+    try:
+        background_job(job)
+    finally:
+        coalescer.finish(ticket_id)
+
+
+def enqueue_job(job: dict, delay: float = 0.0, force: bool = False) -> int | None:
+    """Ajoute le job dans la file en notant son heure d'échéance"""
+    return job_queue.submit(
+        dict(job, queued_at=time.time() + delay), delay=delay, force=force
+    )
+
+
+def service_metrics() -> list[tuple]:
+    """Expose les compteurs `stats` des services du process courant"""
+    values = [
+        (
+            "zammad_workflows_job_queue_pending",
+            "gauge",
+            "Jobs acceptés et pas encore terminés",
+            {},
+            job_queue.pending,
+        ),
+    ]
+    values += coalescer_metrics(coalescer.stats, coalescer.pending)
+    for event, value in zammad_service.article_cache.stats.items():
+        values.append(
+            (
+                "zammad_workflows_article_cache_total",
+                "counter",
+                "Accès au cache des articles par résultat",
+                {"event": event},
+                value,
+            )
+        )
+    for event, value in email_service.pool.stats.items():
+        values.append(
+            (
+                "zammad_workflows_smtp_connections_total",
+                "counter",
+                "Connexions SMTP du pool par événement",
+                {"event": event},
+                value,
+            )
+        )
+    return values
+
+
+job_queue = JobQueue(
+    coalesced_job,
+    workers=Config.JOB_WORKERS,
+    maxsize=Config.JOB_QUEUE_SIZE,
+    db_path=Config.JOB_QUEUE_DB or None,
+)
+coalescer = TicketCoalescer(
+    enqueue_job, window=Config.WEBHOOK_DEBOUNCE_SECONDS, update=job_queue.update
+)
+metrics.register_collector(service_metrics)
+
+
+def ignored_response():
+    """Réponse à un webhook sans génération de PDF demandée (aucun job créé)"""
+    metrics.WEBHOOKS.inc(result="filtered")
+    return jsonify({"status": "ignored", "message": "Génération PDF non demandée"})
+
+
+@app.errorhandler(413)
+def payload_too_large(_error):
+    """Corps plus grand que WEBHOOK_MAX_BYTES"""
+    if request.path == "/webhook":
+        metrics.WEBHOOKS.inc(result="too_large")
+    return jsonify({"error": "Requête trop volumineuse"}), 413
 
 
 @app.route("/webhook", methods=["POST"])
 @requires_auth
+@requires_signature
 def webhook():
     """Endpoint webhook pour traiter les données Zammad et générer un PDF"""
-    data: dict | None = request.get_json()
-    if not data:
+    # Les mises à jour sans génération demandée sont écartées avant le parsing
+    if not may_request_generation(request.get_data()):
+        return ignored_response()
+
+    data: dict | None = request.get_json(silent=True)
+    if not data or not isinstance(data, dict):
+        metrics.WEBHOOKS.inc(result="invalid")
         return jsonify({"error": "No JSON received"}), 400
 
     ticket = data.get("ticket", {})
 
     ticket_id = ticket.get("id")
-    ticket_number = ticket.get("number", "N/A")
-
-    pdf_generation_value = ticket.get("pdf_generation", "false")
 
     if not ticket_id:
+        metrics.WEBHOOKS.inc(result="invalid")
         return jsonify({"error": "ticket_id manquant"}), 400
 
-    def background_job(ticket, ticket_number, ticket_id):
-        try:
-            if not pdf_generation_value == "false":
-
-                zammad_service.set_ticket_generation_false(ticket_id)
-
-                pdf_generator = PDFGenerator()
+    if not generation_requested(ticket.get("pdf_generation")):
+        return ignored_response()
 
-                pdf_generator.generate_ticket_pdf(ticket, zammad_service)
+    # Un webhook fusionné avec un job prévu n'occupe pas de place : seul un
+    # nouveau job est refusé quand la file est pleine (JobQueueFull)
+    try:
+        scheduled = coalescer.submit(ticket_id, {"ticket": ticket})
+    except JobQueueFull:
+        metrics.WEBHOOKS.inc(result="queue_full")
+        return (
+            jsonify({"error": "File de traitement pleine, réessayez plus tard"}),
+            503,
+            {"Retry-After": "30"},
+        )
 
-                success_z, response_z = zammad_service.send_ticket_pdf(
-                    ticket_number, ticket_id, pdf_generator.pdf_base64
-                )
-                if not success_z:
-                    print(
-                        f"[background] Erreur Zammad pour ticket {ticket_number}: {response_z}"
-                    )
-
-                if pdf_generation_value == "email":
-                    email_service.send_email_with_pdf(
-                        pdf_generator.pdf_bytes,
-                        filename=f"ticket_{ticket_number}.pdf",
-                    )
-
-        except Exception as e:
-            print(f"[background] Erreur traitement ticket {ticket_number}: {e}")
-
-    thread = threading.Thread(
-        target=background_job,
-        args=(ticket, ticket_number, ticket_id),
-        daemon=True,
-    )
-    thread.start()
+    metrics.WEBHOOKS.inc(result="accepted" if scheduled else "coalesced")
+    if not scheduled:
+        return (
+            jsonify(
+                {
+                    "status": "coalesced",
+                    "message": "Traitement déjà prévu pour ce ticket",
+                }
+            ),
+            202,
+        )
 
     return (
         jsonify(
@@ -79,5 +233,51 @@ def webhook():
     )
 
 
+@app.route("/batch", methods=["POST"])
+@requires_auth
+def batch():
+    """Lance la régénération des PDFs d'un lot de tickets"""
+    success, arguments = parse_batch_request(request.get_json(silent=True))
+    if not success:
+        return jsonify(arguments), 400
+
+    batch_run = start_batch(
+        zammad_service,
+        batch_store,
+        pdf_cache=pdf_cache,
+        email_service=email_service,
+        outbound=outbound,
+        **arguments,
+    )
+    return (
+        jsonify({"id": batch_run.id, "status_url": f"/batch/{batch_run.id}"}),
+        202,
+    )
+
+
+@app.route("/batch/<batch_id>", methods=["GET"])
+@requires_auth
+def batch_status(batch_id: str):
+    """Avancement et résultats par ticket d'un lot"""
+    summary = batch_store.load(batch_id)
+    if summary is None:
+        return jsonify({"error": "Lot inconnu"}), 404
+    return jsonify(summary)
+
+
+@app.route("/metrics", methods=["GET"])
+@requires_auth
+def metrics_endpoint():
+    """Métriques Prometheus agrégées de tous les workers"""
+    body = metrics.render() + render_dead_letters(outbound.dead_letters)
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
+    try:
+        Config.validate()
+    except ValueError as e:
+        print(f"Erreur de configuration: {e}")
+        exit(1)
+    job_queue.start()
     app.run(debug=Config.DEBUG, port=Config.PORT)
@@ -0,0 +1,110 @@
+import asyncio
+import time
+from typing import BinaryIO
+
+import aiosmtplib
+
+from config import Config
+from services import metrics
+from services.email import write_pdf_message
+
+
+class AsyncEmailService:
+    """
+    Version asyncio de EmailService (aiosmtplib), pour l'entrée ASGI
+
+    Une session SMTP authentifiée est conservée et vérifiée par NOOP avant
+    réutilisation. aiosmtplib attend le message complet : il est relu depuis
+    son fichier temporaire au moment de l'envoi.
+    """
+
+    def __init__(self):
+        self.smtp_host = Config.SMTP_HOST
+        self.smtp_port = Config.SMTP_PORT
+        self.username = Config.SMTP_USERNAME
+        self.password = Config.SMTP_PASSWORD
+        self.use_tls = Config.SMTP_USE_TLS
+        self.recipients = Config.SMTP_RECIPIENTS
+        self.idle_timeout = Config.SMTP_IDLE_TIMEOUT
+        self._smtp: aiosmtplib.SMTP | None = None
+        self._last_used = 0.0
+        self._lock = asyncio.Lock()
+        self.stats = {"connections": 0, "reuses": 0, "failures": 0}
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        if Config.SMTP_PLAINTEXT:
+            smtp = aiosmtplib.SMTP(
+                hostname=self.smtp_host, port=self.smtp_port, start_tls=False
+            )
+        elif self.use_tls:
+            smtp = aiosmtplib.SMTP(
+                hostname=self.smtp_host, port=self.smtp_port, start_tls=True
+            )
+        else:
+            smtp = aiosmtplib.SMTP(
+                hostname=self.smtp_host, port=self.smtp_port, use_tls=True
+            )
+        await smtp.connect(timeout=30)
+        await smtp.login(self.username, self.password)
+        self.stats["connections"] += 1
+        return smtp
+
+    async def _session(self) -> aiosmtplib.SMTP:
+        if self._smtp is not None:
+            if time.monotonic() - self._last_used < self.idle_timeout:
+                try:
+                    await self._smtp.noop()
+                    self.stats["reuses"] += 1
+                    return self._smtp
+                except aiosmtplib.SMTPException:
+                    pass
+            await self._close()
+        self._smtp = await self._connect()
+        return self._smtp
+
+    async def _close(self):
+        smtp, self._smtp = self._smtp, None
+        if smtp is None:
+            return
+        try:
+            await smtp.quit()
+        except aiosmtplib.SMTPException:
+            smtp.close()
+
+    async def send_email_with_pdf(
+        self,
+        pdf: bytes | BinaryIO,
+        filename: str = "document.pdf",
+        link: str | None = None,
+    ):
+        message_file = await asyncio.to_thread(
+            write_pdf_message, self.username, self.recipients, pdf, filename, link
+        )
+        try:
+            message = message_file.read()
+        finally:
+            message_file.close()
+
+        async with self._lock:
+            start = time.perf_counter()
+            sent = False
+            try:
+                for attempt in range(2):
+                    try:
+                        smtp = await self._session()
+                        await smtp.sendmail(self.username, self.recipients, message)
+                        self._last_used = time.monotonic()
+                        sent = True
+                        return
+                    except aiosmtplib.SMTPServerDisconnected:
+                        self.stats["failures"] += 1
+                        await self._close()
+                        if attempt == 1:
+                            raise
+            finally:
+                metrics.EMAIL_SECONDS.observe(time.perf_counter() - start)
+                metrics.EMAILS.inc(result="sent" if sent else "failed")
+
+    async def aclose(self):
+        async with self._lock:
+            await self._close()
@@ -0,0 +1,250 @@
+import asyncio
+import json
+import time
+from typing import AsyncIterator, BinaryIO
+
+import httpx
+
+from config import Config
+from services import metrics
+from services.cache import ArticleCache, create_article_cache
+from services.streams import base64_length, file_size, iter_base64
+
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class AsyncZammadService:
+    """Version asyncio de ZammadService (httpx), pour l'entrée ASGI"""
+
+    def __init__(self, article_cache: ArticleCache | None = None):
+        self.api_url = Config.ZAMMAD_API_URL
+        self.api_token = Config.ZAMMAD_API_TOKEN
+        self.headers = {
+            "Authorization": f"Token token={self.api_token}",
+            "Content-Type": "application/json",
+        }
+        self.fetch_concurrency = max(1, Config.ZAMMAD_FETCH_CONCURRENCY)
+        self._bulk_articles_supported = True
+        self.article_cache = article_cache or create_article_cache()
+        self.client = httpx.AsyncClient(
+            headers=self.headers,
+            timeout=30,
+            limits=httpx.Limits(
+                max_connections=Config.ZAMMAD_POOL_SIZE,
+                max_keepalive_connections=Config.ZAMMAD_POOL_SIZE,
+            ),
+            transport=httpx.AsyncHTTPTransport(retries=Config.ZAMMAD_RETRIES),
+        )
+        self.stats: dict[str, dict] = {}
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def _request(self, name: str, method: str, path: str, **kwargs):
+        """
+        Exécute une requête et enregistre sa latence
+
+        Les lectures sont rejouées avec un backoff exponentiel sur les réponses
+        429/5xx ; les écritures sont réessayées par l'ordonnanceur
+        (services/outbound.py). Les erreurs de connexion sont rejouées par le
+        transport httpx.
+        """
+        attempts = Config.ZAMMAD_RETRIES + 1 if method == "GET" else 1
+        start = time.perf_counter()
+        failed = True
+        try:
+            for attempt in range(attempts):
+                response = await self.client.request(
+                    method, f"{self.api_url}{path}", **kwargs
+                )
+                if (
+                    response.status_code not in _RETRY_STATUSES
+                    or attempt == attempts - 1
+                ):
+                    break
+                await asyncio.sleep(Config.ZAMMAD_RETRY_BACKOFF * 2**attempt)
+            failed = response.status_code >= 400
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.ZAMMAD_REQUEST_SECONDS.observe(elapsed, call=name)
+            if failed:
+                metrics.ZAMMAD_REQUEST_ERRORS.inc(call=name)
+            stat = self.stats.setdefault(
+                name,
+                {"calls": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0},
+            )
+            stat["calls"] += 1
+            stat["errors"] += int(failed)
+            stat["total_seconds"] += elapsed
+            stat["max_seconds"] = max(stat["max_seconds"], elapsed)
+
+    async def _stream_json_body(
+        self, prefix: bytes, pdf: BinaryIO, suffix: bytes
+    ) -> AsyncIterator[bytes]:
+        yield prefix
+        for chunk in iter_base64(pdf):
+            yield chunk
+        yield suffix
+
+    async def _create_article_with_attachment(
+        self, ticket_id, subject, body, filename, pdf: BinaryIO
+    ):
+        """Crée un article avec le PDF en pièce jointe, encodé en base64 en flux"""
+        placeholder = "__BASE64_STREAM__"
+        payload = {
+            "ticket_id": ticket_id,
+            "subject": subject,
+            "body": body,
+            "content_type": "text/plain",
+            "attachments": [
+                {
+                    "filename": filename,
+                    "data": placeholder,
+                    "mime-type": "application/pdf",
+                }
+            ],
+        }
+        prefix, suffix = json.dumps(payload).split(f'"{placeholder}"')
+        prefix, suffix = (prefix + '"').encode(), ('"' + suffix).encode()
+        length = len(prefix) + base64_length(file_size(pdf)) + len(suffix)
+
+        try:
+            response = await self._request(
+                "create_article",
+                "POST",
+                "/ticket_articles",
+                content=self._stream_json_body(prefix, pdf, suffix),
+                headers={"Content-Length": str(length)},
+            )
+
+            if response.status_code in [200, 201]:
+                metrics.UPLOADED_BYTES.inc(length)
+                return True, {
+                    "message": "PDF envoyé dans Zammad",
+                    "response": response.json(),
+                }
+            return False, {
+                "error": response.text,
+                "status_code": response.status_code,
+            }
+
+        except httpx.HTTPError as e:
+            return False, {
+                "error": f"Erreur de connexion: {str(e)}",
+                # Connexion impossible : Zammad n'a pas reçu la requête
+                "not_sent": isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)),
+            }
+
+    async def send_ticket_pdf(self, ticket_number, ticket_id, pdf: BinaryIO):
+        subject = f"PDF du ticket #{ticket_number}"
+        body = "Voici le PDF généré automatiquement depuis le webhook."
+        filename = f"ticket_{ticket_number}.pdf"
+
+        return await self._create_article_with_attachment(
+            ticket_id, subject, body, filename, pdf
+        )
+
+    async def set_ticket_generation_false(self, ticket_id):
+        try:
+            response = await self._request(
+                "set_ticket_generation_false",
+                "PUT",
+                f"/tickets/{ticket_id}",
+                json={"pdf_generation": "false"},
+            )
+
+            if response.status_code in [200, 201]:
+                return True, {
+                    "message": "Etat pdf_generation mis à jour dans Zammad",
+                    "response": response.json(),
+                }
+            return False, {
+                "error": response.text,
+                "status_code": response.status_code,
+            }
+
+        except httpx.HTTPError as e:
+            return False, {
+                "error": f"Erreur de connexion: {str(e)}",
+                # Connexion impossible : Zammad n'a pas reçu la requête
+                "not_sent": isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)),
+            }
+
+    async def get_article_by_id(self, article_id: int):
+        cached = self.article_cache.get(article_id)
+        if cached is not None:
+            return cached
+
+        try:
+            response = await self._request(
+                "get_article", "GET", f"/ticket_articles/{article_id}"
+            )
+
+            if response.status_code in [200, 201]:
+                article = response.json()
+                self.article_cache.set(article)
+                return article
+            return {
+                "error": response.text,
+                "status_code": response.status_code,
+            }
+
+        except httpx.HTTPError as e:
+            return {"error": f"Erreur de connexion: {str(e)}"}
+
+    async def _get_articles_by_ticket(self, ticket_id: int):
+        if not self._bulk_articles_supported:
+            return None
+
+        try:
+            response = await self._request(
+                "get_ticket_articles", "GET", f"/ticket_articles/by_ticket/{ticket_id}"
+            )
+        except httpx.HTTPError:
+            return None
+
+        if response.status_code in [200, 201]:
+            return response.json()
+        if response.status_code in [404, 405, 501]:
+            self._bulk_articles_supported = False
+        return None
+
+    async def get_ticket_articles(self, ticket_id: int, article_ids: list[int]):
+        """Même stratégie que ZammadService.get_ticket_articles, en asyncio"""
+        articles = []
+        missing_ids = []
+        for article_id in article_ids:
+            cached = self.article_cache.get(article_id)
+            if cached is not None:
+                articles.append(cached)
+            else:
+                missing_ids.append(article_id)
+
+        fetched = None
+        if not article_ids or len(missing_ids) > self.fetch_concurrency:
+            fetched = await self._get_articles_by_ticket(ticket_id)
+            if fetched is not None:
+                for article in fetched:
+                    self.article_cache.set(article)
+                if article_ids:
+                    wanted = set(missing_ids)
+                    fetched = [
+                        article for article in fetched if article.get("id") in wanted
+                    ]
+
+        if fetched is None and missing_ids:
+            semaphore = asyncio.Semaphore(self.fetch_concurrency)
+
+            async def fetch(article_id):
+                async with semaphore:
+                    return await self.get_article_by_id(article_id)
+
+            fetched = await asyncio.gather(*(fetch(i) for i in missing_ids))
+
+        articles.extend(fetched or [])
+        articles = [
+            article for article in articles if article and "error" not in article
+        ]
+        articles.sort(key=lambda x: x.get("created_at", ""))
+        return articles
@@ -0,0 +1,385 @@
+"""
+Régénération des PDFs d'un lot de tickets
+
+Les tickets sont désignés par leurs IDs ou par une recherche Zammad. Chaque
+ticket est récupéré, rendu (dans le pool de process si PDF_RENDER_PROCESSES
+est activé) puis envoyé dans Zammad, avec au plus BATCH_UPLOAD_CONCURRENCY
+envois simultanés. L'avancement est écrit dans BATCH_DIR/<id>.json pour être
+lisible depuis n'importe quel worker.
+
+Usage en ligne de commande :
+    python -m services.batch --ids 123 124 125
+    python -m services.batch --query "state.name:closed AND group.name:BDE" --limit 500
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from config import Config
+from services import metrics
+from services.email import EmailService, ticket_link
+from services.outbound import (
+    PRIORITY_BATCH,
+    OutboundScheduler,
+    create_outbound_scheduler,
+)
+from services.pdf_cache import PDFCache, create_pdf_cache
+from services.zammad import ZammadService
+
+BATCH_TICKETS = metrics.counter(
+    "zammad_workflows_batch_tickets_total", "Tickets traités en lot par résultat"
+)
+
+
+class BatchRun:
+    """
+    Traitement d'un lot de tickets
+
+    `results` contient une entrée par ticket terminé : `ticket_id`, `number`,
+    `status` (`uploaded`, `unchanged` ou `error`), `pdf_size`, `seconds` et
+    éventuellement `error`.
+    """
+
+    def __init__(
+        self,
+        zammad: ZammadService,
+        pdf_cache: PDFCache | None = None,
+        email_service: EmailService | None = None,
+        workers: int = 4,
+        upload_concurrency: int = 2,
+        force: bool = False,
+        progress: Callable[["BatchRun", dict], None] | None = None,
+        outbound: OutboundScheduler | None = None,
+    ):
+        self.id = uuid.uuid4().hex
+        self.zammad = zammad
+        self.pdf_cache = pdf_cache
+        self.email_service = email_service
+        self.workers = max(1, workers)
+        self.force = force
+        self.progress = progress
+        # Les envois passent après ceux des webhooks (PRIORITY_BATCH)
+        self.outbound = outbound
+        self._uploads = threading.Semaphore(max(1, upload_concurrency))
+        self._lock = threading.Lock()
+        self.state = "pending"
+        self.total = 0
+        self.results: list[dict] = []
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.error: str | None = None
+
+    def summary(self) -> dict:
+        """État du lot sérialisable en JSON"""
+        with self._lock:
+            counts: dict[str, int] = {}
+            for result in self.results:
+                counts[result["status"]] = counts.get(result["status"], 0) + 1
+            return {
+                "id": self.id,
+                "state": self.state,
+                "total": self.total,
+                "done": len(self.results),
+                "counts": counts,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "error": self.error,
+                "results": list(self.results),
+            }
+
+    def resolve_tickets(
+        self, ticket_ids: list[int] | None = None, query: str | None = None, limit=100
+    ) -> list[dict]:
+        """
+        Récupère les tickets à traiter, au format du payload webhook
+
+        Raises:
+            ValueError: si la recherche échoue
+        """
+        if query:
+            success, data = self.zammad.search_tickets(query, limit=limit)
+            if not success:
+                raise ValueError(f"Recherche Zammad impossible: {data}")
+            tickets = data
+        else:
+            with ThreadPoolExecutor(
+                max_workers=self.zammad.fetch_concurrency
+            ) as executor:
+                tickets = list(executor.map(self.zammad.get_ticket, ticket_ids or []))
+            for ticket_id, ticket in zip(ticket_ids or [], tickets):
+                if "error" in ticket:
+                    ticket.setdefault("id", ticket_id)
+        return [
+            ticket if "error" in ticket else self.zammad.as_webhook_ticket(ticket)
+            for ticket in tickets
+        ]
+
+    def run(self, tickets: list[dict], email: bool = False) -> list[dict]:
+        """Traite les tickets et renvoie les résultats dans l'ordre de fin"""
+        self.total = len(tickets)
+        self.state = "running"
+        self.started_at = time.time()
+        try:
+            with ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="batch"
+            ) as executor:
+                for ticket in tickets:
+                    executor.submit(self._process, ticket, email)
+        finally:
+            self.finished_at = time.time()
+            self.state = "finished"
+            if self.progress:
+                self.progress(self, None)
+        return self.results
+
+    def _process(self, ticket: dict, email: bool):
+        # Import différé : importer ce module (server.py) ne charge pas ReportLab
+        from services.pdf import PDFGenerator  # pylint: disable=import-outside-toplevel
+
+        start = time.perf_counter()
+        result = {
+            "ticket_id": ticket.get("id"),
+            "number": ticket.get("number"),
+            "status": "error",
+            "pdf_size": 0,
+        }
+        pdf_generator = PDFGenerator(None if self.force else self.pdf_cache)
+        try:
+            if "error" in ticket:
+                raise ValueError(ticket["error"])
+
+            pdf_generator.generate_ticket_pdf(ticket, self.zammad)
+            result["pdf_size"] = pdf_generator.pdf_size
+
+            if pdf_generator.unchanged:
+                result["status"] = "unchanged"
+            else:
+                with self._uploads, metrics.STAGE_SECONDS.time(stage="upload"):
+                    if self.outbound:
+                        success, response = self.outbound.send_ticket_pdf(
+                            ticket.get("number", "N/A"),
+                            ticket["id"],
+                            pdf_generator.pdf_file,
+                            priority=PRIORITY_BATCH,
+                        )
+                    else:
+                        success, response = self.zammad.send_ticket_pdf(
+                            ticket.get("number", "N/A"),
+                            ticket["id"],
+                            pdf_generator.pdf_file,
+                        )
+                if not success:
+                    raise ValueError(response.get("error"))
+                result["status"] = "uploaded"
+                if self.pdf_cache:
+                    if self.force:
+                        self.pdf_cache.store(
+                            pdf_generator.fingerprint, pdf_generator.pdf_file
+                        )
+                    self.pdf_cache.remember(ticket["id"], pdf_generator.fingerprint)
+
+            if email and self.email_service:
+                # Le PDF est dans Zammad (envoyé ou inchangé)
+                self.email_service.queue_email_with_pdf(
+                    pdf_generator.pdf_file,
+                    filename=f"ticket_{ticket.get('number', 'N/A')}.pdf",
+                    link=ticket_link(ticket["id"]),
+                )
+
+        except Exception as e:  # pylint: disable=broad-except
+            result["error"] = str(e)
+            print(f"[batch] Erreur traitement ticket {ticket.get('id')}: {e}")
+        finally:
+            pdf_generator.close()
+
+        result["seconds"] = round(time.perf_counter() - start, 3)
+        BATCH_TICKETS.inc(result=result["status"])
+        with self._lock:
+            self.results.append(result)
+        if self.progress:
+            self.progress(self, result)
+
+
+class BatchStore:
+    """État des lots dans BATCH_DIR, partagé entre les workers"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, batch_id: str) -> str:
+        return os.path.join(self.directory, f"{batch_id}.json")
+
+    def save(self, batch: BatchRun):
+        # Sérialisé pour qu'un état ancien n'écrase pas un état plus récent
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+                json.dump(batch.summary(), tmp_file)
+            os.replace(tmp_path, self._path(batch.id))
+
+    def load(self, batch_id: str) -> dict | None:
+        if not batch_id.isalnum():
+            return None
+        try:
+            with open(self._path(batch_id), encoding="utf-8") as batch_file:
+                return json.load(batch_file)
+        except (OSError, ValueError):
+            return None
+
+
+def parse_batch_request(data) -> tuple[bool, dict]:
+    """
+    Valide le corps JSON d'une demande de lot
+
+    Returns:
+        tuple: (success: bool, arguments de start_batch | {"error": ...})
+    """
+    if not isinstance(data, dict):
+        return False, {"error": "No JSON received"}
+
+    ticket_ids = data.get("ticket_ids")
+    query = data.get("query")
+    if bool(ticket_ids) == bool(query):
+        return False, {"error": "Indiquez soit ticket_ids, soit query"}
+    if ticket_ids is not None and (
+        not isinstance(ticket_ids, list)
+        or not all(isinstance(ticket_id, int) for ticket_id in ticket_ids)
+    ):
+        return False, {"error": "ticket_ids doit être une liste d'entiers"}
+    if query is not None and not isinstance(query, str):
+        return False, {"error": "query doit être une chaîne"}
+
+    limit = data.get("limit", 100)
+    if not isinstance(limit, int) or limit < 1:
+        return False, {"error": "limit doit être un entier positif"}
+    if len(ticket_ids or []) > Config.BATCH_MAX_TICKETS or (
+        query and limit > Config.BATCH_MAX_TICKETS
+    ):
+        return False, {"error": f"Au plus {Config.BATCH_MAX_TICKETS} tickets par lot"}
+
+    return True, {
+        "ticket_ids": ticket_ids,
+        "query": query,
+        "limit": limit,
+        "email": bool(data.get("email", False)),
+        "force": bool(data.get("force", False)),
+    }
+
+
+def start_batch(
+    zammad: ZammadService,
+    store: BatchStore,
+    ticket_ids: list[int] | None = None,
+    query: str | None = None,
+    limit: int = 100,
+    email: bool = False,
+    force: bool = False,
+    pdf_cache: PDFCache | None = None,
+    email_service: EmailService | None = None,
+    outbound: OutboundScheduler | None = None,
+) -> BatchRun:
+    """Lance un lot dans un thread d'arrière-plan et renvoie son état initial"""
+    batch = BatchRun(
+        zammad,
+        pdf_cache=pdf_cache,
+        email_service=email_service,
+        workers=Config.BATCH_WORKERS,
+        upload_concurrency=Config.BATCH_UPLOAD_CONCURRENCY,
+        force=force,
+        progress=lambda run, _result: store.save(run),
+        outbound=outbound,
+    )
+    store.save(batch)
+
+    def target():
+        try:
+            tickets = batch.resolve_tickets(ticket_ids, query, limit)
+            batch.run(tickets, email=email)
+        except Exception as e:  # pylint: disable=broad-except
+            batch.error = str(e)
+            batch.state = "failed"
+            store.save(batch)
+            print(f"[batch] Erreur du lot {batch.id}: {e}")
+
+    threading.Thread(target=target, name=f"batch-{batch.id}", daemon=True).start()
+    return batch
+
+
+def _print_progress(batch: BatchRun, result: dict | None):
+    if result is None:
+        return
+    done = len(batch.results)
+    line = f"[{done}/{batch.total}] ticket {result['ticket_id']}: {result['status']}"
+    if "error" in result:
+        line += f" ({result['error']})"
+    print(line, file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--ids", type=int, nargs="+", help="IDs des tickets")
+    target.add_argument("--query", help="recherche Zammad")
+    parser.add_argument("--limit", type=int, default=100, help="tickets au plus")
+    parser.add_argument("--workers", type=int, default=Config.BATCH_WORKERS)
+    parser.add_argument("--uploads", type=int, default=Config.BATCH_UPLOAD_CONCURRENCY)
+    parser.add_argument(
+        "--processes",
+        default="auto",
+        help='process de rendu ("auto" = un par coeur, "0" = dans les threads)',
+    )
+    parser.add_argument("--email", action="store_true", help="envoie aussi les PDFs")
+    parser.add_argument(
+        "--force", action="store_true", help="renvoie même les PDFs inchangés"
+    )
+    parser.add_argument("--json", action="store_true", help="résultats en JSON")
+    args = parser.parse_args()
+
+    if not Config.ZAMMAD_API_URL or not Config.ZAMMAD_API_TOKEN:
+        parser.error("ZAMMAD_API_URL et ZAMMAD_API_TOKEN doivent être définis")
+    Config.PDF_RENDER_PROCESSES = args.processes
+
+    email_service = EmailService() if args.email else None
+    zammad = ZammadService()
+    batch = BatchRun(
+        zammad,
+        pdf_cache=create_pdf_cache(),
+        email_service=email_service,
+        workers=args.workers,
+        upload_concurrency=args.uploads,
+        force=args.force,
+        progress=_print_progress,
+        outbound=create_outbound_scheduler(zammad),
+    )
+    try:
+        tickets = batch.resolve_tickets(args.ids, args.query, args.limit)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    results = batch.run(tickets, email=args.email)
+    if email_service:
+        email_service.join()
+
+    summary = batch.summary()
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(
+            f"{summary['done']}/{summary['total']} tickets en "
+            f"{summary['finished_at'] - summary['started_at']:.1f} s : {summary['counts']}"
+        )
+    sys.exit(1 if any(result["status"] == "error" for result in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
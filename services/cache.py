@@ -0,0 +1,254 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+
+
+class ArticleCache:
+    """Cache des articles Zammad, indexé par ID d'article et `updated_at`"""
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _count(self, name: str, value: int = 1):
+        with self._stats_lock:
+            self.stats[name] += value
+
+    def get(self, article_id: int, updated_at: str | None = None) -> dict | None:
+        """
+        Renvoie l'article en cache, ou None s'il est absent, expiré ou si sa
+        date de mise à jour ne correspond pas à `updated_at`
+        """
+        article = self._get(article_id)
+        if article is not None and (
+            updated_at is None or article.get("updated_at") == updated_at
+        ):
+            self._count("hits")
+            return article
+        self._count("misses")
+        return None
+
+    def set(self, article: dict):
+        """Ajoute ou remplace un article dans le cache"""
+        if article.get("id") is None:
+            return
+        self._set(article["id"], article)
+
+    def _get(self, article_id: int) -> dict | None:
+        raise NotImplementedError
+
+    def _set(self, article_id: int, article: dict):
+        raise NotImplementedError
+
+
+class NullArticleCache(ArticleCache):
+    """Cache désactivé"""
+
+    def _get(self, article_id):
+        return None
+
+    def _set(self, article_id, article):
+        pass
+
+
+class MemoryArticleCache(ArticleCache):
+    """Cache LRU en mémoire, borné en nombre d'entrées, en taille et en durée"""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size_bytes = 0
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[int, tuple[float, int, dict]] = OrderedDict()
+
+    def _get(self, article_id):
+        with self._lock:
+            entry = self._entries.get(article_id)
+            if entry is None:
+                return None
+            expires_at, size, article = entry
+            if expires_at < time.monotonic():
+                del self._entries[article_id]
+                self.size_bytes -= size
+                self._count("evictions")
+                return None
+            self._entries.move_to_end(article_id)
+            return article
+
+    def _set(self, article_id, article):
+        size = len(json.dumps(article))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(article_id, None)
+            if previous:
+                self.size_bytes -= previous[1]
+            self._entries[article_id] = (time.monotonic() + self.ttl, size, article)
+            self.size_bytes += size
+
+            evicted = 0
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or self.size_bytes > self.max_bytes
+            ):
+                _, (_, old_size, _) = self._entries.popitem(last=False)
+                self.size_bytes -= old_size
+                evicted += 1
+        if evicted:
+            self._count("evictions", evicted)
+
+
+class SQLiteArticleCache(ArticleCache):
+    """
+    Cache partagé entre les workers gunicorn via un fichier SQLite local
+
+    Borné comme le cache mémoire : au-delà de `max_entries` entrées ou de
+    `max_bytes` de payload, les articles les moins récemment lus sont supprimés.
+    """
+
+    def __init__(self, path: str, max_entries: int, max_bytes: int, ttl: float):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path
+        self._lock = threading.Lock()
+        # Connexion ouverte au premier usage dans chaque process (compatible fork)
+        self._conn: sqlite3.Connection | None = None
+        self._conn_pid: int | None = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connexion du process courant (appelé sous self._lock)"""
+        if self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS articles ("
+                " article_id INTEGER PRIMARY KEY,"
+                " expires_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " size INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = [
+                row[1] for row in self._conn.execute("PRAGMA table_info(articles)")
+            ]
+            if "size" not in columns:
+                # Fichier créé avant le plafond en taille
+                self._conn.execute(
+                    "ALTER TABLE articles ADD COLUMN size INTEGER NOT NULL DEFAULT 0"
+                )
+                self._conn.execute("UPDATE articles SET size = length(payload)")
+            self._conn.commit()
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _get(self, article_id):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT payload FROM articles WHERE article_id = ? AND expires_at >= ?",
+                (article_id, now),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE articles SET accessed_at = ? WHERE article_id = ?",
+                (now, article_id),
+            )
+            conn.commit()
+        return json.loads(row[0])
+
+    def _set(self, article_id, article):
+        payload = json.dumps(article)
+        if len(payload) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO articles"
+                " (article_id, expires_at, accessed_at, payload, size)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (article_id, now + self.ttl, now, payload, len(payload)),
+            )
+            # Au-delà du nombre d'entrées ou de la taille cumulée depuis les
+            # articles les plus récemment lus
+            cursor = conn.execute(
+                "DELETE FROM articles WHERE expires_at < ? OR article_id IN ("
+                " SELECT article_id FROM ("
+                "  SELECT article_id,"
+                "   ROW_NUMBER() OVER recent AS position,"
+                "   SUM(size) OVER recent AS total"
+                "  FROM articles"
+                "  WINDOW recent AS (ORDER BY accessed_at DESC, article_id))"
+                " WHERE position > ? OR total > ?)",
+                (now, self.max_entries, self.max_bytes),
+            )
+            conn.commit()
+        if cursor.rowcount > 0:
+            self._count("evictions", cursor.rowcount)
+
+
+class RedisArticleCache(ArticleCache):
+    """
+    Cache partagé via Redis (ou un serveur compatible)
+
+    L'éviction LRU et le plafond mémoire sont gérés par le serveur
+    (`maxmemory` / `maxmemory-policy allkeys-lru`).
+    """
+
+    def __init__(self, url: str, ttl: float):
+        super().__init__()
+        try:
+            import redis  # pylint: disable=import-outside-toplevel
+        except ImportError as e:
+            raise ValueError(
+                "ARTICLE_CACHE_BACKEND=redis nécessite le paquet 'redis'"
+            ) from e
+        self.ttl = int(ttl)
+        self._client = redis.Redis.from_url(url)
+
+    @staticmethod
+    def _key(article_id) -> str:
+        return f"zammad:article:{article_id}"
+
+    def _get(self, article_id):
+        payload = self._client.get(self._key(article_id))
+        return json.loads(payload) if payload else None
+
+    def _set(self, article_id, article):
+        self._client.setex(self._key(article_id), self.ttl, json.dumps(article))
+
+
+def create_article_cache() -> ArticleCache:
+    """Instancie le cache d'articles configuré par ARTICLE_CACHE_BACKEND"""
+    backend = Config.ARTICLE_CACHE_BACKEND.lower()
+    if backend == "memory":
+        return MemoryArticleCache(
+            Config.ARTICLE_CACHE_MAX_ENTRIES,
+            Config.ARTICLE_CACHE_MAX_BYTES,
+            Config.ARTICLE_CACHE_TTL,
+        )
+    if backend == "sqlite":
+        return SQLiteArticleCache(
+            Config.ARTICLE_CACHE_PATH,
+            Config.ARTICLE_CACHE_MAX_ENTRIES,
+            Config.ARTICLE_CACHE_MAX_BYTES,
+            Config.ARTICLE_CACHE_TTL,
+        )
+    if backend == "redis":
+        return RedisArticleCache(
+            Config.ARTICLE_CACHE_REDIS_URL, Config.ARTICLE_CACHE_TTL
+        )
+    if backend in ("", "none"):
+        return NullArticleCache()
+    raise ValueError(f"ARTICLE_CACHE_BACKEND inconnu: {Config.ARTICLE_CACHE_BACKEND}")
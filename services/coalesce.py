@@ -0,0 +1,151 @@
+import threading
+from typing import Callable
+
+
+def coalescer_metrics(stats: dict, pending: int) -> list[tuple]:
+    """
+    Valeurs d'un regroupement pour metrics.register_collector
+
+    Args:
+        stats (dict): compteurs received, coalesced et dispatched
+        pending (int): tickets en attente ou en cours de traitement
+    """
+    values = [
+        (
+            "zammad_workflows_coalescer_pending_tickets",
+            "gauge",
+            "Tickets en attente ou en cours dans le regroupement des webhooks",
+            {},
+            pending,
+        )
+    ]
+    for event, value in stats.items():
+        values.append(
+            (
+                "zammad_workflows_coalescer_webhooks_total",
+                "counter",
+                "Webhooks du regroupement par événement (coalesced = fusionnés)",
+                {"event": event},
+                value,
+            )
+        )
+    return values
+
+
+class TicketCoalescer:
+    """
+    Regroupe les webhooks reçus en rafale pour un même ticket
+
+    Le premier webhook d'un ticket met un job dans la file, différé de
+    `window` secondes : sa place est réservée (et le job persisté) dès la
+    réception, une file pleine est donc signalée immédiatement. Les webhooks
+    suivants remplacent le payload en attente (le dernier reçu gagne) sans
+    créer de nouveau job. Un webhook reçu pendant le traitement provoque un
+    unique nouveau passage une fois le job terminé.
+
+    `dispatch(payload, delay, force)` met le job en file et renvoie son ID
+    persisté (voir JobQueue.submit) ; `update(job_id, payload)` remplace le
+    payload persisté d'un job en attente.
+    """
+
+    def __init__(
+        self,
+        dispatch: Callable[..., int | None],
+        window: float = 0.0,
+        update: Callable[[int | None, dict], None] | None = None,
+    ):
+        self.dispatch = dispatch
+        self.window = window
+        self.update = update
+        self._lock = threading.Lock()
+        self._entries: dict[int, dict] = {}
+        self.stats = {"received": 0, "coalesced": 0, "dispatched": 0}
+
+    def submit(self, ticket_id: int, payload: dict) -> bool:
+        """
+        Enregistre un webhook pour `ticket_id`
+
+        Returns:
+            bool: False si le webhook a été fusionné avec un job déjà prévu
+
+        Raises:
+            JobQueueFull: si la file est pleine
+        """
+        with self._lock:
+            self.stats["received"] += 1
+            entry = self._entries.get(ticket_id)
+            if entry is not None:
+                entry["payload"] = payload
+                if entry["state"] == "running":
+                    entry["rerun"] = True
+                job_id = entry["job_id"] if entry["state"] == "waiting" else None
+                self.stats["coalesced"] += 1
+            else:
+                self._entries[ticket_id] = {
+                    "payload": payload,
+                    "state": "waiting",
+                    "rerun": False,
+                    "job_id": None,
+                }
+
+        if entry is not None:
+            if job_id is not None and self.update:
+                try:
+                    self.update(job_id, payload)
+                except Exception as e:  # pylint: disable=broad-except
+                    # Le dernier payload reste utilisé par ce process
+                    print(f"[coalesce] Payload du ticket {ticket_id} non persisté: {e}")
+            return False
+
+        try:
+            self._dispatch(ticket_id, payload)
+        except Exception:
+            with self._lock:
+                self._entries.pop(ticket_id, None)
+            raise
+        return True
+
+    @property
+    def pending(self) -> int:
+        """Tickets en attente ou en cours de traitement"""
+        with self._lock:
+            return len(self._entries)
+
+    def _dispatch(self, ticket_id: int, payload: dict, force: bool = False):
+        job_id = self.dispatch(payload, self.window, force)
+        with self._lock:
+            entry = self._entries.get(ticket_id)
+            if entry is not None:
+                entry["job_id"] = job_id
+            self.stats["dispatched"] += 1
+
+    def begin(self, ticket_id: int, payload: dict) -> dict:
+        """Marque le ticket en cours de traitement et renvoie le dernier payload"""
+        with self._lock:
+            entry = self._entries.get(ticket_id)
+            if entry is None:
+                # Job rejoué depuis la file persistante
+                return payload
+            entry["state"] = "running"
+            return entry["payload"]
+
+    def finish(self, ticket_id: int):
+        """Termine le traitement ; relance un job si un webhook est arrivé entre-temps"""
+        with self._lock:
+            entry = self._entries.get(ticket_id)
+            if entry is None:
+                return
+            if not entry["rerun"]:
+                del self._entries[ticket_id]
+                return
+            entry["rerun"] = False
+            entry["state"] = "waiting"
+            entry["job_id"] = None
+            payload = entry["payload"]
+        try:
+            # Le job qui se termine libère sa place : la relance ne la compte pas
+            self._dispatch(ticket_id, payload, force=True)
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"[coalesce] Relance du ticket {ticket_id} impossible: {e}")
+            with self._lock:
+                self._entries.pop(ticket_id, None)
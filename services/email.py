@@ -1,12 +1,204 @@
+import io
+import queue
 import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from typing import BinaryIO
 from email.mime.base import MIMEBase  # pylint: disable=import-error,no-name-in-module
 from email.mime.multipart import (  # pylint: disable=import-error,no-name-in-module
     MIMEMultipart,
 )
 from email.mime.text import MIMEText  # pylint: disable=import-error,no-name-in-module
-from email import encoders  # pylint: disable=import-self
+from email.policy import SMTP  # pylint: disable=import-error,no-name-in-module
 
 from config import Config
+from services import metrics
+from services.streams import file_size, iter_base64_lines, spooled_file
+
+_PDF_PLACEHOLDER = "@@PDF_ATTACHMENT@@"
+# Sessions tentées pour un message mis en file, et délai avant chaque nouvel essai
+SEND_ATTEMPTS = 3
+REQUEUE_DELAY = 5.0
+
+
+def ticket_link(ticket_id: int) -> str:
+    """Adresse du ticket dans l'interface web de Zammad"""
+    web_url = Config.ZAMMAD_WEB_URL or Config.ZAMMAD_API_URL
+    web_url = web_url.rstrip("/").removesuffix("/api/v1")
+    return f"{web_url}/#ticket/zoom/{ticket_id}"
+
+
+def write_pdf_message(
+    sender: str,
+    recipients: list[str],
+    pdf: bytes | BinaryIO,
+    filename: str,
+    link: str | None = None,
+) -> BinaryIO:
+    """
+    Écrit le message MIME complet dans un fichier temporaire
+
+    Les en-têtes et le texte sont produits par le module `email` ; la pièce
+    jointe est encodée en base64 ligne par ligne depuis le fichier du PDF.
+    Si `link` est donné (PDF déjà envoyé dans Zammad) et que le PDF dépasse
+    EMAIL_ATTACHMENT_MAX_BYTES, le message ne contient que ce lien.
+    """
+    message = MIMEMultipart()
+    message["From"] = sender
+    message["To"] = ", ".join(recipients)
+    message["Subject"] = "Notification d'Evenement Automatique"
+
+    pdf_file = io.BytesIO(pdf) if isinstance(pdf, bytes) else pdf
+    size = file_size(pdf_file)
+    if link and 0 < Config.EMAIL_ATTACHMENT_MAX_BYTES < size:
+        metrics.EMAIL_PDFS.inc(mode="link")
+        body = (
+            f"Le document PDF généré automatiquement ({filename}, "
+            f"{size / 2**20:.1f} Mo) est trop volumineux pour être joint. "
+            f"Il est disponible dans le ticket Zammad : {link}"
+        )
+        message.attach(MIMEText(body, "plain"))
+        output = spooled_file()
+        output.write(message.as_bytes(policy=SMTP))
+        output.seek(0)
+        return output
+
+    metrics.EMAIL_PDFS.inc(mode="attached")
+    body = "Vous trouverez en pièce jointe le document PDF généré automatiquement."
+    message.attach(MIMEText(body, "plain"))
+
+    part = MIMEBase("application", "pdf")
+    part["Content-Transfer-Encoding"] = "base64"
+    part.add_header("Content-Disposition", f"attachment; filename={filename}")
+    part.set_payload(_PDF_PLACEHOLDER)
+    message.attach(part)
+
+    head, tail = message.as_bytes(policy=SMTP).split(_PDF_PLACEHOLDER.encode())
+    output = spooled_file()
+    output.write(head)
+    position = pdf_file.tell()
+    for line in iter_base64_lines(pdf_file):
+        output.write(line)
+    pdf_file.seek(position)
+    # Le placeholder est suivi du CRLF de fin de partie
+    output.write(tail.removeprefix(b"\r\n"))
+    output.seek(0)
+    return output
+
+
+class SMTPConnectionPool:
+    """
+    Pool de connexions SMTP authentifiées réutilisées entre les envois
+
+    Une connexion inactive est vérifiée par NOOP avant d'être réutilisée et
+    fermée au-delà de `idle_timeout` secondes.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: str,
+        password: str,
+        use_tls: bool = True,
+        plaintext: bool = False,
+        max_size: int = 2,
+        idle_timeout: float = 60,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.plaintext = plaintext
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._idle: list[tuple[float, smtplib.SMTP]] = []
+        self.stats = {"connections": 0, "reuses": 0, "failures": 0}
+
+    def _connect(self) -> smtplib.SMTP:
+        if self.plaintext or self.use_tls:
+            server = smtplib.SMTP(self.host, self.port, timeout=30)
+        else:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=30)
+        try:
+            if self.use_tls and not self.plaintext:
+                server.starttls()
+            server.login(self.username, self.password)
+        except (smtplib.SMTPException, OSError):
+            self._close(server)
+            raise
+        with self._lock:
+            self.stats["connections"] += 1
+        return server
+
+    @staticmethod
+    def _close(server: smtplib.SMTP):
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    @staticmethod
+    def _is_alive(server: smtplib.SMTP) -> bool:
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def acquire(self) -> smtplib.SMTP:
+        """Renvoie une connexion saine, réutilisée si possible"""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                released_at, server = self._idle.pop()
+            if time.monotonic() - released_at < self.idle_timeout and self._is_alive(
+                server
+            ):
+                with self._lock:
+                    self.stats["reuses"] += 1
+                return server
+            self._close(server)
+        return self._connect()
+
+    def release(self, server: smtplib.SMTP, broken: bool = False):
+        """Rend une connexion au pool, ou la ferme si elle est cassée ou en trop"""
+        if not broken:
+            with self._lock:
+                if len(self._idle) < self.max_size:
+                    self._idle.append((time.monotonic(), server))
+                    return
+        else:
+            with self._lock:
+                self.stats["failures"] += 1
+        self._close(server)
+
+    @contextmanager
+    def connection(self):
+        server = self.acquire()
+        try:
+            yield server
+        except (smtplib.SMTPServerDisconnected, OSError):
+            self.release(server, broken=True)
+            raise
+        except smtplib.SMTPResponseException as e:
+            # Une erreur 4xx/5xx sur un message laisse la session utilisable
+            self.release(server, broken=e.smtp_code == 421)
+            raise
+        except BaseException:
+            self.release(server, broken=True)
+            raise
+        else:
+            self.release(server)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for _, server in idle:
+            self._close(server)
 
 
 class EmailService:
@@ -17,40 +209,243 @@ class EmailService:
         self.password = Config.SMTP_PASSWORD
         self.use_tls = Config.SMTP_USE_TLS
         self.recipients = Config.SMTP_RECIPIENTS
+        self.batch_size = max(1, Config.SMTP_BATCH_SIZE)
+        self.pool = SMTPConnectionPool(
+            self.smtp_host,
+            self.smtp_port,
+            self.username,
+            self.password,
+            use_tls=self.use_tls,
+            plaintext=Config.SMTP_PLAINTEXT,
+            max_size=Config.SMTP_POOL_SIZE,
+            idle_timeout=Config.SMTP_IDLE_TIMEOUT,
+        )
+        self._queue: queue.Queue = queue.Queue()
+        self._sender: threading.Thread | None = None
+        self._sender_lock = threading.Lock()
+        # Renvois différés (échéance, email), propres au thread d'envoi
+        self._retries: list[tuple[float, tuple]] = []
+
+    def _write_message(
+        self, pdf: bytes | BinaryIO, filename: str, link: str | None = None
+    ) -> BinaryIO:
+        return write_pdf_message(self.username, self.recipients, pdf, filename, link)
+
+    def _sendmail_stream(self, server: smtplib.SMTP, message_file: BinaryIO):
+        """
+        Équivalent de `sendmail` qui envoie le message DATA en flux
+
+        Un refus laisse la transaction ouverte : l'appelant envoie RSET.
+        """
+        server.ehlo_or_helo_if_needed()
+        code, response = server.mail(self.username)
+        if code != 250:
+            raise smtplib.SMTPSenderRefused(code, response, self.username)
+
+        refused = {}
+        for recipient in self.recipients:
+            code, response = server.rcpt(recipient)
+            if code not in (250, 251):
+                refused[recipient] = (code, response)
+        if len(refused) == len(self.recipients):
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+        code, response = server.docmd("DATA")
+        if code != 354:
+            raise smtplib.SMTPDataError(code, response)
+        message_file.seek(0)
+        for line in message_file:
+            if line.startswith(b"."):
+                line = b"." + line
+            server.send(line)
+        server.send(b".\r\n")
+        code, response = server.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, response)
+
+    def _send_messages(
+        self, messages: list[BinaryIO]
+    ) -> tuple[list[Exception], list[BinaryIO]]:
+        """
+        Envoie plusieurs messages sur une même session SMTP
+
+        Un message refusé (réponse 4xx/5xx) est compté en échec : la
+        transaction est annulée (RSET) et l'envoi continue sur la même
+        session. En cas de déconnexion (ou de réponse 421), la session est
+        rouverte une fois et l'envoi reprend au message interrompu. Une
+        session refusée (connexion, STARTTLS, authentification) n'est pas
+        retentée : les messages restants sont rendus non envoyés.
+
+        Returns:
+            tuple: (erreurs, messages non envoyés). Les messages envoyés ou
+            refusés sont fermés ; ceux que la perte de la session a empêché
+            d'envoyer restent ouverts, à remettre en file ou à fermer par
+            l'appelant (la dernière erreur est alors celle de la session).
+        """
+        index = sent = 0
+        errors: list[Exception] = []
+        start = time.perf_counter()
+        try:
+            for attempt in range(2):
+                try:
+                    with self.pool.connection() as server:
+                        while index < len(messages):
+                            try:
+                                self._sendmail_stream(server, messages[index])
+                            except (
+                                smtplib.SMTPResponseException,
+                                smtplib.SMTPRecipientsRefused,
+                            ) as e:
+                                if getattr(e, "smtp_code", None) == 421:
+                                    # Le serveur ferme la session : message non traité
+                                    raise smtplib.SMTPServerDisconnected(str(e)) from e
+                                index += 1
+                                errors.append(e)
+                                server.rset()
+                                continue
+                            index += 1
+                            sent += 1
+                    return errors, []
+                except OSError as e:
+                    # SMTPException hérite d'OSError : seules une session
+                    # perdue et une erreur réseau justifient une reconnexion
+                    refused = isinstance(e, smtplib.SMTPException) and not isinstance(
+                        e, smtplib.SMTPServerDisconnected
+                    )
+                    if attempt == 1 or refused:
+                        errors.append(e)
+                        return errors, messages[index:]
+        finally:
+            metrics.EMAIL_SECONDS.observe(time.perf_counter() - start)
+            metrics.EMAILS.inc(sent, result="sent")
+            if index > sent:
+                metrics.EMAILS.inc(index - sent, result="failed")
+            for message_file in messages[:index]:
+                message_file.close()
+
+    def _send_now(self, messages: list[BinaryIO]):
+        """Envoi synchrone : lève la dernière erreur si un message n'est pas parti"""
+        errors, unsent = self._send_messages(messages)
+        if unsent:
+            metrics.EMAILS.inc(len(unsent), result="failed")
+            for message_file in unsent:
+                message_file.close()
+        if errors:
+            raise errors[-1]
 
     def send_email_with_pdf(
         self,
-        pdf_bytes: bytes,
+        pdf: bytes | BinaryIO,
         filename: str = "document.pdf",
+        link: str | None = None,
     ):
-        message = MIMEMultipart()
-        message["From"] = self.username
-        message["To"] = ", ".join(self.recipients)
-        message["Subject"] = "Notification d'Evenement Automatique"
+        self._send_now([self._write_message(pdf, filename, link)])
 
-        body = "Vous trouverez en pièce jointe le document PDF généré automatiquement."
-        message.attach(MIMEText(body, "plain"))
+    def send_emails_with_pdfs(self, pdfs: list[tuple[bytes | BinaryIO, str]]):
+        """Envoie plusieurs PDFs (contenu, nom de fichier) sur une seule session"""
+        self._send_now([self._write_message(pdf, filename) for pdf, filename in pdfs])
 
-        part = MIMEBase("application", "pdf")
-        part.set_payload(pdf_bytes)
-        encoders.encode_base64(part)
-        part.add_header("Content-Disposition", f"attachment; filename={filename}")
-        message.attach(part)
+    def queue_email_with_pdf(
+        self,
+        pdf: bytes | BinaryIO,
+        filename: str = "document.pdf",
+        link: str | None = None,
+    ):
+        """
+        Met un email en file d'envoi
 
-        if self.use_tls:
-            with smtplib.SMTP(self.smtp_host, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.username, self.password)
-                server.sendmail(
-                    self.username,
-                    Config.SMTP_RECIPIENTS,
-                    message.as_string(),
+        Le message est écrit immédiatement (le fichier du PDF peut être fermé
+        ensuite). Un thread dédié regroupe les emails en attente (au plus
+        SMTP_BATCH_SIZE) et les envoie sur une même session SMTP. `link` :
+        voir write_pdf_message.
+        """
+        self._queue.put((self._write_message(pdf, filename, link), filename, 0))
+        with self._sender_lock:
+            if self._sender is None or not self._sender.is_alive():
+                self._sender = threading.Thread(
+                    target=self._sender_loop, name="email-sender", daemon=True
                 )
-        else:
-            with smtplib.SMTP_SSL(self.smtp_host, self.smtp_port) as server:
-                server.login(self.username, self.password)
-                server.sendmail(
-                    self.username,
-                    Config.SMTP_RECIPIENTS,
-                    message.as_string(),
+                self._sender.start()
+
+    def _next_batch(self) -> list[tuple]:
+        """Emails à envoyer : renvois arrivés à échéance et emails en file"""
+        while True:
+            now = time.monotonic()
+            batch = [item for due, item in self._retries if due <= now]
+            self._retries = [entry for entry in self._retries if entry[0] > now]
+            if not batch:
+                timeout = min((due for due, _ in self._retries), default=None)
+                try:
+                    batch.append(
+                        self._queue.get(
+                            timeout=None if timeout is None else max(0, timeout - now)
+                        )
+                    )
+                except queue.Empty:
+                    continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            return batch
+
+    def _sender_loop(self):
+        while True:
+            batch = self._next_batch()
+            retried = 0
+            try:
+                errors, unsent = self._send_messages(
+                    [message_file for message_file, _, _ in batch]
                 )
+                for error in errors[: len(errors) - bool(unsent)]:
+                    print(f"[email] Message refusé: {error}")
+                if unsent:
+                    retried = self._requeue(batch, unsent, errors[-1])
+            except Exception as e:  # pylint: disable=broad-except
+                # Le thread d'envoi survit à toute erreur : le lot est perdu
+                open_files = [item[0] for item in batch if not item[0].closed]
+                metrics.EMAILS.inc(len(open_files), result="failed")
+                for message_file in open_files:
+                    message_file.close()
+                filenames = ", ".join(filename for _, filename, _ in batch)
+                print(f"[email] Erreur d'envoi ({filenames}): {e}")
+            finally:
+                # Un email remis en file n'est terminé qu'à son dernier essai
+                for _ in range(len(batch) - retried):
+                    self._queue.task_done()
+
+    def _requeue(
+        self, batch: list[tuple], unsent: list[BinaryIO], error: Exception
+    ) -> int:
+        """
+        Programme le renvoi des messages qu'une session perdue ou refusée a
+        empêché d'envoyer ; renvoie leur nombre
+
+        Le renvoi est différé sans bloquer le thread : les emails mis en file
+        entre-temps partent normalement.
+        """
+        retry, dropped = [], []
+        for message_file, filename, attempt in batch:
+            if message_file not in unsent:
+                continue
+            if attempt + 1 < SEND_ATTEMPTS:
+                retry.append((message_file, filename, attempt + 1))
+            else:
+                dropped.append(filename)
+                message_file.close()
+        if dropped:
+            metrics.EMAILS.inc(len(dropped), result="failed")
+            print(f"[email] Erreur d'envoi ({', '.join(dropped)}): {error}")
+        if retry:
+            print(
+                f"[email] Session SMTP impossible ({error}), "
+                f"{len(retry)} message(s) renvoyé(s) plus tard"
+            )
+            due = time.monotonic() + REQUEUE_DELAY * retry[0][2]
+            self._retries += [(due, item) for item in retry]
+        return len(retry)
+
+    def join(self):
+        """Attend que tous les emails mis en file aient été traités"""
+        self._queue.join()
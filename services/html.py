@@ -0,0 +1,360 @@
+"""
+Conversion du HTML des articles Zammad en paragraphes ReportLab
+
+Le HTML est lu en un seul passage (html.parser, sans construire d'arbre) et
+réduit au balisage accepté par les Paragraph ReportLab : gras, italique,
+souligné, barré, exposant/indice, code, liens et retours à la ligne. Les
+blocs (div, p, li, lignes de tableau...) deviennent des paragraphes séparés.
+Les réponses citées (blockquote, citations Gmail/Outlook/Thunderbird) et les
+signatures (marqueur Zammad `js-signatureMarker`) sont retirées. Les images
+deviennent une mention `[image : alt]`, sauf les images insérées stockées en
+pièces jointes quand PDF_IMAGES les affiche déjà sous l'article. Le résultat
+est borné en nombre de paragraphes et en taille, et mis en cache par article.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from html import escape
+from html.parser import HTMLParser
+
+from config import Config
+
+# Balises en ligne conservées : balise HTML -> (ouverture, fermeture) ReportLab
+_INLINE_TAGS = {
+    "b": ("<b>", "</b>"),
+    "strong": ("<b>", "</b>"),
+    "i": ("<i>", "</i>"),
+    "em": ("<i>", "</i>"),
+    "u": ("<u>", "</u>"),
+    "ins": ("<u>", "</u>"),
+    "s": ("<strike>", "</strike>"),
+    "strike": ("<strike>", "</strike>"),
+    "del": ("<strike>", "</strike>"),
+    "sup": ("<super>", "</super>"),
+    "sub": ("<sub>", "</sub>"),
+    "code": ('<font face="Courier">', "</font>"),
+    "tt": ('<font face="Courier">', "</font>"),
+}
+
+_BLOCK_TAGS = {
+    "address", "article", "blockquote", "center", "dd", "div", "dl", "dt",
+    "fieldset", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6",
+    "header", "hr", "li", "main", "nav", "ol", "p", "pre", "section", "table",
+    "tbody", "thead", "tfoot", "tr", "ul",
+}  # fmt: skip
+
+_HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+
+# Contenu jamais affiché
+_SKIPPED_TAGS = {"head", "script", "style", "title", "template", "noscript", "svg"}
+
+_VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link",
+              "meta", "param", "source", "track", "wbr"}  # fmt: skip
+
+# Classes des blocs de citation des principaux clients mail
+_QUOTE_CLASSES = {
+    "gmail_quote",
+    "moz-cite-prefix",
+    "yahoo_quoted",
+    "OutlookMessageHeader",
+}
+
+_SIGNATURE_MARKER = "js-signatureMarker"
+
+# Au-delà, les balises en ligne imbriquées sont ignorées (HTML malformé)
+_MAX_INLINE_DEPTH = 16
+
+_WHITESPACE = re.compile(r"\s+")
+_TRUNCATED = "<i>[…] message tronqué</i>"
+_SAFE_HREF = re.compile(r"^(https?:|mailto:)", re.IGNORECASE)
+# Images insérées stockées par Zammad en pièces jointes de l'article
+_ATTACHMENT_SRC = re.compile(r"^cid:|/api/v1/ticket_attachment/", re.IGNORECASE)
+
+
+class _StopParsing(Exception):
+    """Fin de la conversion : signature atteinte ou taille maximale dépassée"""
+
+
+class _ArticleHTMLParser(HTMLParser):
+    """Convertisseur en flux : produit `paragraphs` au fil du parsing"""
+
+    def __init__(self, max_paragraphs: int, max_paragraph_chars: int, max_chars: int):
+        super().__init__(convert_charrefs=True)
+        self.max_paragraphs = max_paragraphs
+        self.max_paragraph_chars = max_paragraph_chars
+        self.max_chars = max_chars
+        self.paragraphs: list[str] = []
+        self.truncated = False
+        self._parts: list[str] = []
+        self._length = 0
+        self._total = 0
+        # Balises en ligne ouvertes : (balise HTML, ouverture, fermeture)
+        self._open: list[tuple[str, str, str]] = []
+        # Profondeur dans un élément ignoré (script, citation...) et sa balise
+        self._skip_depth = 0
+        self._skip_tag: str | None = None
+        self._pre_depth = 0
+        self._list_depth = 0
+        self._cell_index = 0
+
+    # Construction des paragraphes
+
+    def _append(self, markup: str, length: int):
+        if len(self.paragraphs) >= self.max_paragraphs or self._total >= self.max_chars:
+            self.truncated = True
+            raise _StopParsing()
+        if not self._parts:
+            self._parts.extend(opening for _, opening, _ in self._open)
+        self._parts.append(markup)
+        self._length += length
+        self._total += length
+        if self._length >= self.max_paragraph_chars:
+            self._flush()
+
+    def _flush(self):
+        """Termine le paragraphe courant (les balises ouvertes sont refermées)"""
+        if not self._parts:
+            return
+        markup = "".join(self._parts).strip()
+        while markup.endswith("<br/>"):
+            markup = markup[: -len("<br/>")].rstrip()
+        while markup.startswith("<br/>"):
+            markup = markup[len("<br/>") :].lstrip()
+        closing = "".join(closing for _, _, closing in reversed(self._open))
+        if self._length and markup:
+            self.paragraphs.append(markup + closing)
+        self._parts = []
+        self._length = 0
+
+    def convert(self, body: str) -> list[str]:
+        try:
+            self.feed(body)
+            self.close()
+        except _StopParsing:
+            pass
+        self._flush()
+        if self.truncated:
+            self.paragraphs.append(_TRUNCATED)
+        return self.paragraphs
+
+    # Gestion des balises
+
+    def _starts_skipped_block(self, tag: str, attrs: dict) -> bool:
+        if tag in _SKIPPED_TAGS or tag == "blockquote":
+            return True
+        classes = set((attrs.get("class") or "").split())
+        if classes & _QUOTE_CLASSES:
+            return True
+        # Séparateur de réponse Outlook : <div id="divRplyFwdMsg"> ou appendonsend
+        return attrs.get("id") in ("divRplyFwdMsg", "appendonsend")
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip_depth:
+            if tag == self._skip_tag:
+                self._skip_depth += 1
+            return
+
+        attrs = dict(attrs)
+        if _SIGNATURE_MARKER in (attrs.get("class") or "").split():
+            raise _StopParsing()
+        if self._starts_skipped_block(tag, attrs):
+            if tag not in _VOID_TAGS:
+                self._skip_tag = tag
+                self._skip_depth = 1
+            return
+
+        if tag == "br":
+            self._append("<br/>", 1)
+        elif tag == "img":
+            # Les pièces jointes sont affichées sous l'article (services/images.py)
+            if Config.PDF_IMAGES and _ATTACHMENT_SRC.search(attrs.get("src") or ""):
+                return
+            alt = (attrs.get("alt") or "").strip()
+            label = f"[image : {alt}]" if alt else "[image]"
+            self._append(f"<i>{escape(label)}</i>", len(label))
+        elif tag in _BLOCK_TAGS:
+            self._flush()
+            if tag in ("ul", "ol"):
+                self._list_depth += 1
+            elif tag == "li":
+                bullet = "&nbsp;&nbsp;" * max(0, self._list_depth - 1) + "• "
+                self._append(bullet, 2)
+            elif tag == "tr":
+                self._cell_index = 0
+            elif tag == "pre":
+                self._pre_depth += 1
+            elif tag in _HEADING_TAGS:
+                self._open_inline(tag, "<b>", "</b>")
+        elif tag in ("td", "th"):
+            if self._cell_index:
+                self._append(" | ", 3)
+            self._cell_index += 1
+        elif tag in _INLINE_TAGS:
+            self._open_inline(tag, *_INLINE_TAGS[tag])
+        elif tag == "a":
+            href = attrs.get("href") or ""
+            if _SAFE_HREF.match(href):
+                self._open_inline(
+                    tag, f'<a href="{escape(href)}" color="blue">', "</a>"
+                )
+
+    def _open_inline(self, tag: str, opening: str, closing: str):
+        if len(self._open) >= _MAX_INLINE_DEPTH:
+            return
+        self._open.append((tag, opening, closing))
+        if self._parts:
+            self._parts.append(opening)
+
+    def handle_endtag(self, tag):
+        if self._skip_depth:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if not self._skip_depth:
+                    self._skip_tag = None
+            return
+
+        if tag in _BLOCK_TAGS:
+            if tag in _HEADING_TAGS:
+                self._close_inline(tag)
+            self._flush()
+            if tag in ("ul", "ol"):
+                self._list_depth = max(0, self._list_depth - 1)
+            elif tag == "pre":
+                self._pre_depth = max(0, self._pre_depth - 1)
+        elif tag in _INLINE_TAGS or tag == "a":
+            self._close_inline(tag)
+
+    def _close_inline(self, tag: str):
+        # Balises mal imbriquées : on referme jusqu'à la balise correspondante
+        for index in range(len(self._open) - 1, -1, -1):
+            if self._open[index][0] == tag:
+                closed = self._open[index:]
+                del self._open[index:]
+                if self._parts:
+                    self._parts.extend(closing for _, _, closing in reversed(closed))
+                    # Les balises fermées par erreur sont rouvertes
+                    for reopened in closed[1:]:
+                        self._open.append(reopened)
+                        self._parts.append(reopened[1])
+                else:
+                    self._open.extend(closed[1:])
+                return
+
+    def _append_text(self, text: str, preformatted: bool = False):
+        """Ajoute du texte brut, découpé pour borner la taille des paragraphes"""
+        step = self.max_paragraph_chars
+        for offset in range(0, len(text), step):
+            piece = text[offset : offset + step]
+            markup = escape(piece, quote=False)
+            if preformatted:
+                markup = markup.replace(" ", "&nbsp;")
+            self._append(markup, len(piece))
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if self._pre_depth:
+            for index, line in enumerate(data.split("\n")):
+                if index:
+                    self._append("<br/>", 1)
+                self._append_text(line, preformatted=True)
+            return
+        text = _WHITESPACE.sub(" ", data)
+        if not text.strip() and not self._parts:
+            return
+        self._append_text(text)
+
+    def convert_plain_text(self, text: str) -> list[str]:
+        """Même conversion pour un corps text/plain, sans citations ni signature"""
+        try:
+            for line in text.splitlines():
+                if line.rstrip() == "--":
+                    break
+                if line.lstrip().startswith(">"):
+                    continue
+                if not line.strip():
+                    self._flush()
+                    continue
+                if self._parts:
+                    self._append("<br/>", 1)
+                self._append_text(line)
+        except _StopParsing:
+            pass
+        self._flush()
+        if self.truncated:
+            self.paragraphs.append(_TRUNCATED)
+        return self.paragraphs
+
+
+def html_to_paragraphs(body: str, content_type: str = "text/html") -> list[str]:
+    """
+    Convertit le corps d'un article en paragraphes au balisage ReportLab
+
+    Args:
+        body (str): Corps de l'article
+        content_type (str): `text/html` ou `text/plain`
+
+    Returns:
+        list[str]: Balisage de chaque Paragraph, au plus HTML_MAX_PARAGRAPHS
+    """
+    if not body:
+        return []
+    parser = _ArticleHTMLParser(
+        Config.HTML_MAX_PARAGRAPHS,
+        Config.HTML_MAX_PARAGRAPH_CHARS,
+        Config.HTML_MAX_CHARS,
+    )
+    if content_type == "text/plain":
+        return parser.convert_plain_text(body)
+    return parser.convert(body)
+
+
+class _ParagraphCache:
+    """Cache LRU des paragraphes convertis, par ID d'article"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, list[str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, key: tuple) -> list[str] | None:
+        with self._lock:
+            paragraphs = self._entries.get(key)
+            if paragraphs is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return paragraphs
+
+    def set(self, key: tuple, paragraphs: list[str]):
+        with self._lock:
+            self._entries[key] = paragraphs
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+paragraph_cache = _ParagraphCache(Config.HTML_CACHE_MAX_ENTRIES)
+
+
+def article_paragraphs(article: dict) -> list[str]:
+    """
+    Paragraphes d'un article Zammad, mis en cache par ID
+
+    Les articles ne changent pas une fois créés ; `updated_at` fait partie de
+    la clé pour les rares modifications.
+    """
+    content_type = article.get("content_type") or "text/html"
+    article_id = article.get("id")
+    if article_id is None or Config.HTML_CACHE_MAX_ENTRIES <= 0:
+        return html_to_paragraphs(article.get("body", ""), content_type)
+
+    key = (article_id, article.get("updated_at"))
+    paragraphs = paragraph_cache.get(key)
+    if paragraphs is None:
+        paragraphs = html_to_paragraphs(article.get("body", ""), content_type)
+        paragraph_cache.set(key, paragraphs)
+    return paragraphs
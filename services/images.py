@@ -0,0 +1,308 @@
+"""
+Images jointes aux articles dans les PDFs
+
+Les images jointes aux articles (captures d'écran, affiches, images insérées
+dans le message) sont téléchargées depuis Zammad, réduites à leur taille
+d'affichage (PDF_IMAGE_DPI, borné par le profil PDF_PROFILE) et recompressées avec Pillow dans un pool de
+threads : Pillow libère le GIL pendant le décodage, la réduction et
+l'encodage. Le résultat est mis en cache sur disque par pièce jointe et
+taille cible, une régénération ne retélécharge ni ne retraite les images.
+
+Le nombre d'images et leur taille totale sont bornés par PDF ; les images
+écartées sont remplacées par une mention dans le PDF.
+"""
+
+import io
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+from config import Config
+from services import metrics
+from services.pdf_profiles import get_profile
+
+IMAGES = metrics.counter(
+    "zammad_workflows_pdf_images_total",
+    "Images d'articles par résultat (cached, processed, omitted, failed)",
+)
+IMAGE_SECONDS = metrics.histogram(
+    "zammad_workflows_pdf_image_seconds",
+    "Téléchargement et réduction d'une image absente du cache",
+)
+
+# Zone d'affichage maximale d'une image, en points (cadre A4 du PDF)
+MAX_WIDTH_PT = 430
+MAX_HEIGHT_PT = 500
+
+# Au-delà, l'image n'est pas décodée (bombe de décompression)
+MAX_PIXELS = 40_000_000
+
+_CONTENT_TYPES = {
+    "image/bmp",
+    "image/gif",
+    "image/jpeg",
+    "image/jpg",
+    "image/pjpeg",
+    "image/png",
+    "image/tiff",
+    "image/webp",
+}
+
+
+def article_images(article: dict) -> list[dict]:
+    """Références des images jointes à un article Zammad, dans l'ordre"""
+    images = []
+    for attachment in article.get("attachments") or ():
+        preferences = attachment.get("preferences") or {}
+        content_type = (
+            preferences.get("Content-Type") or preferences.get("Mime-Type") or ""
+        )
+        if content_type.split(";")[0].strip().lower() not in _CONTENT_TYPES:
+            continue
+        try:
+            # Zammad renvoie la taille sous forme de chaîne
+            size = int(attachment.get("size") or 0)
+        except (TypeError, ValueError):
+            size = 0
+        images.append(
+            {
+                "ticket_id": article.get("ticket_id"),
+                "article_id": article.get("id"),
+                "id": attachment.get("id"),
+                "filename": attachment.get("filename") or "image",
+                "size": size,
+            }
+        )
+    return images
+
+
+def target_size(dpi: int) -> tuple[int, int]:
+    """Taille maximale en pixels d'une image affichée à `dpi`"""
+    return round(MAX_WIDTH_PT * dpi / 72), round(MAX_HEIGHT_PT * dpi / 72)
+
+
+def downscale(data: bytes, max_size: tuple[int, int], quality: int) -> bytes:
+    """
+    Réduit une image pour qu'elle tienne dans `max_size`, sans l'agrandir
+
+    Returns:
+        bytes: JPEG, ou PNG s'il est plus petit (captures d'écran, schémas)
+
+    Raises:
+        OSError, ValueError: image illisible ou trop grande
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        if source.width * source.height > MAX_PIXELS:
+            raise ValueError(f"image de {source.width}x{source.height} pixels")
+        source_format = source.format
+        # JPEG : décodage directement à une échelle réduite (1/2 à 1/8)
+        source.draft("RGB", max_size)
+        image = ImageOps.exif_transpose(source)
+    image.thumbnail(max_size, Image.Resampling.LANCZOS)
+
+    if image.mode in ("RGBA", "LA") or "transparency" in image.info:
+        # Transparence : fond blanc, comme la page
+        rgba = image.convert("RGBA")
+        image = Image.new("RGB", rgba.size, "white")
+        image.paste(rgba, mask=rgba.getchannel("A"))
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    jpeg = io.BytesIO()
+    image.save(jpeg, "JPEG", quality=quality, optimize=True)
+    if source_format == "JPEG":
+        return jpeg.getvalue()
+    png = io.BytesIO()
+    image.save(png, "PNG")
+    return min(jpeg.getvalue(), png.getvalue(), key=len)
+
+
+class ImageCache:
+    """Cache disque borné des images traitées, par pièce jointe et taille cible"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> bytes | None:
+        try:
+            with open(self._path(key), "rb") as image_file:
+                data = image_file.read()
+            # Date d'accès pour l'éviction des moins récemment utilisées
+            os.utime(self._path(key))
+            return data
+        except OSError:
+            return None
+
+    def store(self, key: str, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self._evict()
+
+    def _evict(self):
+        if self.max_bytes <= 0:
+            return
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+
+
+_cache: ImageCache | None = None
+_pool: ThreadPoolExecutor | None = None
+_pool_pid: int | None = None
+_lock = threading.Lock()
+
+
+def _get_cache() -> ImageCache | None:
+    global _cache  # pylint: disable=global-statement
+    if not Config.PDF_IMAGE_CACHE_DIR:
+        return None
+    with _lock:
+        if _cache is None:
+            _cache = ImageCache(
+                Config.PDF_IMAGE_CACHE_DIR, Config.PDF_IMAGE_CACHE_MAX_BYTES
+            )
+        return _cache
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    """Pool de traitement des images, un par process (compatible fork)"""
+    global _pool, _pool_pid  # pylint: disable=global-statement
+    with _lock:
+        if _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(
+                max_workers=max(1, Config.PDF_IMAGE_WORKERS),
+                thread_name_prefix="pdf-image",
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _load(
+    image: dict, zammad_instance, max_size: tuple[int, int], quality: int
+) -> bytes | None:
+    """Image traitée depuis le cache, ou téléchargée puis réduite"""
+    cache = _get_cache()
+    key = f"{int(image['id'])}-{max_size[0]}x{max_size[1]}-q{quality}"
+    data = cache.get(key) if cache else None
+    if data is not None:
+        IMAGES.inc(result="cached")
+        return data
+
+    start = time.perf_counter()
+    success, content = zammad_instance.get_attachment(
+        image["ticket_id"],
+        image["article_id"],
+        image["id"],
+        max_bytes=Config.PDF_IMAGE_MAX_SOURCE_BYTES,
+    )
+    if not success:
+        print(f"[images] Image {image['filename']} non récupérée: {content}")
+        IMAGES.inc(result="failed")
+        return None
+    try:
+        data = downscale(content, max_size, quality)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        print(f"[images] Image {image['filename']} illisible: {e}")
+        IMAGES.inc(result="failed")
+        return None
+    IMAGE_SECONDS.observe(time.perf_counter() - start)
+    IMAGES.inc(result="processed")
+
+    if cache:
+        try:
+            cache.store(key, data)
+        except OSError as e:
+            print(f"[images] Impossible de mettre l'image en cache: {e}")
+    return data
+
+
+def load_images(articles: list[dict], zammad_instance):
+    """
+    Remplace les références `images` des articles par les images à afficher
+
+    Chaque référence devient {"data", "width", "height"} (dimensions en
+    points) ou {"omitted": nom du fichier} si l'image est illisible ou
+    dépasse PDF_IMAGE_MAX_COUNT, PDF_IMAGE_MAX_SOURCE_BYTES ou
+    PDF_IMAGE_MAX_BYTES. Les images sont traitées en parallèle ; la limite de
+    taille totale est appliquée dans l'ordre des articles.
+
+    Args:
+        articles (list[dict]): Articles affichés (voir PDFGenerator.plain_articles)
+        zammad_instance (ZammadService): Service utilisé pour les téléchargements
+    """
+    profile = get_profile()
+    max_size = target_size(profile["image_dpi"])
+    scale = 72 / profile["image_dpi"]
+    quality = profile["image_quality"]
+    pool = _get_pool()
+    count = omitted = 0
+    pending = []
+    for article in articles:
+        references = article.get("images") or []
+        resolved = []
+        for image in references:
+            if "id" not in image:
+                resolved.append(image)
+                continue
+            too_large = 0 < Config.PDF_IMAGE_MAX_SOURCE_BYTES < image["size"]
+            if too_large or 0 < Config.PDF_IMAGE_MAX_COUNT <= count:
+                resolved.append({"omitted": image["filename"]})
+                omitted += 1
+                continue
+            count += 1
+            entry = {"omitted": image["filename"]}
+            resolved.append(entry)
+            future = pool.submit(_load, image, zammad_instance, max_size, quality)
+            pending.append((entry, future))
+        article["images"] = resolved
+
+    total = 0
+    for entry, future in pending:
+        data = future.result()
+        if data is None:
+            continue
+        total += len(data)
+        if 0 < Config.PDF_IMAGE_MAX_BYTES < total:
+            total -= len(data)
+            omitted += 1
+            continue
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+        del entry["omitted"]
+        entry.update(data=data, width=width * scale, height=height * scale)
+
+    if omitted:
+        IMAGES.inc(omitted, result="omitted")
@@ -0,0 +1,253 @@
+import heapq
+import itertools
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Callable
+
+from services.processes import process_alive, process_start
+
+
+class JobQueueFull(Exception):
+    """Levée lorsque la file de jobs est pleine (backpressure)"""
+
+
+class _SQLiteJobStore:
+    """Stockage durable des jobs acceptés, partagé entre les workers gunicorn"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # Connexion ouverte au premier usage dans chaque process : une connexion
+        # SQLite ne doit pas être héritée d'un fork (gunicorn --preload)
+        self._conn: sqlite3.Connection | None = None
+        self._conn_pid: int | None = None
+        # Date de démarrage du process courant, enregistrée avec son PID
+        self._start: str | None = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connexion du process courant (appelé sous self._lock)"""
+        if self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " payload TEXT NOT NULL,"
+                " owner_pid INTEGER NOT NULL,"
+                " owner_start TEXT)"
+            )
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+            if "owner_start" not in columns:
+                # Base créée avant l'enregistrement de la date de démarrage
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN owner_start TEXT")
+            self._conn.commit()
+            self._conn_pid = os.getpid()
+            self._start = process_start(self._conn_pid)
+        return self._conn
+
+    def add(self, payload: dict) -> int:
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute(
+                "INSERT INTO jobs (payload, owner_pid, owner_start) VALUES (?, ?, ?)",
+                (json.dumps(payload), os.getpid(), self._start),
+            )
+            conn.commit()
+            return cursor.lastrowid
+
+    def update(self, job_id: int, payload: dict):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "UPDATE jobs SET payload = ? WHERE id = ?",
+                (json.dumps(payload), job_id),
+            )
+            conn.commit()
+
+    def remove(self, job_id: int):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            conn.commit()
+
+    def reclaim_orphans(self) -> list[tuple[int, dict]]:
+        """
+        Récupère les jobs dont le process propriétaire n'existe plus
+
+        Le propriétaire est identifié par son PID et sa date de démarrage :
+        un PID repris par un autre process ne retient pas ses jobs. Chaque
+        job est réclamé par un UPDATE conditionné au propriétaire lu : si
+        plusieurs workers redémarrent ensemble, un seul le rejoue.
+        """
+        pid = os.getpid()
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(
+                "SELECT id, payload, owner_pid, owner_start FROM jobs ORDER BY id"
+            ).fetchall()
+            reclaimed = []
+            for job_id, payload, owner_pid, owner_start in rows:
+                if process_alive(owner_pid, owner_start):
+                    continue
+                cursor = conn.execute(
+                    "UPDATE jobs SET owner_pid = ?, owner_start = ?"
+                    " WHERE id = ? AND owner_pid = ? AND owner_start IS ?",
+                    (pid, self._start, job_id, owner_pid, owner_start),
+                )
+                conn.commit()
+                if cursor.rowcount == 1:
+                    reclaimed.append((job_id, json.loads(payload)))
+            return reclaimed
+
+
+class JobQueue:
+    """
+    File de jobs bornée traitée par un nombre fixe de threads workers
+
+    Si `db_path` est fourni, les jobs acceptés sont persistés dans SQLite et
+    rejoués au démarrage s'ils n'ont pas été terminés (redémarrage de worker).
+    Un job différé (`delay`) occupe sa place dans la file et est persisté dès
+    son acceptation ; un unique thread le transmet aux workers à échéance.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[dict], None],
+        workers: int = 4,
+        maxsize: int = 100,
+        db_path: str | None = None,
+    ):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.maxsize = maxsize
+        self._queue: queue.Queue = queue.Queue()
+        # Jobs acceptés via submit() et pas encore terminés
+        self.pending = 0
+        self._pending_lock = threading.Lock()
+        self._store = _SQLiteJobStore(db_path) if db_path else None
+        self._threads: list[threading.Thread] = []
+        # Jobs différés : tas de (échéance, numéro d'ordre, job)
+        self._delayed: list[tuple[float, int, tuple]] = []
+        self._delayed_cond = threading.Condition()
+        self._sequence = itertools.count()
+        self._start_lock = threading.Lock()
+        self._started_pid: int | None = None
+
+    def start(self):
+        """Démarre les workers (une fois par process, compatible fork)"""
+        with self._start_lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+            self._threads = []
+            for index in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker, name=f"job-worker-{index}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(
+                target=self._scheduler, name="job-scheduler", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+            if self._store:
+                for job_id, payload in self._store.reclaim_orphans():
+                    # Les jobs récupérés ne passent pas par la backpressure
+                    self._queue.put((job_id, payload, False))
+
+    def submit(
+        self, payload: dict, delay: float = 0.0, force: bool = False
+    ) -> int | None:
+        """
+        Ajoute un job dans la file, exécuté au plus tôt dans `delay` secondes
+
+        Args:
+            payload (dict): Données du job
+            delay (float): Délai avant exécution ; la place est prise dès maintenant
+            force (bool): Ignore la taille maximale (relance d'un job qui libère
+                sa place)
+
+        Returns:
+            int | None: ID du job persisté (voir update), None sans `db_path`
+
+        Raises:
+            JobQueueFull: si la file a atteint sa taille maximale
+        """
+        self.start()
+        with self._pending_lock:
+            if not force and self.maxsize > 0 and self.pending >= self.maxsize:
+                raise JobQueueFull()
+            self.pending += 1
+
+        try:
+            job_id = self._store.add(payload) if self._store else None
+        except Exception:
+            self._release_slot()
+            raise
+        if delay > 0:
+            with self._delayed_cond:
+                heapq.heappush(
+                    self._delayed,
+                    (
+                        time.monotonic() + delay,
+                        next(self._sequence),
+                        (job_id, payload, True),
+                    ),
+                )
+                self._delayed_cond.notify()
+        else:
+            self._queue.put((job_id, payload, True))
+        return job_id
+
+    def update(self, job_id: int | None, payload: dict):
+        """Remplace le payload persisté d'un job pas encore démarré"""
+        if job_id is not None and self._store:
+            self._store.update(job_id, payload)
+
+    def full(self) -> bool:
+        """Indique si un nouvel appel à submit() serait refusé"""
+        return self.maxsize > 0 and self.pending >= self.maxsize
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def _release_slot(self):
+        with self._pending_lock:
+            self.pending -= 1
+
+    def _scheduler(self):
+        """Transmet les jobs différés aux workers à leur échéance"""
+        while True:
+            with self._delayed_cond:
+                while not self._delayed or self._delayed[0][0] > time.monotonic():
+                    timeout = (
+                        self._delayed[0][0] - time.monotonic()
+                        if self._delayed
+                        else None
+                    )
+                    self._delayed_cond.wait(timeout)
+                _, _, job = heapq.heappop(self._delayed)
+            self._queue.put(job)
+
+    def _worker(self):
+        while True:
+            job_id, payload, holds_slot = self._queue.get()
+            try:
+                self.handler(payload)
+            except Exception as e:
+                print(f"[jobs] Erreur lors du traitement du job {job_id}: {e}")
+            finally:
+                if holds_slot:
+                    self._release_slot()
+                if job_id is not None:
+                    try:
+                        self._store.remove(job_id)
+                    except sqlite3.Error as e:
+                        print(f"[jobs] Impossible de supprimer le job {job_id}: {e}")
+                self._queue.task_done()
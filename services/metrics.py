@@ -0,0 +1,416 @@
+"""
+Métriques au format Prometheus, agrégées entre les workers gunicorn
+
+Chaque process garde ses métriques en mémoire et les écrit périodiquement
+dans METRICS_DIR/<pid>-<démarrage>.json : un PID réutilisé n'écrase pas le
+fichier d'un process arrêté. L'endpoint /metrics additionne les fichiers de
+tous les process. Les jauges des process arrêtés sont ignorées ; leurs
+compteurs et histogrammes sont reportés dans folded.json et leurs fichiers
+supprimés.
+"""
+
+import fcntl
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+from config import Config
+from services.processes import process_alive, process_start
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = tuple(2**power for power in range(12, 27, 2))
+
+_lock = threading.Lock()
+_metrics: dict[str, "_Metric"] = {}
+_collectors: list[Callable[[], list[tuple]]] = []
+_dirty = False
+_flusher_pid: int | None = None
+# Cumul des compteurs et histogrammes des process arrêtés
+_FOLDED_FILE = "folded.json"
+
+
+def _label_key(labels: dict) -> str:
+    return json.dumps(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.samples: dict[str, object] = {}
+
+    def _touch(self):
+        global _dirty  # pylint: disable=global-statement
+        _dirty = True
+        _ensure_flusher()
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+            self._touch()
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+            self._touch()
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with _lock:
+            self.samples[_label_key(labels)] = value
+            self._touch()
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with _lock:
+            sample = self.samples.get(key)
+            if sample is None:
+                sample = self.samples[key] = {
+                    "buckets": [0] * len(self.buckets),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample["buckets"][index] += 1
+            sample["sum"] += value
+            sample["count"] += 1
+            self._touch()
+
+    @contextmanager
+    def time(self, **labels):
+        """Mesure la durée du bloc, y compris en cas d'exception"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+def _register(metric: _Metric):
+    with _lock:
+        existing = _metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        _metrics[metric.name] = metric
+        return metric
+
+
+def counter(name: str, documentation: str) -> Counter:
+    return _register(Counter(name, documentation))
+
+
+def gauge(name: str, documentation: str) -> Gauge:
+    return _register(Gauge(name, documentation))
+
+
+def histogram(name: str, documentation: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, documentation, buckets))
+
+
+def register_collector(collector: Callable[[], list[tuple]]):
+    """
+    Ajoute une source de valeurs lues au moment de l'export
+
+    Le collecteur renvoie des tuples (nom, type, description, labels, valeur),
+    par exemple pour exposer les compteurs `stats` existants des services.
+    """
+    with _lock:
+        _collectors.append(collector)
+
+
+def _snapshot() -> dict:
+    with _lock:
+        snapshot = {
+            name: {
+                "type": metric.type,
+                "help": metric.documentation,
+                "buckets": list(getattr(metric, "buckets", ())),
+                "samples": json.loads(json.dumps(metric.samples)),
+            }
+            for name, metric in _metrics.items()
+        }
+        collectors = list(_collectors)
+
+    for collector in collectors:
+        try:
+            values = collector()
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"[metrics] Erreur du collecteur {collector}: {e}")
+            continue
+        for name, metric_type, documentation, labels, value in values:
+            entry = snapshot.setdefault(
+                name,
+                {
+                    "type": metric_type,
+                    "help": documentation,
+                    "buckets": [],
+                    "samples": {},
+                },
+            )
+            entry["samples"][_label_key(labels)] = value
+    return snapshot
+
+
+def _write_file(filename: str, data: dict):
+    """Écriture atomique d'un fichier de METRICS_DIR"""
+    fd, tmp_path = tempfile.mkstemp(dir=Config.METRICS_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+        tmp_file.write(json.dumps(data))
+    os.replace(tmp_path, os.path.join(Config.METRICS_DIR, filename))
+
+
+def flush():
+    """Écrit les métriques du process courant dans METRICS_DIR"""
+    global _dirty  # pylint: disable=global-statement
+    if not Config.METRICS_DIR:
+        return
+    _dirty = False
+    os.makedirs(Config.METRICS_DIR, exist_ok=True)
+    pid = os.getpid()
+    start = process_start(pid)
+    _write_file(
+        f"{pid}-{start}.json" if start else f"{pid}.json",
+        {"pid": pid, "start": start, "metrics": _snapshot()},
+    )
+
+
+def _flush_loop():
+    while True:
+        time.sleep(Config.METRICS_FLUSH_SECONDS)
+        if _dirty:
+            try:
+                flush()
+            except OSError as e:
+                print(f"[metrics] Impossible d'écrire les métriques: {e}")
+
+
+def _ensure_flusher():
+    """Démarre le thread d'écriture une fois par process (compatible fork)"""
+    global _flusher_pid  # pylint: disable=global-statement
+    if _flusher_pid == os.getpid() or not Config.METRICS_DIR:
+        return
+    _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+
+def _reset_after_fork():
+    """
+    Un process forké repart de zéro
+
+    Les valeurs du parent (master gunicorn --preload) restent exportées par son
+    propre fichier ; les copier dans chaque worker les compterait plusieurs
+    fois. Le verrou est recréé au cas où un thread du parent le tenait.
+    """
+    global _lock, _dirty  # pylint: disable=global-statement
+    _lock = threading.Lock()
+    _dirty = False
+    for metric in _metrics.values():
+        metric.samples = {}
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _alive(data: dict) -> bool:
+    pid = data.get("pid")
+    if pid is None:
+        return False
+    return process_alive(pid, data.get("start"))
+
+
+def _read_files() -> dict[str, dict]:
+    files = {}
+    for filename in os.listdir(Config.METRICS_DIR):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(
+                os.path.join(Config.METRICS_DIR, filename), encoding="utf-8"
+            ) as metrics_file:
+                files[filename] = json.load(metrics_file)
+        except (OSError, ValueError):
+            continue
+    return files
+
+
+def _fold_dead_files(files: dict[str, dict]):
+    """Reporte les fichiers des process arrêtés dans folded.json et les supprime"""
+    dead = [
+        filename
+        for filename, data in files.items()
+        if filename != _FOLDED_FILE and not _alive(data)
+    ]
+    if not dead:
+        return
+    folded = files.get(_FOLDED_FILE, {"pid": None, "metrics": {}})
+    for filename in dead:
+        _merge(folded["metrics"], files[filename]["metrics"], gauges=False)
+    _write_file(_FOLDED_FILE, folded)
+    files[_FOLDED_FILE] = folded
+    for filename in dead:
+        del files[filename]
+        try:
+            os.unlink(os.path.join(Config.METRICS_DIR, filename))
+        except FileNotFoundError:
+            pass
+
+
+def _load_snapshots() -> list[tuple[bool, dict]]:
+    """(process vivant, métriques) de chaque process"""
+    if not Config.METRICS_DIR:
+        return [(True, _snapshot())]
+
+    try:
+        flush()
+    except OSError as e:
+        print(f"[metrics] Impossible d'écrire les métriques: {e}")
+    # Verrou du répertoire : deux workers qui répondent en même temps ne
+    # reportent pas deux fois le même fichier
+    with open(
+        os.path.join(Config.METRICS_DIR, ".lock"), "a", encoding="utf-8"
+    ) as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        files = _read_files()
+        try:
+            _fold_dead_files(files)
+        except OSError as e:
+            print(f"[metrics] Impossible de reporter les métriques arrêtées: {e}")
+    return [(_alive(data), data["metrics"]) for data in files.values()]
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(key: str, extra: tuple = ()) -> str:
+    pairs = json.loads(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _merge(merged: dict[str, dict], snapshot: dict, gauges: bool = True):
+    """Additionne les métriques de `snapshot` dans `merged` (jauges si `gauges`)"""
+    for name, metric in snapshot.items():
+        if metric["type"] == "gauge" and not gauges:
+            continue
+        target = merged.setdefault(
+            name,
+            {
+                "type": metric["type"],
+                "help": metric["help"],
+                "buckets": metric["buckets"],
+                "samples": {},
+            },
+        )
+        for key, value in metric["samples"].items():
+            if metric["type"] != "histogram":
+                target["samples"][key] = target["samples"].get(key, 0) + value
+                continue
+            current = target["samples"].setdefault(
+                key,
+                {"buckets": [0] * len(metric["buckets"]), "sum": 0.0, "count": 0},
+            )
+            current["buckets"] = [
+                a + b for a, b in zip(current["buckets"], value["buckets"])
+            ]
+            current["sum"] += value["sum"]
+            current["count"] += value["count"]
+
+
+def render() -> str:
+    """Exporte les métriques agrégées de tous les process au format texte Prometheus"""
+    merged: dict[str, dict] = {}
+    for alive, snapshot in _load_snapshots():
+        _merge(merged, snapshot, gauges=alive)
+
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for key, value in sorted(metric["samples"].items()):
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                continue
+            for bound, count in zip(metric["buckets"], value["buckets"]):
+                labels = _format_labels(key, (("le", _format_value(float(bound))),))
+                lines.append(f"{name}_bucket{labels} {count}")
+            labels = _format_labels(key, (("le", "+Inf"),))
+            lines.append(f"{name}_bucket{labels} {value['count']}")
+            lines.append(f"{name}_sum{_format_labels(key)} {value['sum']!r}")
+            lines.append(f"{name}_count{_format_labels(key)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+# Métriques du traitement des webhooks
+WEBHOOKS = counter("zammad_workflows_webhooks_total", "Webhooks reçus par résultat")
+JOBS = counter("zammad_workflows_jobs_total", "Jobs terminés par résultat")
+JOBS_IN_FLIGHT = gauge("zammad_workflows_jobs_in_flight", "Jobs en cours de traitement")
+JOB_FAILURES = counter("zammad_workflows_job_failures_total", "Échecs de job par étape")
+JOB_QUEUE_WAIT = histogram(
+    "zammad_workflows_job_queue_wait_seconds", "Attente d'un job dans la file"
+)
+STAGE_SECONDS = histogram(
+    "zammad_workflows_stage_seconds", "Durée de chaque étape du traitement"
+)
+PDF_SIZE = histogram(
+    "zammad_workflows_pdf_size_bytes", "Taille des PDFs générés", SIZE_BUCKETS
+)
+RENDER_POOL_BROKEN = counter(
+    "zammad_workflows_render_pool_broken_total",
+    "Rendus interrompus par la mort d'un process du pool, par issue (retried, failed)",
+)
+ZAMMAD_REQUEST_SECONDS = histogram(
+    "zammad_workflows_zammad_request_seconds", "Durée des appels à l'API Zammad"
+)
+ZAMMAD_REQUEST_ERRORS = counter(
+    "zammad_workflows_zammad_request_errors_total", "Appels Zammad en erreur"
+)
+UPLOADED_BYTES = counter(
+    "zammad_workflows_uploaded_bytes_total", "Octets de PDF envoyés à Zammad"
+)
+EMAIL_SECONDS = histogram(
+    "zammad_workflows_email_send_seconds", "Durée d'envoi d'un lot d'emails"
+)
+EMAILS = counter("zammad_workflows_emails_total", "Emails envoyés par résultat")
+EMAIL_PDFS = counter(
+    "zammad_workflows_email_pdfs_total", "PDFs des emails par mode (attached, link)"
+)
@@ -0,0 +1,559 @@
+"""
+Ordonnanceur des écritures vers Zammad
+
+Les écritures (passage de `pdf_generation` à false, envoi des PDFs) de tous
+les jobs d'un process passent par une file à priorités traitée par quelques
+threads. Chaque instance Zammad a un seau à jetons (OUTBOUND_RATE requêtes/s,
+rafales de OUTBOUND_BURST), partagé par tous les workers via OUTBOUND_RATE_DB ;
+les échecs temporaires sont réessayés avec un
+délai exponentiel aléatoire, et les écritures
+définitivement en échec sont conservées dans une base SQLite pour être
+rejouées.
+
+Usage en ligne de commande :
+    python -m services.outbound --list
+    python -m services.outbound --replay
+"""
+
+import argparse
+import asyncio
+import heapq
+import io
+import itertools
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Iterator
+
+from config import Config
+from services import metrics
+from services.zammad import ZammadService
+
+OUTBOUND_WRITES = metrics.counter(
+    "zammad_workflows_outbound_writes_total",
+    "Écritures Zammad par type et résultat",
+)
+OUTBOUND_WAIT = metrics.histogram(
+    "zammad_workflows_outbound_wait_seconds",
+    "Attente d'une écriture avant son envoi (file et limite de débit)",
+)
+
+# Priorités : les plus petites passent en premier
+PRIORITY_FLAG = 0
+PRIORITY_UPLOAD = 1
+PRIORITY_BATCH = 2
+
+# Remise à false de pdf_generation (PUT idempotent) : réessayée après une
+# erreur de passerelle ou toute erreur réseau
+RETRY_STATUSES = {429, 502, 503, 504}
+# Création d'un article (POST) : réessayée seulement si Zammad a refusé la
+# requête ou ne l'a pas reçue. Après un 502/504 ou un délai de lecture
+# dépassé, l'article a pu être créé : un renvoi le dupliquerait.
+POST_RETRY_STATUSES = {429, 503}
+
+
+class TokenBucket:
+    """Seau à jetons : `rate` jetons par seconde, au plus `burst` en réserve"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Prend un jeton, en attendant si le seau est vide"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class SharedTokenBucket:
+    """
+    Seau à jetons partagé entre process via SQLite (une ligne par instance)
+
+    Chaque jeton est réservé dans une transaction : le solde peut devenir
+    négatif et l'appelant attend alors son tour, sans interroger la base en
+    boucle. Le débit total reste `rate`, quel que soit le nombre de workers.
+    Si la base est inutilisable, le seau du process prend le relais.
+    """
+
+    def __init__(self, path: str, key: str, rate: float, burst: int):
+        self.path = path
+        self.key = key
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._local = TokenBucket(rate, burst)
+
+    def acquire(self):
+        """Prend un jeton, en attendant si le seau est vide"""
+        if self.rate <= 0:
+            return
+        try:
+            wait = self._reserve()
+        except sqlite3.Error as e:
+            print(f"[outbound] Seau partagé indisponible, limite par process: {e}")
+            self._local.acquire()
+            return
+        if wait > 0:
+            time.sleep(wait)
+
+    def _reserve(self) -> float:
+        """Réserve un jeton et renvoie l'attente avant de l'utiliser"""
+        # Une connexion par jeton : utilisable après fork et depuis tout thread
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                " key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT tokens, updated FROM rate_buckets WHERE key = ?", (self.key,)
+            ).fetchone()
+            # Horloge murale : commune à tous les process de la machine
+            now = time.time()
+            tokens, updated = row if row else (self.burst, now)
+            tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate) - 1
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated)"
+                " VALUES (?, ?, ?)",
+                (self.key, tokens, now),
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return -tokens / self.rate if tokens < 0 else 0.0
+
+
+_buckets: dict[str, TokenBucket | SharedTokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def bucket_for(api_url: str) -> TokenBucket | SharedTokenBucket:
+    """
+    Seau de toutes les écritures vers cette instance : partagé par les
+    workers avec OUTBOUND_RATE_DB, propre au process sinon
+    """
+    with _buckets_lock:
+        if api_url not in _buckets:
+            if Config.OUTBOUND_RATE_DB:
+                _buckets[api_url] = SharedTokenBucket(
+                    Config.OUTBOUND_RATE_DB,
+                    api_url,
+                    Config.OUTBOUND_RATE,
+                    Config.OUTBOUND_BURST,
+                )
+            else:
+                _buckets[api_url] = TokenBucket(
+                    Config.OUTBOUND_RATE, Config.OUTBOUND_BURST
+                )
+        return _buckets[api_url]
+
+
+class DeadLetterStore:
+    """Écritures en échec définitif, avec le PDF à renvoyer"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS dead_letters ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " kind TEXT NOT NULL,"
+                " ticket_id INTEGER NOT NULL,"
+                " ticket_number TEXT,"
+                " pdf BLOB,"
+                " error TEXT,"
+                " attempts INTEGER NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Une connexion par opération : utilisable après fork et depuis tout thread
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add(self, write: dict, pdf: BinaryIO | None, error: str):
+        data = None
+        if pdf is not None:
+            pdf.seek(0)
+            data = pdf.read()
+            pdf.seek(0)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO dead_letters"
+                " (kind, ticket_id, ticket_number, pdf, error, attempts, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    write["kind"],
+                    write["ticket_id"],
+                    write.get("ticket_number"),
+                    data,
+                    error,
+                    write["attempts"],
+                    time.time(),
+                ),
+            )
+
+    def list(self) -> list[dict]:
+        """Écritures en attente de rejeu, sans le contenu des PDFs"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, kind, ticket_id, ticket_number, length(pdf), error,"
+                " attempts, created_at FROM dead_letters ORDER BY id"
+            ).fetchall()
+        keys = ("id", "kind", "ticket_id", "ticket_number", "pdf_size", "error")
+        keys += ("attempts", "created_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT count(*) FROM dead_letters").fetchone()[0]
+
+    def load_pdf(self, letter_id: int) -> bytes | None:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT pdf FROM dead_letters WHERE id = ?", (letter_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def update(self, letter_id: int, error: str, attempts: int):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE dead_letters SET error = ?, attempts = attempts + ?"
+                " WHERE id = ?",
+                (error, attempts, letter_id),
+            )
+
+    def remove(self, letter_id: int):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM dead_letters WHERE id = ?", (letter_id,))
+
+
+def create_dead_letter_store() -> DeadLetterStore | None:
+    """Crée le stockage configuré par OUTBOUND_DEAD_LETTER_DB (None si vide)"""
+    if not Config.OUTBOUND_DEAD_LETTER_DB:
+        return None
+    return DeadLetterStore(Config.OUTBOUND_DEAD_LETTER_DB)
+
+
+def render_dead_letters(store: DeadLetterStore | None) -> str:
+    """
+    Jauge Prometheus des écritures à rejouer
+
+    La base est partagée par les workers : la valeur est lue à l'export au lieu
+    de passer par les fichiers de métriques additionnés entre process.
+    """
+    if store is None:
+        return ""
+    name = "zammad_workflows_outbound_dead_letters"
+    return (
+        f"# HELP {name} Écritures Zammad en échec conservées pour rejeu\n"
+        f"# TYPE {name} gauge\n"
+        f"{name} {store.count()}\n"
+    )
+
+
+def _retryable(write: dict, response: dict) -> bool:
+    if write["kind"] == "send_ticket_pdf":
+        return response.get("status_code") in POST_RETRY_STATUSES or response.get(
+            "not_sent", False
+        )
+    # Sans code de statut : erreur réseau
+    return response.get("status_code", 0) in RETRY_STATUSES or (
+        "status_code" not in response
+    )
+
+
+class OutboundScheduler:
+    """
+    File à priorités des écritures Zammad d'un process
+
+    `set_ticket_generation_false()` et `send_ticket_pdf()` ont la même
+    signature et le même résultat que ZammadService ; l'appelant attend la fin
+    de l'écriture (réessais compris) mais son ordre de passage dépend de sa
+    priorité et du débit autorisé.
+    """
+
+    def __init__(
+        self,
+        zammad: ZammadService,
+        workers: int = 4,
+        max_attempts: int = 5,
+        retry_delay: float = 2.0,
+        dead_letters: DeadLetterStore | None = None,
+    ):
+        self.zammad = zammad
+        self.bucket = bucket_for(zammad.api_url)
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self.dead_letters = dead_letters
+        # Prêtes : (priorité, ordre, entrée) ; à réessayer : (échéance, ordre, entrée)
+        self._ready: list[tuple] = []
+        self._delayed: list[tuple] = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._start_lock = threading.Lock()
+        self._started_pid: int | None = None
+
+    def start(self):
+        """Démarre les threads d'envoi (une fois par process, compatible fork)"""
+        with self._start_lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+            self._condition = threading.Condition()
+            self._ready, self._delayed = [], []
+            for index in range(self.workers):
+                threading.Thread(
+                    target=self._worker, name=f"outbound-{index}", daemon=True
+                ).start()
+
+    def submit(
+        self,
+        write: dict,
+        call: Callable[[], tuple[bool, dict]],
+        pdf: BinaryIO | None = None,
+        dead_letter: bool = True,
+    ) -> Future:
+        """
+        Planifie une écriture
+
+        Args:
+            write (dict): `kind`, `ticket_id`, `ticket_number` et `priority`
+            call: Exécute l'écriture, renvoie (success, response_data)
+            pdf (BinaryIO): PDF envoyé, conservé si l'écriture échoue
+            dead_letter (bool): Conserver l'écriture en cas d'échec définitif
+
+        Returns:
+            Future: résultat (success, response_data) de la dernière tentative
+        """
+        self.start()
+        future = Future()
+        write["attempts"] = 0
+        entry = {
+            "write": write,
+            "call": call,
+            "pdf": pdf,
+            "dead_letter": dead_letter,
+            "future": future,
+            "queued_at": time.monotonic(),
+        }
+        with self._condition:
+            heapq.heappush(
+                self._ready,
+                (write.get("priority", PRIORITY_UPLOAD), next(self._order), entry),
+            )
+            self._condition.notify()
+        return future
+
+    @staticmethod
+    def flag_write(ticket_id, priority: int = PRIORITY_FLAG) -> dict:
+        return {
+            "kind": "set_ticket_generation_false",
+            "ticket_id": ticket_id,
+            "priority": priority,
+        }
+
+    @staticmethod
+    def upload_write(ticket_number, ticket_id, priority: int = PRIORITY_UPLOAD):
+        return {
+            "kind": "send_ticket_pdf",
+            "ticket_id": ticket_id,
+            "ticket_number": ticket_number,
+            "priority": priority,
+        }
+
+    def set_ticket_generation_false(self, ticket_id, priority: int = PRIORITY_FLAG):
+        write = self.flag_write(ticket_id, priority)
+        return self.submit(write, self._call(write, None)).result()
+
+    def send_ticket_pdf(
+        self, ticket_number, ticket_id, pdf, priority: int = PRIORITY_UPLOAD
+    ):
+        write = self.upload_write(ticket_number, ticket_id, priority)
+        return self.submit(write, self._call(write, pdf), pdf).result()
+
+    async def run_async(
+        self, write: dict, coroutine_function, pdf: BinaryIO | None = None
+    ) -> tuple[bool, dict]:
+        """
+        Planifie une écriture faite par un client asyncio (entrée ASGI)
+
+        La coroutine est exécutée dans la boucle de l'appelant quand son tour
+        vient ; seule l'attente du résultat occupe un thread d'envoi.
+        """
+        loop = asyncio.get_running_loop()
+
+        def call():
+            return asyncio.run_coroutine_threadsafe(coroutine_function(), loop).result()
+
+        return await asyncio.wrap_future(self.submit(write, call, pdf))
+
+    def _call(self, write: dict, pdf) -> Callable[[], tuple[bool, dict]]:
+        """Écriture exécutée avec le client synchrone"""
+        if write["kind"] == "send_ticket_pdf":
+            return lambda: self.zammad.send_ticket_pdf(
+                write.get("ticket_number") or "N/A", write["ticket_id"], pdf
+            )
+        return lambda: self.zammad.set_ticket_generation_false(write["ticket_id"])
+
+    def _next_entry(self) -> dict:
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, order, entry = heapq.heappop(self._delayed)
+                    priority = entry["write"].get("priority", PRIORITY_UPLOAD)
+                    heapq.heappush(self._ready, (priority, order, entry))
+                if self._ready:
+                    return heapq.heappop(self._ready)[2]
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._condition.wait(timeout)
+
+    def _worker(self):
+        while True:
+            entry = self._next_entry()
+            write = entry["write"]
+            self.bucket.acquire()
+            if write["attempts"] == 0:
+                OUTBOUND_WAIT.observe(time.monotonic() - entry["queued_at"])
+            write["attempts"] += 1
+            try:
+                success, response = entry["call"]()
+            except Exception as e:  # pylint: disable=broad-except
+                success, response = False, {"error": str(e), "status_code": 0}
+
+            if success:
+                OUTBOUND_WRITES.inc(kind=write["kind"], result="ok")
+                entry["future"].set_result((success, response))
+            elif _retryable(write, response) and write["attempts"] < self.max_attempts:
+                OUTBOUND_WRITES.inc(kind=write["kind"], result="retried")
+                # Délai exponentiel avec aléa pour étaler les réessais simultanés
+                delay = self.retry_delay * 2 ** (write["attempts"] - 1)
+                delay *= random.uniform(0.5, 1.5)
+                with self._condition:
+                    heapq.heappush(
+                        self._delayed,
+                        (time.monotonic() + delay, next(self._order), entry),
+                    )
+                    self._condition.notify()
+            else:
+                self._give_up(entry, response)
+
+    def _give_up(self, entry: dict, response: dict):
+        write = entry["write"]
+        result = "failed"
+        if entry["dead_letter"] and self.dead_letters:
+            try:
+                self.dead_letters.add(write, entry["pdf"], str(response.get("error")))
+                result = "dead_letter"
+                print(
+                    f"[outbound] {write['kind']} du ticket {write['ticket_id']} "
+                    f"conservé pour rejeu après {write['attempts']} tentative(s)"
+                )
+            except sqlite3.Error as e:
+                print(f"[outbound] Impossible de conserver l'écriture: {e}")
+        OUTBOUND_WRITES.inc(kind=write["kind"], result=result)
+        entry["future"].set_result((False, response))
+
+    def replay(self, letter_ids: list[int] | None = None) -> dict[str, int]:
+        """
+        Rejoue les écritures conservées ; celles qui réussissent sont supprimées
+
+        Returns:
+            dict: nombre d'écritures `replayed` et `failed`
+        """
+        counts = {"replayed": 0, "failed": 0}
+        if not self.dead_letters:
+            return counts
+        for letter in self.dead_letters.list():
+            if letter_ids and letter["id"] not in letter_ids:
+                continue
+            write = {
+                "kind": letter["kind"],
+                "ticket_id": letter["ticket_id"],
+                "ticket_number": letter["ticket_number"],
+                "priority": PRIORITY_BATCH,
+            }
+            data = self.dead_letters.load_pdf(letter["id"])
+            pdf = io.BytesIO(data) if data is not None else None
+            future = self.submit(write, self._call(write, pdf), pdf, dead_letter=False)
+            success, response = future.result()
+            if success:
+                self.dead_letters.remove(letter["id"])
+                counts["replayed"] += 1
+            else:
+                self.dead_letters.update(
+                    letter["id"], str(response.get("error")), write["attempts"]
+                )
+                counts["failed"] += 1
+        return counts
+
+
+def create_outbound_scheduler(zammad: ZammadService) -> OutboundScheduler:
+    """Crée l'ordonnanceur configuré par les variables OUTBOUND_*"""
+    return OutboundScheduler(
+        zammad,
+        workers=Config.OUTBOUND_WORKERS,
+        max_attempts=Config.OUTBOUND_MAX_ATTEMPTS,
+        retry_delay=Config.OUTBOUND_RETRY_DELAY,
+        dead_letters=create_dead_letter_store(),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--list", action="store_true", help="écritures conservées")
+    action.add_argument("--replay", action="store_true", help="rejoue les écritures")
+    parser.add_argument("--ids", type=int, nargs="+", help="IDs à rejouer")
+    args = parser.parse_args()
+
+    store = create_dead_letter_store()
+    if store is None:
+        parser.error("OUTBOUND_DEAD_LETTER_DB n'est pas défini")
+
+    if args.list:
+        for letter in store.list():
+            print(
+                f"{letter['id']:>5}  {letter['kind']:<28} ticket {letter['ticket_id']:<8}"
+                f" {letter['attempts']} tentative(s)  {letter['error']}"
+            )
+        return
+
+    if not Config.ZAMMAD_API_URL or not Config.ZAMMAD_API_TOKEN:
+        parser.error("ZAMMAD_API_URL et ZAMMAD_API_TOKEN doivent être définis")
+    scheduler = create_outbound_scheduler(ZammadService())
+    counts = scheduler.replay(args.ids)
+    print(f"{counts['replayed']} écriture(s) rejouée(s), {counts['failed']} en échec")
+    sys.exit(1 if counts["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,219 +1,522 @@
 import io
+import os
 import base64
-from datetime import datetime
+import hashlib
+import json
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from html import escape
+from itertools import islice
+from typing import BinaryIO, Iterable, Iterator
 from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
+from reportlab.platypus import Image, SimpleDocTemplate, Paragraph, Spacer
+from reportlab.platypus.doctemplate import ActionFlowable
+from config import Config
+from services import metrics
+from services.html import article_paragraphs, html_to_paragraphs
+from services.images import article_images, load_images
+from services.pdf_cache import PDFCache
+from services.pdf_profiles import apply_profile
+from services.templates import STYLES, format_date, templates
+from services.streams import file_size, spooled_file
 from services.zammad import ZammadService
 
+RIGHT_STYLE = STYLES["Normal"].clone("right", alignment=2)
+
+
+# Flowables gardés en avance pendant le rendu (le reste est produit à la demande)
+RENDER_CHUNK = 64
+
+
+class _StreamingDocTemplate(SimpleDocTemplate):
+    """
+    SimpleDocTemplate alimenté par un générateur de flowables
+
+    ReportLab consomme la liste par le début : elle est complétée par blocs
+    de RENDER_CHUNK au lieu de contenir tout le document. Avec `max_pages`,
+    le contenu s'arrête sur la dernière page autorisée et une mention
+    indique que la suite est omise.
+    """
+
+    def __init__(self, output, story: Iterator, max_pages: int = 0, **kwargs):
+        super().__init__(output, **kwargs)
+        self._story = story
+        self.max_pages = max_pages
+        self.capped = False
+        self._queue: list = []
+
+    def build(self, flowables=None, **kwargs):  # pylint: disable=arguments-differ
+        self._queue = list(islice(self._story, RENDER_CHUNK)) or [Spacer(1, 0)]
+        super().build(self._queue, **kwargs)
+
+    def filterFlowables(self, flowables):  # pylint: disable=invalid-name
+        # Aussi appelé sur les actions internes de ReportLab (_hanging)
+        if flowables is not self._queue:
+            return
+        if len(flowables) < RENDER_CHUNK // 2:
+            flowables.extend(islice(self._story, RENDER_CHUNK))
+        if self.max_pages and not self.capped and self.page >= self.max_pages:
+            self._check_page_cap(flowables)
+
+    def _check_page_cap(self, flowables):
+        """
+        Sur la dernière page, coupe avant le premier flowable qui ne laisse
+        pas la place de la mention (espacements compris)
+
+        Un flowable qui déborderait serait coupé sur la page suivante : il est
+        remplacé par la mention, qui reste ainsi sur la dernière page.
+        """
+        flowable = flowables[0]
+        if flowable is None or isinstance(flowable, ActionFlowable):
+            return
+        note = Paragraph(
+            f"<i>[…] Document limité à {self.max_pages} pages, la suite est omise.</i>",
+            STYLES["Normal"],
+        )
+        frame = self.frame
+        available = frame._y - frame._y1p
+        _, note_height = note.wrapOn(self.canv, frame._aW, frame._aH)
+        _, height = flowable.wrapOn(self.canv, frame._aW, frame._aH)
+        needed = (
+            self._space_before(flowable)
+            + height
+            + flowable.getSpaceAfter()
+            + note.getSpaceBefore()
+            + note_height
+        )
+        if self.page > self.max_pages or needed > available:
+            self.capped = True
+            self._story = iter(())
+            flowables[:] = [note]
+
+    def _space_before(self, flowable) -> float:
+        """Espace avant le flowable tel que le compte Frame.add"""
+        frame = self.frame
+        if frame._atTop:
+            return 0
+        space = flowable.getSpaceBefore()
+        if frame._oASpace:
+            space = max(space - frame._prevASpace, 0)
+        return space
+
 
 class PDFGenerator:
     """Générateur de PDF pour les tickets Zammad"""
 
-    def __init__(self):
-        self.styles = getSampleStyleSheet()
-        self.pdf_bytes: bytes = None
-        self.pdf_base64: str = None
-
-    def _format_value(self, value: str | bool | int) -> str:
-        """Formate une valeur pour l'affichage dans le PDF"""
-        if value is None or value == "":
-            return "Non défini"
-        elif value is False:
-            return "Non"
-        elif value is True:
-            return "Oui"
-        elif isinstance(value, str) and value.endswith(":00:00.000Z"):
-            return self._format_date(value)
-        return str(value)
-
-    def _clean_html(self, html_content: str) -> str:
-        """Nettoie le contenu HTML simple"""
-        return (
-            html_content.replace("<br>", "\n")
-            .replace("<div>", "")
-            .replace("</div>", "\n")
-        )
+    def __init__(self, pdf_cache: PDFCache | None = None):
+        self.styles = STYLES
+        self.pdf_cache = pdf_cache
+        # PDF produit, rembobiné (mémoire puis disque au-delà de PDF_SPOOL_MAX_BYTES)
+        self.pdf_file: BinaryIO = None
+        self.pdf_size = 0
+        self.fingerprint: str = None
+        # True si le PDF est identique au dernier envoyé pour ce ticket
+        self.unchanged = False
 
-    def _close_br_tag_html(self, html_content):
-        """Ferme les tags HTML <br>"""
-        return html_content.replace("<br>", "<br></br>")
+    @staticmethod
+    def _article_paragraphs(article_data: dict) -> list[str]:
+        """Paragraphes d'un article (déjà convertis par plain_articles, ou à convertir)"""
+        paragraphs = article_data.get("paragraphs")
+        if paragraphs is None:
+            paragraphs = html_to_paragraphs(
+                article_data.get("body", ""),
+                article_data.get("content_type") or "text/html",
+            )
+        return paragraphs
 
-    def _format_date(self, date_str: str) -> str:
-        """Formate une date ISO en format lisible"""
+    @staticmethod
+    def _paragraph(markup: str, style) -> Paragraph:
+        """Paragraph ReportLab ; un balisage refusé est rendu en texte brut"""
         try:
-            return datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%S.%fZ").strftime(
-                "%d/%m/%Y %H:%M"
-            )
-        except (TypeError, ValueError):
-            return date_str
-
-    def _create_bde_table(self, ticket):
-        """Crée le tableau des informations BDE Club/Asso"""
-        table_data = [["Champ", "Valeur"]]
-
-        # Champs spécifiques du BDE
-        bde_fields = [
-            ("Date de début", "date_begin"),
-            ("Date de fin", "date_end"),
-            ("Nombre de participants attendus", "bde_clubasso_participants_nb"),
-            ("Présence de public extérieur", "bde_clubasso_externals"),
-            ("Lieux", "places"),
-            ("Boissons & Nourriture", "bde_clubasso_food"),
-            ("Nom/Prénom des responsables", "bde_clubasso_orgas"),
-            ("Evènement hebdomadaire", "bde_com_hebdo"),
-        ]
+            return Paragraph(markup, style)
+        except ValueError:
+            return Paragraph(escape(markup), style)
 
-        for display_name, field_key in bde_fields:
-            value = self._format_value(ticket.get(field_key))
-            table_data.append([display_name, value])
+    def _format_date(self, date_str: str) -> str:
+        """Formate une date ISO en format lisible"""
+        return format_date(date_str)
 
-        table = Table(table_data, colWidths=[200, 300])
-        table.setStyle(
-            TableStyle(
+    def compute_fingerprint(self, ticket: dict, articles_data: list[dict]) -> str:
+        """Empreinte SHA-256 de tout ce qui est affiché dans le PDF"""
+        plan = templates.select(ticket)
+        content = {
+            "template": plan.name,
+            "header": plan.values(ticket),
+            "articles": [
                 [
-                    # En-tête avec fond bleu et texte blanc
-                    ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#1976D2")),
-                    ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-                    ("ALIGN", (0, 0), (-1, 0), "CENTER"),
-                    ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                    ("FONTSIZE", (0, 0), (-1, 0), 13),
-                    # Contenu avec alternance de lignes
-                    ("BACKGROUND", (0, 1), (-1, -1), colors.HexColor("#F5F7FA")),
-                    (
-                        "ROWBACKGROUNDS",
-                        (0, 1),
-                        (-1, -1),
-                        [colors.HexColor("#F5F7FA"), colors.HexColor("#E3E8EE")],
-                    ),
-                    ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
-                    ("FONTSIZE", (0, 1), (-1, -1), 11),
-                    # Bordures fines et arrondies
-                    ("GRID", (0, 0), (-1, -1), 0.5, colors.HexColor("#B0BEC5")),
-                    ("BOX", (0, 0), (-1, -1), 1, colors.HexColor("#1976D2")),
-                    ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
-                    ("LEFTPADDING", (0, 0), (-1, -1), 8),
-                    ("RIGHTPADDING", (0, 0), (-1, -1), 8),
-                    ("TOPPADDING", (0, 0), (-1, -1), 6),
-                    ("BOTTOMPADDING", (0, 0), (-1, -1), 6),
+                    article.get("created_at"),
+                    article.get("from"),
+                    article.get("type_id"),
+                    article.get("paragraphs", article.get("body")),
+                    article.get("omitted"),
                 ]
-            )
-        )
-
-        return table
+                # Images identifiées par leur pièce jointe (inchangé sans image)
+                + (
+                    [[image.get("id") for image in article["images"]]]
+                    if article.get("images")
+                    else []
+                )
+                for article in articles_data
+            ],
+        }
+        serialized = json.dumps(content, sort_keys=True, default=str)
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
 
-    def generate_ticket_pdf(self, ticket: dict, zammad_instance: ZammadService):
+    @staticmethod
+    def select_article_ids(article_ids: list[int]) -> tuple[list[int], int]:
         """
-        Génère un PDF à partir des données de ticket et d'article
+        IDs à récupérer compte tenu de PDF_LAST_MESSAGES et PDF_MAX_MESSAGES
 
-        Args:
-            ticket (dict): Données du ticket Zammad
-            article (dict): Données de l'article Zammad
+        La description (premier article) est toujours gardée. Les IDs d'un
+        ticket Zammad suivent l'ordre de création.
 
         Returns:
-            str: PDF encodé en base64
+            tuple: (IDs à récupérer, nombre d'articles écartés)
         """
+        ordered = sorted(article_ids)
+        if Config.PDF_LAST_MESSAGES > 0:
+            kept = ordered[:1] + ordered[1:][-Config.PDF_LAST_MESSAGES :]
+        elif Config.PDF_MAX_MESSAGES > 0:
+            kept = ordered[: Config.PDF_MAX_MESSAGES + 1]
+        else:
+            kept = ordered
+        return kept, len(ordered) - len(kept)
 
-        ticket_number: str = ticket.get("number", "N/A")
-        ticket_title: str = ticket.get("title", "N/A")
+    @staticmethod
+    def limit_articles(articles: Iterable[dict], skipped: int = 0) -> list[dict]:
+        """
+        Applique PDF_LAST_MESSAGES / PDF_MAX_MESSAGES à une suite d'articles
 
-        owner: dict = ticket.get("owner", {})
-        ticket_owner: str = (
-            f"{owner.get('firstname', 'N/A')} {owner.get('lastname', '')}"
-        )
+        Les articles sont lus un par un (liste ou générateur) : au plus
+        PDF_MAX_MESSAGES ou PDF_LAST_MESSAGES messages sont gardés en mémoire.
+        Un marqueur `{"omitted": n}` remplace les messages écartés, y compris
+        les `skipped` articles non récupérés (voir select_article_ids).
+        """
+        articles = iter(articles)
+        description = list(islice(articles, 1))
+        if Config.PDF_LAST_MESSAGES > 0:
+            last = deque(maxlen=Config.PDF_LAST_MESSAGES)
+            total = 0
+            for article in articles:
+                last.append(article)
+                total += 1
+            omitted = skipped + total - len(last)
+            marker = [{"omitted": omitted}] if omitted else []
+            return description + marker + list(last)
 
-        ticket_created_by: dict = ticket.get("created_by", {})
-        ticket_created_by_str: str = (
-            f"{self._format_value(ticket_created_by.get('firstname'))} "
-            f"{self._format_value(ticket_created_by.get('lastname'))}"
-        )
-        ticket_created_at_raw = self._format_value(ticket.get("created_at"))
-        ticket_created_at = self._format_date(ticket_created_at_raw)
-        ticket_club_name = self._format_value(ticket.get("bde_log_clubasso_name"))
+        if Config.PDF_MAX_MESSAGES > 0:
+            kept = list(islice(articles, Config.PDF_MAX_MESSAGES))
+        else:
+            kept = list(articles)
+        omitted = skipped + sum(1 for _ in articles)
+        marker = [{"omitted": omitted}] if omitted else []
+        return description + kept + marker
 
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        elements = []
+    def _fetch_articles(self, ticket: dict, zammad_instance: ZammadService):
+        """
+        Récupère les seuls articles affichés du ticket
 
-        elements.append(
-            Paragraph(f"Ticket #{ticket_number}: {ticket_title}", self.styles["Title"])
-        )
-        elements.append(Spacer(1, 6))
-        elements.append(
-            Paragraph(f"Club/Asso: {ticket_club_name}", self.styles["Heading2"])
-        )
-        elements.append(Spacer(1, 6))
-        elements.append(
-            Paragraph(f"Demande de: {ticket_created_by_str}", self.styles["Normal"])
-        )
-        elements.append(
-            Paragraph(f"Responsable BDE: {ticket_owner}", self.styles["Normal"])
-        )
+        Returns:
+            tuple: (articles simplifiés, nombre d'articles non récupérés)
+        """
+        article_ids, skipped = self.select_article_ids(ticket.get("article_ids", []))
+        with metrics.STAGE_SECONDS.time(stage="fetch_articles"):
+            articles = zammad_instance.get_ticket_articles(
+                ticket.get("id"), article_ids
+            )
+        return self.plain_articles(articles), skipped
 
-        elements.append(
-            Paragraph(f"Envoyée le: {ticket_created_at}", self.styles["Normal"])
+    @staticmethod
+    def plain_articles(articles: Iterable[dict]) -> Iterator[dict]:
+        """Réduit les articles Zammad aux champs utilisés par le rendu (à la demande)"""
+        return (
+            {
+                "created_at": article_data.get("created_at", ""),
+                "paragraphs": article_paragraphs(article_data),
+                "from": article_data.get("from", "N/A"),
+                "type_id": article_data.get("type_id", 0),
+                "images": article_images(article_data) if Config.PDF_IMAGES else [],
+            }
+            for article_data in articles
         )
-        elements.append(Spacer(1, 12))
-
-        elements.append(Paragraph("Informations Evènement", self.styles["Heading2"]))
-        elements.append(Spacer(1, 6))
-        elements.append(self._create_bde_table(ticket))
-        elements.append(Spacer(1, 12))
-
-        elements.append(Paragraph("Description", self.styles["Heading2"]))
-        elements.append(Spacer(1, 6))
-
-        article_ids = ticket.get("article_ids", [])
-        articles_data = []
-        for article_id in article_ids:
-            article_data = zammad_instance.get_article_by_id(article_id)
-            if article_data:
-                articles_data.append(
-                    {
-                        "created_at": article_data.get("created_at", ""),
-                        "body": article_data.get("body", ""),
-                        "from": article_data.get("from", "N/A"),
-                        "type_id": article_data.get("type_id", 0),
-                    }
-                )
-        articles_data.sort(key=lambda x: x.get("created_at", ""))
 
-        description_body = self._close_br_tag_html(
-            articles_data[0].get("body", "") if articles_data else ""
+    @property
+    def pdf_bytes(self) -> bytes:
+        """Contenu du PDF (copie complète en mémoire, à éviter sur le chemin principal)"""
+        self.pdf_file.seek(0)
+        data = self.pdf_file.read()
+        self.pdf_file.seek(0)
+        return data
+
+    @property
+    def pdf_base64(self) -> str:
+        """PDF encodé en base64 (copie complète en mémoire)"""
+        return base64.b64encode(self.pdf_bytes).decode("utf-8")
+
+    def render(self, ticket: dict, articles_data: list[dict], output: BinaryIO):
+        """
+        Construit le PDF à partir de données déjà récupérées (sans appel réseau)
+
+        Args:
+            ticket (dict): Données du ticket Zammad
+            articles_data (list[dict]): Articles triés par date de création
+            output (BinaryIO): Fichier dans lequel écrire le PDF
+        """
+        apply_profile()
+        doc = _StreamingDocTemplate(
+            output,
+            self.build_story(ticket, articles_data),
+            max_pages=Config.PDF_MAX_PAGES,
+            pagesize=A4,
         )
-        elements.append(Paragraph(description_body, self.styles["Normal"]))
+        doc.build()
 
-        elements.append(Paragraph("Messages", self.styles["Heading2"]))
+    def _build_message(self, article_data: dict) -> list:
+        """Flowables d'un message : corps, expéditeur et date alignés à droite"""
+        created_at = self._format_date(article_data.get("created_at", ""))
+        elements = [
+            self._paragraph(markup, STYLES["BodyText"])
+            for markup in self._article_paragraphs(article_data)
+        ]
+        elements += self._image_flowables(article_data)
+        elements += [
+            Paragraph(escape(article_data.get("from", "N/A")), RIGHT_STYLE),
+            Paragraph(created_at, RIGHT_STYLE),
+            Spacer(1, 12),
+        ]
+        return elements
 
-        for article_data in articles_data[1:]:
-            if article_data.get("type_id", 0) == 10:
-                sender = article_data.get("from", "N/A")
-                body = self._close_br_tag_html(
-                    article_data.get("body", "") if articles_data else ""
-                )
-                created_at = ticket_created_at = datetime.strptime(
-                    article_data.get("created_at", ""), "%Y-%m-%dT%H:%M:%S.%fZ"
-                ).strftime("%d/%m/%Y %H:%M")
-                elements.append(Paragraph(body, self.styles["BodyText"]))
+    @staticmethod
+    def _image_flowables(article_data: dict) -> list:
+        """Images d'un article chargées par load_images, ou mention de l'omission"""
+        elements = []
+        for image in article_data.get("images") or ():
+            if "data" in image:
+                elements += [
+                    Image(
+                        io.BytesIO(image["data"]),
+                        width=image["width"],
+                        height=image["height"],
+                    ),
+                    Spacer(1, 6),
+                ]
+            elif "omitted" in image:
                 elements.append(
                     Paragraph(
-                        sender,
-                        bulletText=None,
-                        style=self.styles["Normal"].clone("right", alignment=2),
+                        f"<i>[image non affichée : {escape(image['omitted'])}]</i>",
+                        STYLES["Normal"],
                     )
                 )
-                elements.append(
-                    Paragraph(
-                        created_at,
-                        bulletText=None,
-                        style=self.styles["Normal"].clone("right", alignment=2),
-                    )
+        return elements
+
+    def build_story(self, ticket: dict, articles_data: Iterable[dict]) -> Iterator:
+        """Flowables du PDF, produits au fil du rendu ; seules les données varient"""
+        articles = iter(articles_data)
+        plan = templates.select(ticket)
+        yield from plan.flowables(plan.values(ticket))
+
+        yield Paragraph("Description", STYLES["Heading2"])
+        yield Spacer(1, 6)
+
+        for description in islice(articles, 1):
+            for markup in self._article_paragraphs(description):
+                yield self._paragraph(markup, STYLES["Normal"])
+            yield from self._image_flowables(description)
+
+        yield Paragraph("Messages", STYLES["Heading2"])
+
+        for article_data in articles:
+            if "omitted" in article_data:
+                yield Paragraph(
+                    f"<i>[…] {article_data['omitted']} message(s) omis</i>",
+                    STYLES["Normal"],
+                )
+                yield Spacer(1, 12)
+            elif article_data.get("type_id", 0) == 10:
+                yield from self._build_message(article_data)
+
+    def generate_ticket_pdf(self, ticket: dict, zammad_instance: ZammadService):
+        """
+        Génère un PDF à partir des données de ticket et de ses articles
+
+        Les appels HTTP sont faits dans le process courant ; le rendu ReportLab
+        est délégué au pool de process si PDF_RENDER_PROCESSES est activé.
+        Si le contenu est identique au dernier PDF envoyé pour ce ticket, le
+        rendu est évité et `unchanged` passe à True.
+
+        Args:
+            ticket (dict): Données du ticket Zammad
+            zammad_instance (ZammadService): Service utilisé pour lire les articles
+        """
+        articles_data, skipped = self._fetch_articles(ticket, zammad_instance)
+        self.generate_from_articles(ticket, articles_data, skipped, zammad_instance)
+
+    def generate_from_articles(
+        self,
+        ticket: dict,
+        articles_data: Iterable[dict],
+        skipped: int = 0,
+        zammad_instance: ZammadService | None = None,
+    ):
+        """
+        Génère le PDF à partir d'articles déjà récupérés (voir plain_articles)
+
+        Les limites PDF_MAX_MESSAGES / PDF_LAST_MESSAGES sont appliquées ici,
+        avant l'empreinte : un générateur d'articles est consommé au fil de l'eau.
+
+        Args:
+            ticket (dict): Données du ticket Zammad
+            articles_data (Iterable[dict]): Articles triés par date de création
+            skipped (int): Articles écartés avant récupération (select_article_ids)
+            zammad_instance (ZammadService | None): Service utilisé pour
+                télécharger les images (voir services.images) ; sans service,
+                les images ne sont pas affichées
+        """
+        articles_data = self.limit_articles(articles_data, skipped)
+        self.fingerprint = self.compute_fingerprint(ticket, articles_data)
+        self.unchanged = False
+
+        if self.pdf_file is not None:
+            self.pdf_file.close()
+        self.pdf_file = None
+
+        if (
+            self.pdf_cache
+            and self.pdf_cache.last_fingerprint(ticket.get("id")) == self.fingerprint
+        ):
+            self.pdf_file = self.pdf_cache.open(self.fingerprint)
+            self.unchanged = self.pdf_file is not None
+
+        if not self.unchanged:
+            if zammad_instance is not None and Config.PDF_IMAGES:
+                # Images des seuls articles affichés, après le test d'empreinte
+                displayed = [
+                    article
+                    for index, article in enumerate(articles_data)
+                    if article.get("images")
+                    and (index == 0 or article.get("type_id", 0) == 10)
+                ]
+                with metrics.STAGE_SECONDS.time(stage="images"):
+                    load_images(displayed, zammad_instance)
+            self.pdf_file = spooled_file()
+            with metrics.STAGE_SECONDS.time(stage="render"):
+                rendered = render_in_pool(ticket, articles_data)
+                if rendered is not None:
+                    self.pdf_file.write(rendered)
+                else:
+                    self.render(ticket, articles_data, self.pdf_file)
+
+            if self.pdf_cache:
+                self.pdf_cache.store(self.fingerprint, self.pdf_file)
+
+        self.pdf_size = file_size(self.pdf_file)
+        if not self.unchanged:
+            metrics.PDF_SIZE.observe(self.pdf_size)
+        self.pdf_file.seek(0)
+
+    def close(self):
+        """Libère le fichier du PDF généré"""
+        if self.pdf_file is not None:
+            self.pdf_file.close()
+            self.pdf_file = None
+
+
+def render_ticket_pdf(ticket: dict, articles_data: list[dict]) -> bytes:
+    """Point d'entrée picklable pour le rendu dans un process du pool"""
+    buffer = io.BytesIO()
+    PDFGenerator().render(ticket, articles_data, buffer)
+    return buffer.getvalue()
+
+
+_render_pool: ProcessPoolExecutor | None = None
+_render_pool_lock = threading.Lock()
+
+
+def _render_processes() -> int:
+    value = Config.PDF_RENDER_PROCESSES.strip().lower()
+    if value == "auto":
+        return os.cpu_count() or 1
+    return int(value or "0")
+
+
+def get_render_pool() -> ProcessPoolExecutor | None:
+    """Renvoie le pool de rendu partagé, ou None si le rendu se fait en thread"""
+    global _render_pool  # pylint: disable=global-statement
+
+    processes = _render_processes()
+    if processes <= 0:
+        return None
+
+    with _render_pool_lock:
+        if _render_pool is None:
+            context = multiprocessing.get_context("forkserver")
+            # Les process du pool sont forkés d'un serveur qui a déjà importé
+            # ReportLab, les styles et les templates
+            context.set_forkserver_preload([__name__])
+            _render_pool = ProcessPoolExecutor(
+                max_workers=processes, mp_context=context
+            )
+        return _render_pool
+
+
+def _reset_render_pool(broken: ProcessPoolExecutor):
+    """Oublie un pool cassé : le prochain get_render_pool en crée un neuf"""
+    global _render_pool  # pylint: disable=global-statement
+
+    with _render_pool_lock:
+        if _render_pool is broken:
+            _render_pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def render_in_pool(ticket: dict, articles_data: list[dict]) -> bytes | None:
+    """
+    Rend le PDF dans le pool de process
+
+    Un process du pool qui meurt (OOM killer, signal) casse tout le pool :
+    il est alors remplacé et le rendu retenté une fois dans un pool neuf. Un
+    ticket qui tue aussi ce second process n'est pas rendu dans le worker,
+    que le pool protège : le job échoue.
+
+    Returns:
+        bytes | None: None si le pool est désactivé, le rendu se fait alors
+        dans le process courant
+
+    Raises:
+        BrokenProcessPool: si le rendu a cassé deux pools de suite
+    """
+    for attempt in range(2):
+        pool = get_render_pool()
+        if pool is None:
+            return None
+        try:
+            return pool.submit(render_ticket_pdf, ticket, articles_data).result()
+        except BrokenProcessPool as e:
+            _reset_render_pool(pool)
+            if attempt == 1:
+                metrics.RENDER_POOL_BROKEN.inc(result="failed")
+                print(
+                    f"[pdf] Rendu du ticket {ticket.get('number', 'N/A')} abandonné, "
+                    f"second pool cassé: {e}"
                 )
-                elements.append(Spacer(1, 12))
+                raise
+            metrics.RENDER_POOL_BROKEN.inc(result="retried")
+            print(f"[pdf] Pool de rendu cassé, remplacé: {e}")
+    return None
 
-        doc.build(elements)
-        buffer.seek(0)
 
-        self.pdf_bytes = buffer.getvalue()
-        self.pdf_base64 = base64.b64encode(self.pdf_bytes).decode("utf-8")
+def warm_up_render_pool(ticket: dict, articles_data: list[dict]):
+    """Démarre tous les process du pool de rendu (s'il est activé) par un rendu"""
+    render_pool = get_render_pool()
+    if render_pool is None:
+        return
+    # Un process est créé par tâche soumise tant qu'aucun n'est libre
+    futures = [
+        render_pool.submit(render_ticket_pdf, ticket, articles_data)
+        for _ in range(_render_processes())
+    ]
+    for future in futures:
+        future.result()
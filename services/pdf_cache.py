@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+from typing import BinaryIO
+
+from config import Config
+
+
+class PDFCache:
+    """
+    Cache disque borné des derniers PDFs générés
+
+    Chaque PDF est stocké sous son empreinte de contenu ; pour chaque ticket on
+    conserve l'empreinte du dernier PDF effectivement envoyé dans Zammad.
+    """
+
+    def __init__(self, directory: str, max_files: int = 200):
+        self.directory = directory
+        self.max_files = max_files
+        self._tickets_dir = os.path.join(directory, "tickets")
+        os.makedirs(self._tickets_dir, exist_ok=True)
+
+    def _pdf_path(self, fingerprint: str) -> str:
+        return os.path.join(self.directory, f"{fingerprint}.pdf")
+
+    def _ticket_path(self, ticket_id) -> str:
+        return os.path.join(self._tickets_dir, str(int(ticket_id)))
+
+    def _write_atomic(self, path: str, data: bytes | BinaryIO):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                if isinstance(data, bytes):
+                    tmp_file.write(data)
+                else:
+                    data.seek(0)
+                    shutil.copyfileobj(data, tmp_file)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def last_fingerprint(self, ticket_id) -> str | None:
+        """Empreinte du dernier PDF envoyé pour ce ticket"""
+        try:
+            with open(self._ticket_path(ticket_id), encoding="utf-8") as ticket_file:
+                return ticket_file.read().strip() or None
+        except OSError:
+            return None
+
+    def open(self, fingerprint: str) -> BinaryIO | None:
+        """Ouvre le PDF en cache en lecture, ou renvoie None s'il a été évincé"""
+        try:
+            return open(self._pdf_path(fingerprint), "rb")
+        except OSError:
+            return None
+
+    def store(self, fingerprint: str, pdf_file: BinaryIO):
+        """Enregistre un PDF généré et supprime les plus anciens au-delà du plafond"""
+        self._write_atomic(self._pdf_path(fingerprint), pdf_file)
+        self._evict()
+
+    def remember(self, ticket_id, fingerprint: str):
+        """Marque `fingerprint` comme dernier PDF envoyé pour ce ticket"""
+        self._write_atomic(self._ticket_path(ticket_id), fingerprint.encode())
+
+    def _evict(self):
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith(".pdf"):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                    except OSError:
+                        continue
+        if len(entries) <= self.max_files:
+            return
+        entries.sort()
+        for _, path in entries[: len(entries) - self.max_files]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+def create_pdf_cache() -> PDFCache | None:
+    """Instancie le cache de PDFs si PDF_CACHE_DIR est configuré"""
+    if not Config.PDF_CACHE_DIR:
+        return None
+    return PDFCache(Config.PDF_CACHE_DIR, Config.PDF_CACHE_MAX_FILES)
@@ -0,0 +1,62 @@
+"""
+Profils de sortie des PDFs (PDF_PROFILE)
+
+Le PDF est encodé deux fois en base64 (upload vers Zammad, pièce jointe de
+l'email) : chaque Ko produit en coûte environ 1,33 sur chaque chemin.
+
+- `standard` : sortie par défaut de ReportLab, flux compressés puis encodés
+  en ASCII85 (texte seul, 25 % plus long que le binaire) ;
+- `compact` : flux compressés laissés en binaire, images réduites à 100 dpi
+  au plus et recompressées en qualité 60 au plus.
+
+Dans les deux profils, seules les polices standard PDF (Helvetica, Times,
+Courier) sont utilisées : elles ne sont jamais embarquées. ReportLab écrit
+une seule fois chaque police et chaque image identique, même affichée
+plusieurs fois.
+"""
+
+from reportlab import rl_config
+
+from config import Config
+
+PROFILES = {
+    "standard": {"ascii85": True, "image_dpi": None, "image_quality": None},
+    "compact": {"ascii85": False, "image_dpi": 100, "image_quality": 60},
+}
+
+
+def get_profile() -> dict:
+    """
+    Profil configuré par PDF_PROFILE, réglages des images résolus
+
+    Returns:
+        dict: {"name", "ascii85", "image_dpi", "image_quality"}
+    """
+    name = Config.PDF_PROFILE.strip().lower()
+    if name not in PROFILES:
+        raise ValueError(f"PDF_PROFILE inconnu: {Config.PDF_PROFILE}")
+    profile = PROFILES[name]
+    image_dpi = Config.PDF_IMAGE_DPI
+    image_quality = Config.PDF_IMAGE_QUALITY
+    if profile["image_dpi"]:
+        image_dpi = min(image_dpi, profile["image_dpi"])
+    if profile["image_quality"]:
+        image_quality = min(image_quality, profile["image_quality"])
+    return {
+        "name": name,
+        "ascii85": profile["ascii85"],
+        "image_dpi": image_dpi,
+        "image_quality": image_quality,
+    }
+
+
+def apply_profile() -> dict:
+    """
+    Applique le profil aux réglages de ReportLab, lus à l'écriture du PDF
+
+    Ces réglages sont globaux au process : le profil est le même pour tous
+    les rendus, quel que soit le thread.
+    """
+    profile = get_profile()
+    rl_config.useA85 = int(profile["ascii85"])
+    return profile
@@ -0,0 +1,35 @@
+"""
+Identification des process entre redémarrages
+
+Après un redémarrage, le PID d'un process arrêté peut être repris par un
+process sans rapport (un process du pool de rendu, par exemple). Un process
+est donc identifié par son PID et sa date de démarrage, lue dans /proc sous
+Linux ; ailleurs, seul le PID est comparé.
+"""
+
+import os
+
+
+def pid_alive(pid: int) -> bool:
+    """True si un process de ce PID existe"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def process_start(pid: int) -> str | None:
+    """Date de démarrage du process (Linux), None si elle n'est pas disponible"""
+    try:
+        with open(f"/proc/{pid}/stat", encoding="utf-8") as stat_file:
+            return stat_file.read().rpartition(")")[2].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def process_alive(pid: int, start: str | None) -> bool:
+    """True si le process `pid` existe et a démarré à `start` (PID non réutilisé)"""
+    return pid_alive(pid) and process_start(pid) == start
@@ -0,0 +1,118 @@
+"""
+Démarrage des workers : préchauffage du rendu PDF et mesure du démarrage
+
+ReportLab n'est importé qu'au premier rendu. Le préchauffage rend un PDF
+factice avant d'accepter du trafic : modules, polices, styles et templates
+sont alors chargés. Avec gunicorn --preload (voir gunicorn.conf.py), il a lieu
+une seule fois dans le master et les workers forkés partagent ces pages par
+copie à l'écriture.
+"""
+
+import io
+import os
+import resource
+import time
+
+# Ticket factice : en-tête du template par défaut et messages HTML
+WARM_UP_TICKET = {
+    "id": 0,
+    "number": "0",
+    "title": "Préchauffage",
+    "group": {"name": "BDE"},
+    "created_by": {"firstname": "Zammad", "lastname": "Workflows"},
+    "owner": {"firstname": "Zammad", "lastname": "Workflows"},
+    "created_at": "2025-01-01T08:00:00.000Z",
+    "date_begin": "2025-01-02T08:00:00.000Z",
+    "bde_clubasso_externals": False,
+}
+WARM_UP_ARTICLES = [
+    {
+        "created_at": "2025-01-01T08:00:00.000Z",
+        "from": "Zammad Workflows <zammad@example.org>",
+        "type_id": 10,
+        "content_type": "text/html",
+        "body": "<p>Message de <b>préchauffage</b> du rendu.</p>"
+        "<ul><li>liste</li></ul><blockquote>citation</blockquote>",
+    }
+] * 2
+
+# Champs de /proc/self/smaps_rollup (Linux), en ko
+_SMAPS_FIELDS = ("Rss", "Pss", "Private_Clean", "Private_Dirty")
+
+
+def warm_up(in_process: bool = True, pool: bool = True) -> float:
+    """
+    Rend un PDF factice et renvoie la durée du préchauffage en secondes
+
+    Args:
+        in_process (bool): rend le PDF dans le process courant (imports, polices)
+        pool (bool): démarre aussi les process du pool de rendu
+            (PDF_RENDER_PROCESSES) ; jamais dans un master qui va forker
+    """
+    start = time.perf_counter()
+    # Import différé : c'est lui qui charge ReportLab
+    from services.pdf import (  # pylint: disable=import-outside-toplevel
+        PDFGenerator,
+        warm_up_render_pool,
+    )
+
+    if in_process:
+        PDFGenerator().render(WARM_UP_TICKET, WARM_UP_ARTICLES, io.BytesIO())
+    if pool:
+        warm_up_render_pool(WARM_UP_TICKET, WARM_UP_ARTICLES)
+    return time.perf_counter() - start
+
+
+def process_age() -> float:
+    """Secondes écoulées depuis la création du process (fork ou lancement)"""
+    try:
+        with open("/proc/self/stat", encoding="utf-8") as stat_file:
+            # Le nom du programme peut contenir des espaces : champs après ")"
+            fields = stat_file.read().rpartition(")")[2].split()
+        with open("/proc/uptime", encoding="utf-8") as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return time.monotonic() - _IMPORTED_AT
+
+
+def memory_usage() -> dict[str, int]:
+    """
+    Mémoire du process en octets
+
+    Sous Linux : `rss`, `pss` (pages partagées réparties entre les process) et
+    `private` (pages propres au process, non partagées avec le master). Sinon,
+    seul le pic de `rss` est disponible.
+    """
+    values = {}
+    try:
+        with open("/proc/self/smaps_rollup", encoding="utf-8") as smaps:
+            for line in smaps:
+                name, _, value = line.partition(":")
+                if name in _SMAPS_FIELDS:
+                    values[name] = int(value.split()[0]) * 1024
+        return {
+            "rss": values["Rss"],
+            "pss": values["Pss"],
+            "private": values["Private_Clean"] + values["Private_Dirty"],
+        }
+    except (OSError, KeyError, ValueError):
+        return {"rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+
+def report(role: str, warm_up_seconds: float | None = None):
+    """Affiche le temps de démarrage et la mémoire du process courant"""
+    memory = ", ".join(
+        f"{name} {value / 2**20:.1f} Mo" for name, value in memory_usage().items()
+    )
+    warm_up_text = (
+        "" if warm_up_seconds is None else f", préchauffage {warm_up_seconds:.2f} s"
+    )
+    print(
+        f"[startup] {role} {os.getpid()} prêt en {process_age():.2f} s"
+        f"{warm_up_text} ({memory})",
+        flush=True,
+    )
+
+
+_IMPORTED_AT = time.monotonic()
@@ -0,0 +1,99 @@
+import base64
+import json
+import os
+import tempfile
+from typing import BinaryIO, Iterator
+
+from config import Config
+
+# Multiple de 3 (aucun padding intermédiaire) et de 57 (lignes MIME de 76 caractères)
+_BASE64_CHUNK = 57 * 1024
+
+
+def spooled_file() -> tempfile.SpooledTemporaryFile:
+    """Fichier temporaire gardé en mémoire jusqu'à PDF_SPOOL_MAX_BYTES, puis sur disque"""
+    return tempfile.SpooledTemporaryFile(max_size=Config.PDF_SPOOL_MAX_BYTES)
+
+
+def file_size(file: BinaryIO) -> int:
+    """Taille d'un fichier binaire sans modifier sa position courante"""
+    position = file.tell()
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(position)
+    return size
+
+
+def base64_length(size: int) -> int:
+    return 4 * ((size + 2) // 3)
+
+
+def iter_base64(file: BinaryIO, chunk_size: int = _BASE64_CHUNK) -> Iterator[bytes]:
+    """Encode un fichier en base64 par morceaux, depuis le début du fichier"""
+    file.seek(0)
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            return
+        yield base64.b64encode(chunk)
+
+
+def iter_base64_lines(file: BinaryIO) -> Iterator[bytes]:
+    """Encode un fichier en lignes base64 MIME de 76 caractères terminées par CRLF"""
+    for chunk in iter_base64(file):
+        for start in range(0, len(chunk), 76):
+            yield chunk[start : start + 76] + b"\r\n"
+
+
+class Base64JSONBody:
+    """
+    Corps de requête JSON lu en flux, dont une valeur est un fichier encodé
+    en base64 à la volée
+
+    Seul un morceau encodé est présent en mémoire à la fois ; la taille totale
+    est connue à l'avance pour l'en-tête Content-Length.
+    """
+
+    _PLACEHOLDER = "__BASE64_STREAM__"
+
+    def __init__(self, payload: dict, file: BinaryIO, path: tuple):
+        """
+        Args:
+            payload (dict): Corps JSON à envoyer
+            file (BinaryIO): Fichier à encoder
+            path (tuple): Chemin de la valeur à remplacer, ex. ("attachments", 0, "data")
+        """
+        target = payload
+        for key in path[:-1]:
+            target = target[key]
+        target[path[-1]] = self._PLACEHOLDER
+        prefix, suffix = json.dumps(payload).split(f'"{self._PLACEHOLDER}"')
+
+        self._prefix = (prefix + '"').encode()
+        self._suffix = ('"' + suffix).encode()
+        self._file = file
+        self._length = (
+            len(self._prefix) + base64_length(file_size(file)) + len(self._suffix)
+        )
+        self._chunks = self._iter_chunks()
+        self._pending = b""
+
+    def _iter_chunks(self) -> Iterator[bytes]:
+        yield self._prefix
+        yield from iter_base64(self._file)
+        yield self._suffix
+
+    def __len__(self) -> int:
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._pending) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._pending += chunk
+        if size < 0:
+            data, self._pending = self._pending, b""
+        else:
+            data, self._pending = self._pending[:size], self._pending[size:]
+        return data
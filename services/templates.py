@@ -0,0 +1,331 @@
+"""
+Templates déclaratifs de l'en-tête des PDFs
+
+Chaque fichier JSON de PDF_TEMPLATES_DIR décrit le titre, les lignes et les
+tableaux de champs affichés avant la description et les messages d'un ticket.
+Les templates sont lus et compilés une seule fois, au chargement du module,
+en un plan de rendu : formateurs, styles et gabarits des paragraphes sont
+résolus à l'avance, et le rendu d'un ticket ne fait que lire ses champs.
+
+Format d'un template :
+    {
+      "name": "bde",
+      "default": true,
+      "match": {"group": ["BDE"]},
+      "title": "Ticket #{number}: {title}",
+      "sections": [
+        {"type": "lines", "lines": [
+          {"label": "Club/Asso", "field": "bde_log_clubasso_name", "style": "Heading2"},
+          {"spacer": 6},
+          {"label": "Envoyée le", "field": "created_at", "format": "datetime"}
+        ]},
+        {"type": "table", "title": "Informations", "columns": ["Champ", "Valeur"],
+         "col_widths": [200, 300], "fields": [{"label": "Lieux", "field": "places"}]}
+      ]
+    }
+
+Le template choisi pour un ticket est le premier (par nom de fichier) dont
+tous les critères de `match` correspondent ; à défaut, celui marqué `default`.
+"""
+
+import json
+import os
+import string
+import threading
+from datetime import datetime
+from html import escape
+
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import Paragraph, Spacer, Table, TableStyle
+
+from config import Config
+
+# Styles partagés par tous les rendus (construits une seule fois par process)
+STYLES = getSampleStyleSheet()
+
+BDE_TABLE_STYLE = TableStyle(
+    [
+        # En-tête avec fond bleu et texte blanc
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#1976D2")),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+        ("ALIGN", (0, 0), (-1, 0), "CENTER"),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, 0), 13),
+        # Contenu avec alternance de lignes
+        ("BACKGROUND", (0, 1), (-1, -1), colors.HexColor("#F5F7FA")),
+        (
+            "ROWBACKGROUNDS",
+            (0, 1),
+            (-1, -1),
+            [colors.HexColor("#F5F7FA"), colors.HexColor("#E3E8EE")],
+        ),
+        ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
+        ("FONTSIZE", (0, 1), (-1, -1), 11),
+        # Bordures fines et arrondies
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.HexColor("#B0BEC5")),
+        ("BOX", (0, 0), (-1, -1), 1, colors.HexColor("#1976D2")),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("LEFTPADDING", (0, 0), (-1, -1), 8),
+        ("RIGHTPADDING", (0, 0), (-1, -1), 8),
+        ("TOPPADDING", (0, 0), (-1, -1), 6),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), 6),
+    ]
+)
+# Les commandes sont figées : Table.setStyle() les copie sans les modifier
+BDE_TABLE_STYLE._cmds = tuple(BDE_TABLE_STYLE._cmds)  # pylint: disable=protected-access
+
+# Styles de tableau utilisables par les templates ("table_style")
+TABLE_STYLES = {"bde": BDE_TABLE_STYLE}
+
+
+def format_date(value) -> str:
+    """Formate une date ISO en format lisible"""
+    try:
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ").strftime(
+            "%d/%m/%Y %H:%M"
+        )
+    except (TypeError, ValueError):
+        return value
+
+
+def format_value(value) -> str:
+    """Formate une valeur pour l'affichage dans le PDF"""
+    if value is None or value == "":
+        return "Non défini"
+    elif value is False:
+        return "Non"
+    elif value is True:
+        return "Oui"
+    elif isinstance(value, str) and value.endswith(":00:00.000Z"):
+        return format_date(value)
+    return str(value)
+
+
+def _format_person(value) -> str:
+    person = value if isinstance(value, dict) else {}
+    return (
+        f"{format_value(person.get('firstname'))} "
+        f"{format_value(person.get('lastname'))}"
+    )
+
+
+def _format_name(value) -> str:
+    if isinstance(value, dict):
+        value = value.get("name")
+    return format_value(value)
+
+
+# Formateurs disponibles dans les templates ("format")
+FORMATTERS = {
+    "auto": format_value,
+    "raw": lambda value: "N/A" if value is None else str(value),
+    "datetime": lambda value: format_date(format_value(value)),
+    "person": _format_person,
+    "name": _format_name,
+}
+
+
+class TemplatePlan:
+    """
+    Template compilé
+
+    `fields` liste les champs lus et leur formateur ; `values()` en déduit les
+    valeurs affichées (aussi utilisées pour l'empreinte du PDF) et
+    `flowables()` produit l'en-tête à partir de ces valeurs.
+    """
+
+    def __init__(self, name: str, match: dict, default: bool = False):
+        self.name = name
+        self.match = match
+        self.default = default
+        self.fields: list[tuple[str, callable]] = []
+        # ("paragraph", style, gabarit, index) | ("spacer", hauteur)
+        # | ("table", en-tête, libellés, index, largeurs, style)
+        self.steps: list[tuple] = []
+
+    def add_field(self, field: str, format_name: str) -> int:
+        """Ajoute un champ lu par le plan et renvoie son index dans `values()`"""
+        if format_name not in FORMATTERS:
+            raise ValueError(f"formateur inconnu : {format_name}")
+        self.fields.append((field, FORMATTERS[format_name]))
+        return len(self.fields) - 1
+
+    def values(self, ticket: dict) -> list[str]:
+        """Valeurs affichées pour ce ticket, dans l'ordre de `fields`"""
+        return [formatter(ticket.get(field)) for field, formatter in self.fields]
+
+    def flowables(self, values: list[str]) -> list:
+        """Flowables de l'en-tête à partir des valeurs de `values()`"""
+        elements = []
+        for step in self.steps:
+            kind = step[0]
+            if kind == "paragraph":
+                _, style, template, indexes = step
+                markup = template.format(*(escape(values[i]) for i in indexes))
+                elements.append(Paragraph(markup, style))
+            elif kind == "spacer":
+                elements.append(Spacer(1, step[1]))
+            else:
+                _, header, labels, indexes, col_widths, table_style = step
+                rows = [header]
+                rows.extend(
+                    [label, values[index]] for label, index in zip(labels, indexes)
+                )
+                table = Table(rows, colWidths=col_widths)
+                table.setStyle(table_style)
+                elements.append(table)
+        return elements
+
+    def matches(self, ticket: dict) -> bool:
+        return bool(self.match) and all(
+            _match_value(ticket.get(field)) in accepted
+            for field, accepted in self.match.items()
+        )
+
+
+def _match_value(value) -> str | None:
+    """Valeur comparée aux critères `match` (objet Zammad -> son nom)"""
+    if isinstance(value, dict):
+        value = value.get("name")
+    return None if value is None else str(value)
+
+
+def _style(name: str):
+    try:
+        return STYLES[name]
+    except KeyError as e:
+        raise ValueError(f"style inconnu : {name}") from e
+
+
+def _literal(text: str) -> str:
+    """Texte fixe d'un gabarit de paragraphe (échappé pour ReportLab et format())"""
+    return escape(text).replace("{", "{{").replace("}", "}}")
+
+
+def compile_template(definition: dict) -> TemplatePlan:
+    """
+    Compile la définition JSON d'un template
+
+    Raises:
+        ValueError: si la définition est invalide
+    """
+    match = {
+        field: {str(value) for value in accepted}
+        for field, accepted in definition.get("match", {}).items()
+    }
+    plan = TemplatePlan(definition["name"], match, bool(definition.get("default")))
+
+    title = definition.get("title")
+    if title:
+        template, indexes = [], []
+        for literal, field, format_spec, _ in string.Formatter().parse(title):
+            template.append(_literal(literal))
+            if field:
+                template.append(f"{{{len(indexes)}}}")
+                indexes.append(plan.add_field(field, format_spec or "raw"))
+        plan.steps.append(("paragraph", _style("Title"), "".join(template), indexes))
+        plan.steps.append(("spacer", 6))
+
+    for section in definition.get("sections", []):
+        kind = section.get("type")
+        if kind == "lines":
+            for line in section["lines"]:
+                if "spacer" in line:
+                    plan.steps.append(("spacer", line["spacer"]))
+                    continue
+                index = plan.add_field(line["field"], line.get("format", "auto"))
+                label = _literal(line["label"])
+                plan.steps.append(
+                    (
+                        "paragraph",
+                        _style(line.get("style", "Normal")),
+                        f"{label}: {{0}}",
+                        [index],
+                    )
+                )
+        elif kind == "table":
+            if section.get("title"):
+                plan.steps.append(
+                    ("paragraph", _style("Heading2"), _literal(section["title"]), [])
+                )
+                plan.steps.append(("spacer", 6))
+            table_style = section.get("table_style", "bde")
+            if table_style not in TABLE_STYLES:
+                raise ValueError(f"style de tableau inconnu : {table_style}")
+            fields = section["fields"]
+            plan.steps.append(
+                (
+                    "table",
+                    list(section.get("columns", ["Champ", "Valeur"])),
+                    [field["label"] for field in fields],
+                    [
+                        plan.add_field(field["field"], field.get("format", "auto"))
+                        for field in fields
+                    ],
+                    section.get("col_widths"),
+                    TABLE_STYLES[table_style],
+                )
+            )
+        else:
+            raise ValueError(f"type de section inconnu : {kind}")
+        plan.steps.append(("spacer", section.get("space_after", 12)))
+    return plan
+
+
+class TemplateRegistry:
+    """Templates compilés et choix du template d'un ticket (mis en cache)"""
+
+    def __init__(self, plans: list[TemplatePlan]):
+        if not plans:
+            raise ValueError("aucun template PDF")
+        self.plans = plans
+        self.default = next((plan for plan in plans if plan.default), plans[0])
+        # Champs examinés pour choisir un template : clé du cache de sélection
+        self.match_fields = sorted({field for plan in plans for field in plan.match})
+        self._selected: dict[tuple, TemplatePlan] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, directory: str) -> "TemplateRegistry":
+        """
+        Charge et compile les templates `*.json` d'un répertoire
+
+        Raises:
+            ValueError: si un template est illisible ou invalide
+        """
+        plans = []
+        try:
+            filenames = sorted(os.listdir(directory))
+        except OSError as e:
+            raise ValueError(f"Templates PDF introuvables: {e}") from e
+        for filename in filenames:
+            if not filename.endswith(".json"):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                with open(path, encoding="utf-8") as template_file:
+                    definition = json.load(template_file)
+                definition.setdefault("name", filename.removesuffix(".json"))
+                plans.append(compile_template(definition))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"Template PDF invalide {path}: {e}") from e
+        return cls(plans)
+
+    def select(self, ticket: dict) -> TemplatePlan:
+        """Template à utiliser pour ce ticket (groupe, type...)"""
+        key = tuple(_match_value(ticket.get(field)) for field in self.match_fields)
+        plan = self._selected.get(key)
+        if plan is None:
+            plan = next(
+                (plan for plan in self.plans if plan.matches(ticket)), self.default
+            )
+            with self._lock:
+                # Borné : les valeurs possibles viennent des groupes et types Zammad
+                if len(self._selected) > 1000:
+                    self._selected.clear()
+                self._selected[key] = plan
+        return plan
+
+
+templates = TemplateRegistry.load(Config.PDF_TEMPLATES_DIR)
@@ -0,0 +1,43 @@
+"""
+Tri des webhooks Zammad avant le parsing JSON
+
+Zammad envoie un webhook à chaque mise à jour de ticket ; la plupart n'ont pas
+`pdf_generation` activé. Le corps brut est parcouru par une expression
+régulière pour écarter ces événements sans construire l'objet JSON.
+"""
+
+import json
+import re
+
+# Valeur JSON d'un champ pdf_generation (une clé entre guillemets ne peut pas
+# apparaître telle quelle dans une chaîne JSON, où les guillemets sont échappés)
+_PDF_GENERATION = re.compile(
+    rb'"pdf_generation"\s*:\s*("(?:[^"\\]|\\.)*"|true|false|null)'
+)
+
+# Valeurs pour lesquelles aucun PDF n'est demandé
+_NOT_REQUESTED = (None, "", "false", False)
+
+
+def generation_requested(value) -> bool:
+    """True si la valeur de `pdf_generation` demande un PDF (`true`, `email`...)"""
+    return value not in _NOT_REQUESTED
+
+
+def may_request_generation(body: bytes) -> bool:
+    """
+    Examine le corps brut d'un webhook sans le parser entièrement
+
+    Returns:
+        bool: False si aucun champ `pdf_generation` ne demande de PDF ; le
+        webhook peut alors être ignoré. True n'est qu'une présomption, la
+        valeur du ticket est vérifiée après parsing.
+    """
+    for match in _PDF_GENERATION.finditer(body):
+        try:
+            value = json.loads(match.group(1))
+        except ValueError:
+            return True
+        if generation_requested(value):
+            return True
+    return False
@@ -1,30 +1,113 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.util.retry import Retry
 from config import Config
+from services import metrics
+from services.cache import ArticleCache, create_article_cache
+from services.streams import Base64JSONBody
+
+
+def _connection_error(error: requests.RequestException) -> dict:
+    """
+    Réponse d'erreur d'une requête qui n'a pas abouti
+
+    `not_sent` indique que la connexion n'a pas pu être établie : Zammad n'a
+    pas reçu la requête, qui peut être renvoyée sans risque de doublon.
+    """
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    not_sent = isinstance(error, requests.ConnectTimeout) or (
+        isinstance(error, requests.ConnectionError)
+        and isinstance(reason, ConnectTimeoutError)
+    )
+    return {"error": f"Erreur de connexion: {str(error)}", "not_sent": not_sent}
 
 
 class ZammadService:
     """Service pour interagir avec l'API Zammad"""
 
-    def __init__(self):
+    def __init__(self, article_cache: ArticleCache | None = None):
         self.api_url = Config.ZAMMAD_API_URL
         self.api_token = Config.ZAMMAD_API_TOKEN
         self.headers = {
             "Authorization": f"Token token={self.api_token}",
             "Content-Type": "application/json",
         }
+        self.fetch_concurrency = max(1, Config.ZAMMAD_FETCH_CONCURRENCY)
+        # Passe à False si l'instance Zammad ne connaît pas l'endpoint groupé
+        self._bulk_articles_supported = True
+        self.article_cache = article_cache or create_article_cache()
+        self.session = self._create_session()
+        # Utilisateurs déjà lus (nom du demandeur et du responsable)
+        self._users: dict[int, dict] = {}
+        self._stats_lock = threading.Lock()
+        self.stats: dict[str, dict] = {}
 
-    def _create_article_with_attachment(
-        self, ticket_id, subject, body, filename, pdf_base64
-    ):
+    def _create_session(self) -> requests.Session:
+        """Crée une session HTTP avec pool de connexions keep-alive et retries"""
+        retry = Retry(
+            total=Config.ZAMMAD_RETRIES,
+            backoff_factor=Config.ZAMMAD_RETRY_BACKOFF,
+            status_forcelist=[429, 500, 502, 503, 504],
+            # Seules les lectures sont rejouées sur erreur de statut/lecture ; les
+            # écritures sont réessayées par l'ordonnanceur (services/outbound.py)
+            allowed_methods=["GET"],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=Config.ZAMMAD_POOL_CONNECTIONS,
+            pool_maxsize=Config.ZAMMAD_POOL_SIZE,
+            pool_block=True,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.headers.update(self.headers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _request(self, name: str, method: str, path: str, **kwargs):
+        """Exécute une requête via la session et enregistre sa latence"""
+        start = time.perf_counter()
+        failed = True
+        try:
+            response = self.session.request(
+                method, f"{self.api_url}{path}", timeout=30, **kwargs
+            )
+            failed = response.status_code >= 400
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.ZAMMAD_REQUEST_SECONDS.observe(elapsed, call=name)
+            if failed:
+                metrics.ZAMMAD_REQUEST_ERRORS.inc(call=name)
+            with self._stats_lock:
+                stat = self.stats.setdefault(
+                    name,
+                    {"calls": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0},
+                )
+                stat["calls"] += 1
+                stat["errors"] += int(failed)
+                stat["total_seconds"] += elapsed
+                stat["max_seconds"] = max(stat["max_seconds"], elapsed)
+
+    def _create_article_with_attachment(self, ticket_id, subject, body, filename, pdf):
         """
         Crée un nouvel article dans un ticket avec une pièce jointe PDF
 
+        Si `pdf` est un fichier binaire, il est encodé en base64 à la volée et
+        le corps JSON est envoyé en flux, sans copie complète en mémoire.
+
         Args:
             ticket_id (int): ID du ticket Zammad
             subject (str): Sujet de l'article
             body (str): Corps de l'article
             filename (str): Nom du fichier PDF
-            pdf_base64 (str): Contenu PDF encodé en base64
+            pdf (str | BinaryIO): PDF encodé en base64, ou fichier binaire du PDF
 
         Returns:
             tuple: (success: bool, response_data: dict)
@@ -38,21 +121,31 @@ class ZammadService:
             "attachments": [
                 {
                     "filename": filename,
-                    "data": pdf_base64,
+                    "data": pdf if isinstance(pdf, str) else "",
                     "mime-type": "application/pdf",
                 }
             ],
         }
 
         try:
-            response = requests.post(
-                f"{self.api_url}/ticket_articles",
-                json=payload,
-                headers=self.headers,
-                timeout=30,
-            )
+            if isinstance(pdf, str):
+                uploaded = len(pdf)
+                response = self._request(
+                    "create_article", "POST", "/ticket_articles", json=payload
+                )
+            else:
+                stream = Base64JSONBody(payload, pdf, ("attachments", 0, "data"))
+                uploaded = len(stream)
+                response = self._request(
+                    "create_article",
+                    "POST",
+                    "/ticket_articles",
+                    data=stream,
+                    headers={"Content-Length": str(len(stream))},
+                )
 
             if response.status_code in [200, 201]:
+                metrics.UPLOADED_BYTES.inc(uploaded)
                 return True, {
                     "message": "PDF envoyé dans Zammad",
                     "response": response.json(),
@@ -64,16 +157,16 @@ class ZammadService:
                 }
 
         except requests.RequestException as e:
-            return False, {"error": f"Erreur de connexion: {str(e)}"}
+            return False, _connection_error(e)
 
-    def send_ticket_pdf(self, ticket_number, ticket_id, pdf_base64):
+    def send_ticket_pdf(self, ticket_number, ticket_id, pdf):
         """
         Méthode de convenance pour envoyer un PDF de ticket
 
         Args:
             ticket_number (str): Numéro du ticket
             ticket_id (int): ID du ticket
-            pdf_base64 (str): PDF encodé en base64
+            pdf (str | BinaryIO): PDF encodé en base64, ou fichier binaire du PDF
 
         Returns:
             tuple: (success: bool, response_data: dict)
@@ -83,18 +176,18 @@ class ZammadService:
         filename = f"ticket_{ticket_number}.pdf"
 
         return self._create_article_with_attachment(
-            ticket_id, subject, body, filename, pdf_base64
+            ticket_id, subject, body, filename, pdf
         )
 
     def set_ticket_generation_false(self, ticket_id):
         payload = {"pdf_generation": "false"}
 
         try:
-            response = requests.put(
-                f"{self.api_url}/tickets/{ticket_id}",
+            response = self._request(
+                "set_ticket_generation_false",
+                "PUT",
+                f"/tickets/{ticket_id}",
                 json=payload,
-                headers=self.headers,
-                timeout=30,
             )
 
             if response.status_code in [200, 201]:
@@ -109,15 +202,70 @@ class ZammadService:
                 }
 
         except requests.RequestException as e:
-            return False, {"error": f"Erreur de connexion: {str(e)}"}
+            return False, _connection_error(e)
 
     def get_article_by_id(self, article_id: int):
+        cached = self.article_cache.get(article_id)
+        if cached is not None:
+            return cached
 
         try:
-            response = requests.get(
-                f"{self.api_url}/ticket_articles/{article_id}",
-                headers=self.headers,
-                timeout=30,
+            response = self._request(
+                "get_article", "GET", f"/ticket_articles/{article_id}"
+            )
+
+            if response.status_code in [200, 201]:
+                article = response.json()
+                self.article_cache.set(article)
+                return article
+            else:
+                return {
+                    "error": response.text,
+                    "status_code": response.status_code,
+                }
+
+        except requests.RequestException as e:
+            return {"error": f"Erreur de connexion: {str(e)}"}
+
+    def get_attachment(
+        self, ticket_id: int, article_id: int, attachment_id: int, max_bytes: int = 0
+    ):
+        """
+        Télécharge une pièce jointe d'article (lue en flux, bornée à `max_bytes`)
+
+        Returns:
+            tuple: (success: bool, content: bytes | response_data: dict)
+        """
+        try:
+            response = self._request(
+                "get_attachment",
+                "GET",
+                f"/ticket_attachment/{ticket_id}/{article_id}/{attachment_id}",
+                stream=True,
+            )
+            with response:
+                if response.status_code != 200:
+                    return False, {
+                        "error": response.text,
+                        "status_code": response.status_code,
+                    }
+                content = bytearray()
+                for chunk in response.iter_content(chunk_size=65536):
+                    content += chunk
+                    if max_bytes and len(content) > max_bytes:
+                        return False, {
+                            "error": f"Pièce jointe de plus de {max_bytes} octets"
+                        }
+                return True, bytes(content)
+
+        except requests.RequestException as e:
+            return False, {"error": f"Erreur de connexion: {str(e)}"}
+
+    def get_ticket(self, ticket_id: int):
+        """Récupère un ticket (champs BDE inclus, références développées)"""
+        try:
+            response = self._request(
+                "get_ticket", "GET", f"/tickets/{ticket_id}", params={"expand": "true"}
             )
 
             if response.status_code in [200, 201]:
@@ -130,3 +278,164 @@ class ZammadService:
 
         except requests.RequestException as e:
             return {"error": f"Erreur de connexion: {str(e)}"}
+
+    def search_tickets(self, query: str, limit: int = 100):
+        """
+        Recherche des tickets (syntaxe de recherche Zammad)
+
+        Args:
+            query (str): Requête, par exemple `state.name:closed AND group.name:BDE`
+            limit (int): Nombre maximal de tickets renvoyés
+
+        Returns:
+            tuple: (success: bool, tickets: list[dict] | response_data: dict)
+        """
+        tickets = []
+        seen = set()
+        page = 1
+        per_page = min(limit, 100)
+        try:
+            while len(tickets) < limit:
+                response = self._request(
+                    "search_tickets",
+                    "GET",
+                    "/tickets/search",
+                    params={
+                        "query": query,
+                        "limit": per_page,
+                        "page": page,
+                        "expand": "true",
+                    },
+                )
+                if response.status_code not in [200, 201]:
+                    return False, {
+                        "error": response.text,
+                        "status_code": response.status_code,
+                    }
+
+                data = response.json()
+                if isinstance(data, dict):
+                    # Réponse non développée : IDs + assets
+                    assets = data.get("assets", {}).get("Ticket", {})
+                    data = [
+                        assets.get(str(ticket_id), {"id": ticket_id})
+                        for ticket_id in data.get("tickets", [])
+                    ]
+                new_tickets = [ticket for ticket in data if ticket["id"] not in seen]
+                seen.update(ticket["id"] for ticket in new_tickets)
+                tickets.extend(new_tickets)
+                # Page incomplète, ou pagination ignorée par le serveur
+                if len(data) < per_page or not new_tickets:
+                    break
+                page += 1
+        except requests.RequestException as e:
+            return False, {"error": f"Erreur de connexion: {str(e)}"}
+
+        return True, tickets[:limit]
+
+    def get_user(self, user_id: int):
+        """Récupère un utilisateur, gardé en mémoire pour les appels suivants"""
+        if user_id in self._users:
+            return self._users[user_id]
+
+        try:
+            response = self._request("get_user", "GET", f"/users/{user_id}")
+        except requests.RequestException as e:
+            return {"error": f"Erreur de connexion: {str(e)}"}
+
+        if response.status_code not in [200, 201]:
+            return {"error": response.text, "status_code": response.status_code}
+        user = response.json()
+        self._users[user_id] = {
+            "firstname": user.get("firstname", ""),
+            "lastname": user.get("lastname", ""),
+        }
+        return self._users[user_id]
+
+    def as_webhook_ticket(self, ticket: dict) -> dict:
+        """
+        Complète un ticket de l'API REST pour qu'il ait la forme du webhook
+
+        Le webhook envoie `owner` et `created_by` sous forme d'objets ; l'API
+        REST ne donne que leurs IDs (et le login avec `expand`).
+        """
+        ticket = dict(ticket)
+        for field in ("owner", "created_by"):
+            if isinstance(ticket.get(field), dict):
+                continue
+            user_id = ticket.get(f"{field}_id")
+            user = self.get_user(user_id) if user_id else {}
+            ticket[field] = {} if "error" in user else user
+        return ticket
+
+    def _get_articles_by_ticket(self, ticket_id: int):
+        """
+        Récupère tous les articles d'un ticket en une seule requête
+
+        Returns:
+            list | None: Articles, ou None si l'endpoint groupé est indisponible
+        """
+        if not self._bulk_articles_supported:
+            return None
+
+        try:
+            response = self._request(
+                "get_ticket_articles", "GET", f"/ticket_articles/by_ticket/{ticket_id}"
+            )
+        except requests.RequestException:
+            return None
+
+        if response.status_code in [200, 201]:
+            return response.json()
+        if response.status_code in [404, 405, 501]:
+            self._bulk_articles_supported = False
+        return None
+
+    def get_ticket_articles(self, ticket_id: int, article_ids: list[int]):
+        """
+        Récupère les articles d'un ticket triés par date de création
+
+        Les articles déjà en cache ne sont pas redemandés. Les articles
+        manquants sont récupérés en parallèle (concurrence bornée par
+        ZAMMAD_FETCH_CONCURRENCY) s'ils tiennent en une vague de requêtes, sinon
+        via l'endpoint groupé `/ticket_articles/by_ticket/{ticket_id}`.
+
+        Args:
+            ticket_id (int): ID du ticket Zammad
+            article_ids (list[int]): IDs des articles attendus
+
+        Returns:
+            list[dict]: Articles triés par `created_at`
+        """
+        articles = []
+        missing_ids = []
+        for article_id in article_ids:
+            cached = self.article_cache.get(article_id)
+            if cached is not None:
+                articles.append(cached)
+            else:
+                missing_ids.append(article_id)
+
+        fetched = None
+        if not article_ids or len(missing_ids) > self.fetch_concurrency:
+            fetched = self._get_articles_by_ticket(ticket_id)
+            if fetched is not None:
+                for article in fetched:
+                    self.article_cache.set(article)
+                if article_ids:
+                    wanted = set(missing_ids)
+                    fetched = [
+                        article for article in fetched if article.get("id") in wanted
+                    ]
+
+        if fetched is None and missing_ids:
+            workers = min(self.fetch_concurrency, len(missing_ids))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                fetched = list(executor.map(self.get_article_by_id, missing_ids))
+
+        articles.extend(fetched or [])
+        articles = [
+            article for article in articles if article and "error" not in article
+        ]
+        articles.sort(key=lambda x: x.get("created_at", ""))
+        return articles
@@ -0,0 +1,45 @@
+"""Authentification du webhook : signature X-Hub-Signature"""
+
+import hashlib
+import hmac
+
+import pytest
+
+from auth import verify_signature
+from config import Config
+
+BODY = b'{"ticket": {"id": 1}}'
+
+
+@pytest.fixture(autouse=True)
+def signature_secret(monkeypatch):
+    monkeypatch.setattr(Config, "WEBHOOK_SIGNATURE_SECRETS", "secret")
+
+
+def test_valid_signature():
+    digest = hmac.new(b"secret", BODY, hashlib.sha1).hexdigest()
+    assert verify_signature(BODY, f"sha1={digest}")
+
+
+def test_wrong_signature():
+    assert not verify_signature(BODY, "sha1=" + "0" * 40)
+
+
+@pytest.mark.parametrize("header", ["sha1=é", "sha256=ﬁ" + "0" * 63])
+def test_non_ascii_signature_is_invalid(header):
+    assert not verify_signature(BODY, header)
+
+
+def test_non_ascii_signature_gets_401(monkeypatch):
+    monkeypatch.setattr(Config, "WEBHOOK_USERNAME", "user")
+    monkeypatch.setattr(Config, "WEBHOOK_PASSWORD", "password")
+    from server import app  # pylint: disable=import-outside-toplevel
+
+    response = app.test_client().post(
+        "/webhook",
+        data=BODY,
+        content_type="application/json",
+        auth=("user", "password"),
+        headers={"X-Hub-Signature": "sha1=é".encode("utf-8").decode("latin-1")},
+    )
+    assert response.status_code == 401
@@ -0,0 +1,50 @@
+"""Cache d'articles SQLite : plafonds en entrées et en taille"""
+
+import json
+import sqlite3
+
+from services.cache import SQLiteArticleCache
+
+
+def article(article_id: int, size: int = 100) -> dict:
+    return {"id": article_id, "updated_at": "t", "body": "x" * size}
+
+
+def test_max_bytes(tmp_path):
+    payload = len(json.dumps(article(0)))
+    cache = SQLiteArticleCache(str(tmp_path / "c.sqlite3"), 100, payload * 3, 60)
+    for article_id in range(5):
+        cache.set(article(article_id))
+    assert cache.get(0) is None and cache.get(1) is None
+    assert [cache.get(i)["id"] for i in (2, 3, 4)] == [2, 3, 4]
+    assert cache.stats["evictions"] == 2
+    # Plus gros que le plafond : jamais stocké
+    cache.set(article(9, payload * 3))
+    assert cache.get(9) is None
+
+
+def test_max_entries_keeps_recently_read(tmp_path):
+    cache = SQLiteArticleCache(str(tmp_path / "c.sqlite3"), 2, 10**6, 60)
+    cache.set(article(1))
+    cache.set(article(2))
+    assert cache.get(1) is not None
+    cache.set(article(3))
+    assert cache.get(2) is None
+    assert cache.get(1) is not None and cache.get(3) is not None
+
+
+def test_legacy_file_gets_sizes(tmp_path):
+    path = str(tmp_path / "c.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE articles (article_id INTEGER PRIMARY KEY,"
+        " expires_at REAL NOT NULL, accessed_at REAL NOT NULL, payload TEXT NOT NULL)"
+    )
+    conn.execute(
+        "INSERT INTO articles VALUES (1, 1e12, 0, ?)", (json.dumps(article(1, 500)),)
+    )
+    conn.commit()
+    conn.close()
+    cache = SQLiteArticleCache(path, 100, 400, 60)
+    cache.set(article(2))
+    assert cache.get(1) is None and cache.get(2) is not None
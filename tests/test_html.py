@@ -0,0 +1,22 @@
+"""Conversion HTML : mention des images insérées"""
+
+import pytest
+
+from config import Config
+from services.html import html_to_paragraphs
+
+BODY = (
+    '<p>Capture :<img src="/api/v1/ticket_attachment/1/2/3?view=inline" alt="écran">'
+    '<img src="cid:logo@x" alt="logo">'
+    '<img src="https://example.com/a.png" alt="externe"></p>'
+)
+
+
+@pytest.mark.parametrize("enabled", [True, False])
+def test_attached_images_not_duplicated(monkeypatch, enabled):
+    monkeypatch.setattr(Config, "PDF_IMAGES", enabled)
+    (paragraph,) = html_to_paragraphs(BODY)
+    assert ("[image : écran]" in paragraph) is not enabled
+    assert ("[image : logo]" in paragraph) is not enabled
+    # Image externe : jamais téléchargée, la mention reste
+    assert "[image : externe]" in paragraph
@@ -0,0 +1,51 @@
+"""Rendu des PDFs : limite de pages (PDF_MAX_PAGES)"""
+
+import io
+import re
+
+import pytest
+
+from config import Config
+from services.pdf import PDFGenerator
+from services.startup import WARM_UP_TICKET
+
+
+def _articles(count: int, body: str) -> list[dict]:
+    return [
+        {
+            "created_at": "2025-01-01T08:00:00.000Z",
+            "from": "Client <client@example.org>",
+            "type_id": 10,
+            "content_type": "text/html",
+            "body": body,
+        }
+        for _ in range(count)
+    ]
+
+
+def _page_count(pdf: bytes) -> int:
+    return len(re.findall(rb"/Type /Page\b(?!s)", pdf))
+
+
+@pytest.mark.parametrize(
+    "articles",
+    [
+        _articles(200, "<p>Message court</p>"),
+        _articles(40, "<p>ligne</p>" * 30),
+        _articles(60, "<p>" + "texte long " * 300 + "</p>"),
+    ],
+    ids=["courts", "paragraphes", "longs"],
+)
+@pytest.mark.parametrize("max_pages", [1, 2, 5])
+def test_page_count_equals_limit(monkeypatch, articles, max_pages):
+    monkeypatch.setattr(Config, "PDF_MAX_PAGES", max_pages)
+    output = io.BytesIO()
+    PDFGenerator().render(WARM_UP_TICKET, articles, output)
+    assert _page_count(output.getvalue()) == max_pages
+
+
+def test_short_ticket_is_not_capped(monkeypatch):
+    monkeypatch.setattr(Config, "PDF_MAX_PAGES", 5)
+    output = io.BytesIO()
+    PDFGenerator().render(WARM_UP_TICKET, _articles(3, "<p>Bonjour</p>"), output)
+    assert _page_count(output.getvalue()) == 1
@@ -1,5 +1,10 @@
+from config import Config
 from server import app as application  # pylint: disable=unused-import
 
+# La configuration est vérifiée au chargement de l'application (une seule fois
+# dans le master avec gunicorn --preload) : une erreur empêche le démarrage.
+Config.validate()
+
 # Optional: you can place WSGI middleware or other initialisation here.
-# Example for gunicorn:
+# Example for gunicorn (gunicorn.conf.py est lu depuis le répertoire courant) :
 #   gunicorn --workers 4 --bind 0.0.0.0:8080 wsgi:application